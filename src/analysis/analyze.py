@@ -4,6 +4,7 @@ from os import path
 
 import arg_parser
 import context
+from helpers import sweep
 from helpers.subprocess_wrappers import check_call
 
 
@@ -14,19 +15,28 @@ def main():
     plot = path.join(analysis_dir, 'plot.py')
     report = path.join(analysis_dir, 'report.py')
 
-    plot_cmd = ['python', plot]
-    report_cmd = ['python', report]
+    # analyze every cell of a sweep tested in the data directory on its own
+    data_dirs = sweep.load_cells(args.data_dir) or [args.data_dir]
 
-    for cmd in [plot_cmd, report_cmd]:
-        if args.data_dir:
-            cmd += ['--data-dir', args.data_dir]
-        if args.schemes:
-            cmd += ['--schemes', args.schemes]
-        if args.include_acklink:
-            cmd += ['--include-acklink']
+    for data_dir in data_dirs:
+        plot_cmd = ['python', plot]
+        report_cmd = ['python', report]
 
-    check_call(plot_cmd)
-    check_call(report_cmd)
+        for cmd in [plot_cmd, report_cmd]:
+            if data_dir:
+                cmd += ['--data-dir', data_dir]
+            if args.schemes:
+                cmd += ['--schemes', args.schemes]
+            if args.include_acklink:
+                cmd += ['--include-acklink']
+
+        if args.no_cache:
+            plot_cmd += ['--no-cache']
+        if args.jobs is not None:
+            plot_cmd += ['--jobs', str(args.jobs)]
+
+        check_call(plot_cmd)
+        check_call(report_cmd)
 
 
 if __name__ == '__main__':
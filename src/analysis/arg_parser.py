@@ -1,6 +1,7 @@
 import sys
 from os import path
 import argparse
+import multiprocessing
 
 import context
 from helpers import utils
@@ -15,6 +16,23 @@ def verify_schemes(schemes):
             sys.exit('%s is not a scheme included in src/config.yml' % cc)
 
 
+def parse_percentiles(percentiles):
+    # parse a space-separated list of percentiles between 0 and 100
+    if percentiles is None:
+        return []
+
+    try:
+        percentiles = [float(q) for q in percentiles.split()]
+    except ValueError:
+        sys.exit('--delay-percentiles must be a list of numbers')
+
+    for q in percentiles:
+        if not 0 <= q <= 100:
+            sys.exit('--delay-percentiles must be between 0 and 100')
+
+    return percentiles
+
+
 def parse_tunnel_graph():
     parser = argparse.ArgumentParser(
         description='evaluate throughput and delay of a tunnel log and '
@@ -33,8 +51,31 @@ def parse_tunnel_graph():
     parser.add_argument(
         '--ms-per-bin', metavar='MS-PER-BIN', type=int, default=500,
         help='bin size in ms (default 500)')
+    parser.add_argument(
+        '--delay-sketch', action='store_true',
+        help='estimate delay percentiles in constant memory (within 1%% '
+        'relative error) instead of keeping all per-packet delays; cannot be '
+        'used with --delay')
+    parser.add_argument(
+        '--delay-percentiles', metavar='"P1 P2..."',
+        help='space-separated list of other percentiles of per-packet '
+        'delays to report besides the 95th, e.g., "50 99"')
+    parser.add_argument(
+        '--jobs', metavar='N', type=int, default=multiprocessing.cpu_count(),
+        help='number of processes to parse a large tunnel log with '
+        '(default number of CPUs)')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always parse tunnel logs instead of reusing results cached '
+        'next to unchanged logs')
 
     args = parser.parse_args()
+    args.delay_percentiles = parse_percentiles(args.delay_percentiles)
+    if args.delay_sketch and args.delay_graph:
+        sys.exit('--delay-sketch cannot be used with --delay')
+    if args.jobs < 1:
+        sys.exit('--jobs must be positive')
+
     return args
 
 
@@ -60,10 +101,33 @@ def parse_plot():
     parser.add_argument(
         '--no-graphs', action='store_true', help='only append datalink '
         'statistics to stats files with no graphs generated')
+    parser.add_argument(
+        '--jobs', metavar='N', type=int, default=multiprocessing.cpu_count(),
+        help='number of processes to analyze tunnel logs with '
+        '(default number of CPUs)')
+    parser.add_argument(
+        '--delay-sketch', action='store_true',
+        help='with --no-graphs, estimate delay percentiles in constant '
+        'memory (within 1%% relative error) instead of keeping all '
+        'per-packet delays')
+    parser.add_argument(
+        '--delay-percentiles', metavar='"P1 P2..."',
+        help='space-separated list of other percentiles of per-packet '
+        'delays to report besides the 95th, e.g., "50 99"; estimated in '
+        'constant memory with --delay-sketch')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always parse tunnel logs instead of reusing results cached '
+        'next to unchanged logs')
 
     args = parser.parse_args()
     if args.schemes is not None:
         verify_schemes(args.schemes)
+    args.delay_percentiles = parse_percentiles(args.delay_percentiles)
+    if args.delay_sketch and not args.no_graphs:
+        sys.exit('--delay-sketch requires --no-graphs')
+    if args.jobs < 1:
+        sys.exit('--jobs must be positive')
 
     return args
 
@@ -90,6 +154,14 @@ def parse_analyze():
     parse_analyze_shared(parser)
     parser.add_argument('--include-acklink', action='store_true',
                         help='include acklink analysis')
+    parser.add_argument(
+        '--jobs', metavar='N', type=int,
+        help='number of processes for plot.py to analyze tunnel logs with '
+        '(default number of CPUs)')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always parse tunnel logs instead of reusing results cached '
+        'next to unchanged logs')
 
     args = parser.parse_args()
     if args.schemes is not None:
@@ -109,6 +181,10 @@ def parse_over_time():
     parser.add_argument(
         '--amplify', metavar='FACTOR', type=float, default=1.0,
         help='amplication factor of output graph\'s x-axis scale ')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always parse tunnel logs instead of reusing results cached '
+        'next to unchanged logs')
 
     args = parser.parse_args()
     if args.schemes is not None:
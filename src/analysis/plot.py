@@ -5,7 +5,6 @@ import sys
 import math
 import json
 import multiprocessing
-from multiprocessing.pool import ThreadPool
 import numpy as np
 import matplotlib_agg
 import matplotlib.pyplot as plt
@@ -14,7 +13,8 @@ import matplotlib.ticker as ticker
 import arg_parser
 import tunnel_graph
 import context
-from helpers import utils
+from helpers import utils, resource_sampler
+from helpers.compression import find_file, open_file
 
 
 class Plot(object):
@@ -22,6 +22,11 @@ class Plot(object):
         self.data_dir = path.abspath(args.data_dir)
         self.include_acklink = args.include_acklink
         self.no_graphs = args.no_graphs
+        self.delay_sketch = args.delay_sketch
+        self.delay_percentiles = args.delay_percentiles
+        self.cache = not args.no_cache
+        self.jobs = args.jobs
+        self.parse_jobs = 1  # processes to parse each tunnel log with
 
         metadata_path = path.join(self.data_dir, 'pantheon_metadata.json')
         meta = utils.load_test_metadata(metadata_path)
@@ -82,38 +87,33 @@ class Plot(object):
             log_name = log_prefix + '_%s_run%s.log' % (link_t, run_id)
             log_path = path.join(self.data_dir, log_name)
 
-            if not path.isfile(log_path):
-                sys.stderr.write('Warning: %s does not exist\n' % log_path)
-                error = True
-                continue
+            # logs may have been compressed after the run, or not saved at
+            # all by "test.py --fused-merge --no-merged-logs"
+            if find_file(log_path) is None:
+                tunnel_results = None
+                if link_t == 'datalink':
+                    tunnel_results = self.load_saved_results(cc, run_id)
 
-            if self.no_graphs:
-                tput_graph_path = None
-                delay_graph_path = None
+                if tunnel_results is None:
+                    sys.stderr.write('Warning: %s does not exist\n' % log_path)
+                    error = True
+                    continue
             else:
-                tput_graph = cc + '_%s_throughput_run%s.png' % (link_t, run_id)
-                tput_graph_path = path.join(self.data_dir, tput_graph)
-
-                delay_graph = cc + '_%s_delay_run%s.png' % (link_t, run_id)
-                delay_graph_path = path.join(self.data_dir, delay_graph)
-
-            sys.stderr.write('$ tunnel_graph %s\n' % log_path)
-            try:
-                tunnel_results = tunnel_graph.TunnelGraph(
-                    tunnel_log=log_path,
-                    throughput_graph=tput_graph_path,
-                    delay_graph=delay_graph_path).run()
-            except Exception as exception:
-                sys.stderr.write('Error: %s\n' % exception)
-                sys.stderr.write('Warning: "tunnel_graph %s" failed but '
-                                 'continued to run.\n' % log_path)
-                error = True
-
-            if error:
-                continue
+                log_path = find_file(log_path)
+                tunnel_results = self.run_tunnel_graph(
+                    cc, run_id, link_t, log_path)
+
+                if tunnel_results is None:
+                    error = True
+                    continue
 
             if link_t == 'datalink':
                 ret = tunnel_results
+
+                # test.py has checked the duration of results it saved
+                if tunnel_results['duration'] is None:
+                    continue
+
                 duration = tunnel_results['duration'] / 1000.0
 
                 if duration < 0.8 * self.runtime:
@@ -128,27 +128,106 @@ class Plot(object):
 
         return ret
 
-    def update_stats_log(self, cc, run_id, stats):
+    def run_tunnel_graph(self, cc, run_id, link_t, log_path):
+        if self.no_graphs:
+            tput_graph_path = None
+            delay_graph_path = None
+        else:
+            tput_graph = cc + '_%s_throughput_run%s.png' % (link_t, run_id)
+            tput_graph_path = path.join(self.data_dir, tput_graph)
+
+            delay_graph = cc + '_%s_delay_run%s.png' % (link_t, run_id)
+            delay_graph_path = path.join(self.data_dir, delay_graph)
+
+        sys.stderr.write('$ tunnel_graph %s\n' % log_path)
+        try:
+            graph = tunnel_graph.TunnelGraph(
+                tunnel_log=log_path,
+                throughput_graph=tput_graph_path,
+                delay_graph=delay_graph_path,
+                delay_sketch=self.delay_sketch,
+                delay_percentiles=self.delay_percentiles,
+                cache=self.cache,
+                jobs=self.parse_jobs)
+
+            # keep the graphs that "test.py --pipeline" plotted from this
+            # very log with the same parameters
+            if self.cache and graph.graphs_marked():
+                sys.stderr.write('Kept the graphs plotted by --pipeline from '
+                                 '%s\n' % log_path)
+                graph.throughput_graph = None
+                graph.delay_graph = None
+
+            return graph.run()
+        except Exception as exception:
+            sys.stderr.write('Error: %s\n' % exception)
+            sys.stderr.write('Warning: "tunnel_graph %s" failed but '
+                             'continued to run.\n' % log_path)
+            return None
+
+    def load_saved_results(self, cc, run_id):
+        # datalink results saved by "test.py --fused-merge" right after a run,
+        # as the run is recorded in pantheon_perf.json; its statistics are
+        # already in its stats log
+        perf_path = path.join(
+            self.data_dir, '%s_perf_run%s.json' % (cc, run_id))
+        if not path.isfile(perf_path):
+            return None
+
+        try:
+            with open(perf_path) as perf_file:
+                flow_data = json.load(perf_file)[cc][str(run_id)]
+            total = flow_data['all']
+        except (ValueError, KeyError, TypeError):
+            sys.stderr.write('Warning: %s is not a record of %s run %s\n'
+                             % (perf_path, cc, run_id))
+            return None
+
+        sys.stderr.write('Loaded datalink results from %s\n' % perf_path)
+        return {'throughput': total['tput'], 'delay': total['delay'],
+                'loss': total['loss'], 'duration': None, 'stats': None,
+                'flow_data': flow_data}
+
+    def cpu_saturation(self, cc, run_id):
+        # components that were CPU-saturated during a run according to its
+        # resource log, if any
+        resources_log = find_file(path.join(
+            self.data_dir, '%s_resources_run%s.log' % (cc, run_id)))
+        if resources_log is None:
+            return []
+
+        try:
+            return resource_sampler.saturated_components(resources_log)
+        except (IOError, ValueError, KeyError) as exception:
+            sys.stderr.write('Warning: failed to read %s: %s\n'
+                             % (resources_log, exception))
+            return []
+
+    def update_stats_log(self, cc, run_id, stats, saturated=None):
         stats_log_path = path.join(
             self.data_dir, '%s_stats_run%s.log' % (cc, run_id))
 
-        if not path.isfile(stats_log_path):
+        if find_file(stats_log_path) is None:
             sys.stderr.write('Warning: %s does not exist\n' % stats_log_path)
             return None
+        stats_log_path = find_file(stats_log_path)
 
         saved_lines = ''
 
-        # back up old stats logs
-        with open(stats_log_path) as stats_log:
+        # back up old stats logs, and the datalink statistics in them if
+        # there are no new ones (i.e., they were saved by test.py)
+        with open_file(stats_log_path) as stats_log:
             for line in stats_log:
                 if any([x in line for x in [
                         'Start at:', 'End at:', 'clock offset:']]):
                     saved_lines += line
+                elif stats is None and 'CPU-saturated' not in line:
+                    saved_lines += line
                 else:
                     continue
 
         # write to new stats log
-        with open(stats_log_path, 'w') as stats_log:
+        with open_file(stats_log_path, 'w') as stats_log:
             stats_log.write(saved_lines)
 
             if stats:
@@ -157,42 +236,68 @@ class Plot(object):
                 stats_log.write('# Datalink statistics\n')
                 stats_log.write('%s' % stats)
 
+            for comp, count, samples in saturated or []:
+                stats_log.write('# Warning: %s was CPU-saturated in %d of %d '
+                                'resource samples\n' % (comp, count, samples))
+
     def eval_performance(self):
         perf_data = {}
         stats = {}
+        saturated_runs = []
 
         for cc in self.cc_schemes:
             perf_data[cc] = {}
             stats[cc] = {}
 
-        cc_id = 0
-        run_id = 1
-        pool = ThreadPool(processes=multiprocessing.cpu_count())
+        # parse tunnel logs and plot graphs in worker processes; with fewer
+        # runs than processes, parse each log with all processes instead
+        pool = None
+        if len(self.cc_schemes) * self.run_times < self.jobs:
+            self.parse_jobs = self.jobs
+        elif self.jobs > 1:
+            pool = multiprocessing.Pool(processes=self.jobs)
 
-        while cc_id < len(self.cc_schemes):
-            cc = self.cc_schemes[cc_id]
-            perf_data[cc][run_id] = pool.apply_async(
-                self.parse_tunnel_log, args=(cc, run_id))
+        for cc in self.cc_schemes:
+            for run_id in xrange(1, 1 + self.run_times):
+                if pool is None:
+                    perf_data[cc][run_id] = parse_tunnel_log(self, cc, run_id)
+                else:
+                    perf_data[cc][run_id] = pool.apply_async(
+                        parse_tunnel_log, args=(self, cc, run_id))
 
-            run_id += 1
-            if run_id > self.run_times:
-                run_id = 1
-                cc_id += 1
+        if pool is not None:
+            pool.close()
 
         for cc in self.cc_schemes:
             for run_id in xrange(1, 1 + self.run_times):
-                perf_data[cc][run_id] = perf_data[cc][run_id].get()
+                if pool is not None:
+                    perf_data[cc][run_id] = perf_data[cc][run_id].get()
 
                 if perf_data[cc][run_id] is None:
                     continue
 
                 stats_str = perf_data[cc][run_id]['stats']
-                self.update_stats_log(cc, run_id, stats_str)
+                saturated = self.cpu_saturation(cc, run_id)
+                self.update_stats_log(cc, run_id, stats_str, saturated)
                 stats[cc][run_id] = stats_str
 
+                if saturated:
+                    saturated_runs.append((cc, run_id, saturated))
+
+        if pool is not None:
+            pool.join()
+
         sys.stderr.write('Appended datalink statistics to stats files in %s\n'
                          % self.data_dir)
 
+        # results of runs in which a component ran out of CPU are suspect
+        for cc, run_id, saturated in saturated_runs:
+            sys.stderr.write(
+                'Warning: %s run %s was CPU-saturated (%s); its results may '
+                'reflect the host rather than the scheme\n' % (
+                    cc, run_id, ', '.join('%s in %d/%d samples' % s
+                                          for s in saturated)))
+
         return perf_data, stats
 
     def xaxis_log_scale(self, ax, min_delay, max_delay):
@@ -347,6 +452,12 @@ class Plot(object):
             json.dump(data_for_json, fh)
 
 
+# a module-level function (unlike a bound method) can be sent to worker
+# processes; the returned tunnel results are plain picklable dicts
+def parse_tunnel_log(plot, cc, run_id):
+    return plot.parse_tunnel_log(cc, run_id)
+
+
 def main():
     args = arg_parser.parse_plot()
     Plot(args).run()
@@ -4,13 +4,19 @@ import sys
 from os import path
 import math
 import time
+import numpy as np
 import matplotlib_agg
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
 import arg_parser
 import context
-from helpers import utils
+from helpers import utils, tunnel_log, parse_cache
+from helpers.compression import find_file
+
+
+# bump whenever parse_tunnel_log() changes to invalidate cached results
+PARSER_VERSION = 1
 
 
 class PlotThroughputTime(object):
@@ -18,6 +24,7 @@ class PlotThroughputTime(object):
         self.data_dir = path.abspath(args.data_dir)
         self.ms_per_bin = args.ms_per_bin
         self.amplify = args.amplify
+        self.cache = not args.no_cache
 
         metadata_path = path.join(self.data_dir, 'pantheon_metadata.json')
         meta = utils.load_test_metadata(metadata_path)
@@ -26,74 +33,74 @@ class PlotThroughputTime(object):
         self.run_times = meta['run_times']
         self.flows = meta['flows']
 
-    def ms_to_bin(self, ts, flow_base_ts):
-        return int((ts - flow_base_ts) / self.ms_per_bin)
-
     def parse_tunnel_log(self, tunnel_log_path):
-        tunlog = open(tunnel_log_path)
+        if not self.cache:
+            return self.parse_tunnel_log_without_cache(tunnel_log_path)
+
+        params = {'version': PARSER_VERSION, 'ms_per_bin': self.ms_per_bin}
+        ret = parse_cache.load(tunnel_log_path, 'plot_over_time', params)
+        if ret is None:
+            ret = self.parse_tunnel_log_without_cache(tunnel_log_path)
+            parse_cache.save(tunnel_log_path, 'plot_over_time', params, ret)
 
+        return ret
+
+    def parse_tunnel_log_without_cache(self, tunnel_log_path):
         # read init timestamp
-        init_ts = None
-        while init_ts is None:
-            line = tunlog.readline()
-            if 'init timestamp' in line:
-                init_ts = float(line.split(':')[1])
+        init_ts = tunnel_log.read_init_timestamp(tunnel_log_path)
+        if init_ts is None:
+            sys.exit('No init timestamp found in %s' % tunnel_log_path)
 
         flow_base_ts = {}  # timestamp when each flow sent the first byte
         departures = {}  # number of bits leaving the tunnel within a bin
 
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if '#' in line:
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
-
-            if event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+        for events in tunnel_log.iter_events(tunnel_log_path):
+            is_arrival = events.event == tunnel_log.ARRIVAL
+            is_departure = events.event == tunnel_log.DEPARTURE
 
+            arrival_ts = events.ts[is_arrival]
+            flow_ids, first_idx = np.unique(
+                events.flow[is_arrival], return_index=True)
+            for flow_id, i in zip(flow_ids.tolist(), first_idx.tolist()):
                 if flow_id not in flow_base_ts:
-                    flow_base_ts[flow_id] = ts
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+                    flow_base_ts[flow_id] = float(arrival_ts[i])
+
+            for flow_id in np.unique(events.flow[is_departure]).tolist():
+                mask = is_departure & (events.flow == flow_id)
+                ts = events.ts[mask]
+                num_bits = events.size[mask] * 8
 
+                # the first departure of each flow is not counted
                 if flow_id not in departures:
-                    departures[flow_id] = {}
-                else:
-                    bin_id = self.ms_to_bin(ts, flow_base_ts[flow_id])
-                    old_value = departures[flow_id].get(bin_id, 0)
-                    departures[flow_id][bin_id] = old_value + num_bits
+                    departures[flow_id] = []
+                    ts = ts[1:]
+                    num_bits = num_bits[1:]
 
-        tunlog.close()
+                bin_ids = ((ts - flow_base_ts[flow_id]) /
+                           self.ms_per_bin).astype(np.int64)
+                departures[flow_id].append(
+                    tunnel_log.bin_sums(bin_ids, num_bits))
 
         # prepare return values
         us_per_bin = 1000.0 * self.ms_per_bin
         clock_time = {}  # data for x-axis
         throughput = {}  # data for y-axis
         for flow_id in departures:
-            start_ts = flow_base_ts[flow_id] + init_ts + self.ms_per_bin / 2.0
-            clock_time[flow_id] = []
-            throughput[flow_id] = []
+            bin_ids, sums = tunnel_log.bin_sums(
+                np.concatenate([b for b, _ in departures[flow_id]]),
+                np.concatenate([s for _, s in departures[flow_id]]))
+            if len(bin_ids) == 0 or bin_ids[-1] < 0:
+                continue
 
-            max_bin_id = max(departures[flow_id].keys())
-            for bin_id in xrange(0, max_bin_id + 1):
-                time_sec = (start_ts + bin_id * self.ms_per_bin) / 1000.0
-                clock_time[flow_id].append(time_sec)
+            # only bins from 0 to the max bin ID are plotted
+            dense_sums = np.zeros(bin_ids[-1] + 1, dtype=np.int64)
+            dense_sums[bin_ids[bin_ids >= 0]] = sums[bin_ids >= 0]
 
-                tput_mbps = departures[flow_id].get(bin_id, 0) / us_per_bin
-                throughput[flow_id].append(tput_mbps)
+            start_ts = flow_base_ts[flow_id] + init_ts + self.ms_per_bin / 2.0
+            clock_time[flow_id] = (
+                (start_ts + np.arange(len(dense_sums)) * self.ms_per_bin) /
+                1000.0).tolist()
+            throughput[flow_id] = (dense_sums / us_per_bin).tolist()
 
         return clock_time, throughput
 
@@ -114,6 +121,7 @@ class PlotThroughputTime(object):
             for run_id in xrange(1, self.run_times + 1):
                 tunnel_log_path = path.join(
                     self.data_dir, datalink_fmt_str % (cc, run_id))
+                tunnel_log_path = find_file(tunnel_log_path) or tunnel_log_path
                 clock_time, throughput = self.parse_tunnel_log(tunnel_log_path)
 
                 min_time = None
@@ -10,6 +10,7 @@ import numpy as np
 import arg_parser
 import context
 from helpers import utils
+from helpers.compression import find_file, open_file
 from helpers.subprocess_wrappers import check_call, check_output
 
 
@@ -189,12 +190,12 @@ class Report(object):
 
             for run_id in xrange(1, 1 + self.run_times):
                 fname = '%s_stats_run%s.log' % (cc, run_id)
-                stats_log_path = path.join(self.data_dir, fname)
+                stats_log_path = find_file(path.join(self.data_dir, fname))
 
-                if not path.isfile(stats_log_path):
+                if stats_log_path is None:
                     continue
 
-                stats_log = open(stats_log_path)
+                stats_log = open_file(stats_log_path)
 
                 valid_run = False
                 flow_id = 1
@@ -273,8 +274,8 @@ class Report(object):
                 fname = '%s_stats_run%s.log' % (cc, run_id)
                 stats_log_path = path.join(self.data_dir, fname)
 
-                if path.isfile(stats_log_path):
-                    with open(stats_log_path) as stats_log:
+                if find_file(stats_log_path) is not None:
+                    with open_file(find_file(stats_log_path)) as stats_log:
                         stats_info = stats_log.read()
                 else:
                     stats_info = '%s does not exist\n' % stats_log_path
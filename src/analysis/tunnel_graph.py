@@ -4,158 +4,392 @@ from os import path
 import sys
 import math
 import itertools
+import multiprocessing
 import numpy as np
-import matplotlib_agg
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 import arg_parser
+import context
+from helpers import tunnel_log, parse_cache
+from helpers.quantile_sketch import LogHistogram
+
+# bump whenever parse_tunnel_log() or the graphs change to invalidate cached
+# results and graphs
+PARSER_VERSION = 4
+
+# attributes set by load_stats() and saved in caches: the binned series,
+# statistics and delay sketches. The per-packet delays (as many as the
+# packets in the log) are cached apart in single precision, and only loaded
+# to plot delay graphs.
+CACHED_ATTRS = [
+    'flows', 'avg_capacity', 'link_capacity', 'link_capacity_t',
+    'ingress_tput', 'egress_tput', 'ingress_t', 'egress_t', 'avg_ingress',
+    'avg_egress', 'delay_sketches', 'percentile_delay', 'percentile_delays',
+    'loss_rate', 'total_loss_rate', 'total_duration', 'total_avg_egress',
+    'total_percentile_delay', 'total_percentile_delays']
+
+
+def percentile_name(percentile):
+    # e.g., '50th', '99.9th' or '1st' percentile
+    name = '%g' % percentile
+    if name.endswith('1') and not name.endswith('11'):
+        return name + 'st'
+    if name.endswith('2') and not name.endswith('12'):
+        return name + 'nd'
+    if name.endswith('3') and not name.endswith('13'):
+        return name + 'rd'
+    return name + 'th'
+
+
+class BinnedEvents(object):
+    # number of bits of one type of events binned by time, along with the
+    # timestamps of the first (in log order) and the latest event
+    def __init__(self):
+        self.first_ts = None
+        self.last_ts = None
+        self.total = 0
+        self.bin_ids = np.empty(0, dtype=np.int64)
+        self.sums = np.empty(0, dtype=np.int64)
+
+    def add(self, ts, bin_ids, num_bits):
+        if len(ts) == 0:
+            return
 
+        if self.first_ts is None:
+            self.first_ts = float(ts[0])
 
-class TunnelGraph(object):
-    def __init__(self, tunnel_log, throughput_graph=None, delay_graph=None,
-                 ms_per_bin=500):
-        self.tunnel_log = tunnel_log
-        self.throughput_graph = throughput_graph
-        self.delay_graph = delay_graph
-        self.ms_per_bin = ms_per_bin
+        last_ts = float(ts.max())
+        if self.last_ts is None or last_ts > self.last_ts:
+            self.last_ts = last_ts
 
-    def ms_to_bin(self, ts, first_ts):
-        return int((ts - first_ts) / self.ms_per_bin)
+        self.total += int(num_bits.sum())
+        self.bin_ids, self.sums = tunnel_log.bin_sums(
+            np.concatenate((self.bin_ids, bin_ids)),
+            np.concatenate((self.sums, num_bits)))
 
-    def bin_to_s(self, bin_id):
-        return bin_id * self.ms_per_bin / 1000.0
+    def merge(self, other):
+        # other contains the events that come later in the log
+        if other.first_ts is None:
+            return
 
-    def parse_tunnel_log(self):
-        tunlog = open(self.tunnel_log)
+        if self.first_ts is None:
+            self.first_ts = other.first_ts
+        if self.last_ts is None or other.last_ts > self.last_ts:
+            self.last_ts = other.last_ts
+
+        self.total += other.total
+        self.bin_ids, self.sums = tunnel_log.bin_sums(
+            np.concatenate((self.bin_ids, other.bin_ids)),
+            np.concatenate((self.sums, other.sums)))
+
+    def series(self):
+        # return every bin ID from the min to the max and the bits in it
+        min_bin = self.bin_ids[0]
+        dense_sums = np.zeros(self.bin_ids[-1] - min_bin + 1, dtype=np.int64)
+        dense_sums[self.bin_ids - min_bin] = self.sums
+
+        return np.arange(min_bin, self.bin_ids[-1] + 1), dense_sums
 
-        self.flows = {}
-        first_ts = None
-        capacities = {}
 
-        arrivals = {}
-        departures = {}
+class TunnelLogStats(object):
+    # accumulate statistics of a tunnel log from chunks of Events fed in order;
+    # with delay_sketch=True, per-packet delays are only counted in a
+    # LogHistogram per flow instead of being kept in memory
+    def __init__(self, ms_per_bin, first_ts=None, delay_sketch=False):
+        self.ms_per_bin = ms_per_bin
+        self.first_ts = first_ts
+        self.delay_sketch = delay_sketch
+
+        self.flows = []  # flow IDs in the order of first appearance
+        self.capacity = BinnedEvents()
+        self.arrivals = {}
+        self.departures = {}
+        self.delays = {}  # flow ID -> list of arrays of per-packet delays
         self.delays_t = {}
-        self.delays = {}
+        self.delay_sketches = {}  # flow ID -> LogHistogram of delays
 
-        first_capacity = None
-        last_capacity = None
-        first_arrival = {}
-        last_arrival = {}
-        first_departure = {}
-        last_departure = {}
+        self.total_first_departure = None
+        self.total_last_departure = None
 
-        total_first_departure = None
-        total_last_departure = None
-        total_arrivals = 0
-        total_departures = 0
+    def add_flows(self, flow_ids):
+        for flow_id in flow_ids:
+            if flow_id not in self.flows:
+                self.flows.append(flow_id)
 
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
+    def add(self, events):
+        if len(events.ts) == 0:
+            return
 
-            if line.startswith('#'):
-                continue
+        if self.first_ts is None:
+            self.first_ts = float(events.ts[0])
 
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
+        bin_ids = ((events.ts - self.first_ts) / self.ms_per_bin).astype(
+            np.int64)
+        num_bits = events.size * 8
 
-            if first_ts is None:
-                first_ts = ts
+        is_opp = events.event == tunnel_log.OPPORTUNITY
+        self.capacity.add(events.ts[is_opp], bin_ids[is_opp], num_bits[is_opp])
 
-            bin_id = self.ms_to_bin(ts, first_ts)
+        is_arr = events.event == tunnel_log.ARRIVAL
+        is_dep = events.event == tunnel_log.DEPARTURE
 
-            if event_type == '#':
-                capacities[bin_id] = capacities.get(bin_id, 0) + num_bits
+        # record flow IDs in the order they first appear
+        flow_ids = events.flow[is_arr | is_dep]
+        uniq, first_idx = np.unique(flow_ids, return_index=True)
+        self.add_flows(uniq[np.argsort(first_idx)].tolist())
 
-                if first_capacity is None:
-                    first_capacity = ts
+        for flow_id in np.unique(flow_ids).tolist():
+            is_flow = events.flow == flow_id
 
-                if last_capacity is None or ts > last_capacity:
-                    last_capacity = ts
-            elif event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+            mask = is_arr & is_flow
+            if mask.any():
+                if flow_id not in self.arrivals:
+                    self.arrivals[flow_id] = BinnedEvents()
+                self.arrivals[flow_id].add(
+                    events.ts[mask], bin_ids[mask], num_bits[mask])
 
-                self.flows[flow_id] = True
+            mask = is_dep & is_flow
+            if mask.any():
+                if flow_id not in self.departures:
+                    self.departures[flow_id] = BinnedEvents()
+                self.departures[flow_id].add(
+                    events.ts[mask], bin_ids[mask], num_bits[mask])
 
-                if flow_id not in arrivals:
-                    arrivals[flow_id] = {}
-                    first_arrival[flow_id] = ts
+                if self.delay_sketch:
+                    if flow_id not in self.delay_sketches:
+                        self.delay_sketches[flow_id] = LogHistogram()
+                    self.delay_sketches[flow_id].add(events.delay[mask])
+                    continue
 
-                if flow_id not in last_arrival:
-                    last_arrival[flow_id] = ts
-                else:
-                    if ts > last_arrival[flow_id]:
-                        last_arrival[flow_id] = ts
+                # store delays for each flow and calculate percentiles later
+                if flow_id not in self.delays:
+                    self.delays[flow_id] = []
+                    self.delays_t[flow_id] = []
+                self.delays[flow_id].append(events.delay[mask])
+                self.delays_t[flow_id].append(
+                    (events.ts[mask] - self.first_ts) / 1000.0)
 
-                old_value = arrivals[flow_id].get(bin_id, 0)
-                arrivals[flow_id][bin_id] = old_value + num_bits
+        if is_dep.any():
+            dep_ts = events.ts[is_dep]
+            if self.total_first_departure is None:
+                self.total_first_departure = float(dep_ts[0])
 
-                total_arrivals += num_bits
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
+            last_ts = float(dep_ts.max())
+            if (self.total_last_departure is None or
+                    last_ts > self.total_last_departure):
+                self.total_last_departure = last_ts
 
-                self.flows[flow_id] = True
+    def merge(self, other):
+        # other accumulated the part of the log that comes after this part,
+        # with the same first_ts
+        self.add_flows(other.flows)
+        self.capacity.merge(other.capacity)
 
-                if flow_id not in departures:
-                    departures[flow_id] = {}
-                    first_departure[flow_id] = ts
+        for events, other_events in [(self.arrivals, other.arrivals),
+                                     (self.departures, other.departures)]:
+            for flow_id in other_events:
+                if flow_id not in events:
+                    events[flow_id] = BinnedEvents()
+                events[flow_id].merge(other_events[flow_id])
 
-                if flow_id not in last_departure:
-                    last_departure[flow_id] = ts
-                else:
-                    if ts > last_departure[flow_id]:
-                        last_departure[flow_id] = ts
+        for flow_id in other.delays:
+            self.delays.setdefault(flow_id, []).extend(other.delays[flow_id])
+            self.delays_t.setdefault(flow_id, []).extend(
+                other.delays_t[flow_id])
 
-                old_value = departures[flow_id].get(bin_id, 0)
-                departures[flow_id][bin_id] = old_value + num_bits
+        for flow_id in other.delay_sketches:
+            if flow_id not in self.delay_sketches:
+                self.delay_sketches[flow_id] = LogHistogram()
+            self.delay_sketches[flow_id].merge(other.delay_sketches[flow_id])
 
-                total_departures += num_bits
+        if self.total_first_departure is None:
+            self.total_first_departure = other.total_first_departure
+        if (other.total_last_departure is not None and
+                (self.total_last_departure is None or
+                 other.total_last_departure > self.total_last_departure)):
+            self.total_last_departure = other.total_last_departure
 
-                # update total variables
-                if total_first_departure is None:
-                    total_first_departure = ts
-                if (total_last_departure is None or
-                        ts > total_last_departure):
-                    total_last_departure = ts
 
-                # store delays in a list for each flow and sort later
-                delay = float(items[3])
-                if flow_id not in self.delays:
-                    self.delays[flow_id] = []
-                    self.delays_t[flow_id] = []
-                self.delays[flow_id].append(delay)
-                self.delays_t[flow_id].append((ts - first_ts) / 1000.0)
+def parse_tunnel_log_part(tunnel_log_path, ms_per_bin, first_ts,
+                          delay_sketch, part):
+    # accumulate one part of a tunnel log in a worker process
+    stats = TunnelLogStats(ms_per_bin, first_ts, delay_sketch)
+    for events in tunnel_log.iter_events(tunnel_log_path, part=part):
+        stats.add(events)
+
+    return stats
+
+
+def parse_tunnel_log_part_star(args):
+    return parse_tunnel_log_part(*args)
+
+
+class TunnelGraph(object):
+    def __init__(self, tunnel_log, throughput_graph=None, delay_graph=None,
+                 ms_per_bin=500, delay_sketch=False, delay_percentiles=None,
+                 cache=False, jobs=1, mark_graphs=False):
+        self.tunnel_log = tunnel_log
+        self.throughput_graph = throughput_graph
+        self.delay_graph = delay_graph
+        self.ms_per_bin = ms_per_bin
+
+        # estimate delay percentiles in constant memory (no delay graph)
+        self.delay_sketch = delay_sketch
+        if self.delay_sketch and self.delay_graph:
+            raise ValueError('cannot plot delay graph with delay sketches')
+
+        # percentiles of per-packet delays to report besides the 95th
+        self.delay_percentiles = sorted(set(delay_percentiles or []) - {95})
 
-        tunlog.close()
+        # number of processes to parse a large log with
+        self.jobs = jobs
 
+        # reuse parsed results saved next to the log if it is unchanged
+        self.cache = cache
+        self.cache_hit = False
+
+        # record next to the log which graphs were plotted from it, so that
+        # plot.py keeps them instead of plotting them again
+        self.mark_graphs = mark_graphs
+
+    def ms_to_bin(self, ts, first_ts):
+        return int((ts - first_ts) / self.ms_per_bin)
+
+    def bin_to_s(self, bin_id):
+        return bin_id * self.ms_per_bin / 1000.0
+
+    def bins_to_s(self, bin_ids):
+        return bin_ids * self.ms_per_bin / 1000.0
+
+    def cache_params(self):
+        return {'version': PARSER_VERSION,
+                'ms_per_bin': self.ms_per_bin,
+                'delay_sketch': self.delay_sketch,
+                'delay_percentiles': self.delay_percentiles}
+
+    def graphs_params(self):
+        graphs = [self.throughput_graph, self.delay_graph]
+        return {'version': PARSER_VERSION,
+                'ms_per_bin': self.ms_per_bin,
+                'graphs': [g and path.abspath(g) for g in graphs]}
+
+    def graphs_marked(self):
+        # whether the graphs were plotted from this very log with the same
+        # parameters (with mark_graphs=True) and are still there
+        graphs = [g for g in [self.throughput_graph, self.delay_graph] if g]
+        if not graphs or parse_cache.load(
+                self.tunnel_log, 'graphs', self.graphs_params()) is None:
+            return False
+
+        return all(path.isfile(g) for g in graphs)
+
+    def parse_tunnel_log(self):
+        if self.cache and self.load_cache():
+            self.cache_hit = True
+            return
+
+        self.parse_tunnel_log_in_bulk()
+
+        if self.cache:
+            self.save_cache()
+
+    def load_cache(self):
+        # load the cached results, and the per-packet delays only if a delay
+        # graph is to be plotted; return whether all were cached
+        cached = parse_cache.load(
+            self.tunnel_log, 'tunnel_graph', self.cache_params())
+        if cached is None:
+            return False
+
+        delays = {'delays': {}, 'delays_t': {}}
+        if self.delay_graph:
+            delays = parse_cache.load(
+                self.tunnel_log, 'tunnel_graph_delays', self.cache_params())
+            if delays is None:
+                return False
+
+        self.__dict__.update(cached)
+        self.__dict__.update(delays)
+        return True
+
+    def save_cache(self):
+        cached = {}
+        for attr in CACHED_ATTRS:
+            cached[attr] = getattr(self, attr)
+        parse_cache.save(self.tunnel_log, 'tunnel_graph',
+                         self.cache_params(), cached)
+
+        # single precision is plenty to plot the delays, and halves them
+        if not self.delay_sketch:
+            delays = {'delays': {}, 'delays_t': {}}
+            for attr in delays:
+                for flow_id, values in getattr(self, attr).iteritems():
+                    delays[attr][flow_id] = values.astype(np.float32)
+            parse_cache.save(self.tunnel_log, 'tunnel_graph_delays',
+                             self.cache_params(), delays)
+
+    def parse_tunnel_log_in_bulk(self):
+        parts = tunnel_log.num_parts(self.tunnel_log, self.jobs)
+        if parts == 1:
+            stats = TunnelLogStats(self.ms_per_bin,
+                                   delay_sketch=self.delay_sketch)
+            for events in tunnel_log.iter_events(self.tunnel_log):
+                stats.add(events)
+        else:
+            # parse parts of the log in parallel and merge them in order
+            first_ts = tunnel_log.read_first_timestamp(self.tunnel_log)
+            tasks = [(self.tunnel_log, self.ms_per_bin, first_ts,
+                      self.delay_sketch, (i, parts)) for i in xrange(parts)]
+
+            pool = multiprocessing.Pool(processes=parts)
+            try:
+                part_stats = pool.map(parse_tunnel_log_part_star, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+            stats = part_stats[0]
+            for other in part_stats[1:]:
+                stats.merge(other)
+
+        self.load_stats(stats)
+
+    def parse_events(self, events, chunk_events=1 << 20):
+        # accumulate Events of a whole tunnel log already in memory, e.g.,
+        # merged by merge_tunnel_logs.join_and_merge_events() without being
+        # written to self.tunnel_log
+        stats = TunnelLogStats(self.ms_per_bin,
+                               delay_sketch=self.delay_sketch)
+        for start in xrange(0, len(events.ts), chunk_events):
+            stats.add(tunnel_log.Events(
+                *[column[start:start + chunk_events] for column in events]))
+
+        self.load_stats(stats)
+
+    def load_stats(self, stats):
         us_per_bin = 1000.0 * self.ms_per_bin
 
+        self.flows = {}
+        for flow_id in stats.flows:
+            self.flows[flow_id] = True
+
         self.avg_capacity = None
         self.link_capacity = []
         self.link_capacity_t = []
-        if capacities:
+        if stats.capacity.first_ts is not None:
             # calculate average capacity
-            if last_capacity == first_capacity:
+            capacity = stats.capacity
+            if capacity.last_ts == capacity.first_ts:
                 self.avg_capacity = 0
             else:
-                delta = 1000.0 * (last_capacity - first_capacity)
-                self.avg_capacity = sum(capacities.values()) / delta
+                delta = 1000.0 * (capacity.last_ts - capacity.first_ts)
+                self.avg_capacity = capacity.total / delta
 
             # transform capacities into a list
-            capacity_bins = capacities.keys()
-            for bin_id in xrange(min(capacity_bins), max(capacity_bins) + 1):
-                self.link_capacity.append(
-                    capacities.get(bin_id, 0) / us_per_bin)
-                self.link_capacity_t.append(self.bin_to_s(bin_id))
+            bin_ids, sums = capacity.series()
+            self.link_capacity = (sums / us_per_bin).tolist()
+            self.link_capacity_t = self.bins_to_s(bin_ids).tolist()
 
         # calculate ingress and egress throughput for each flow
         self.ingress_tput = {}
@@ -164,10 +398,15 @@ class TunnelGraph(object):
         self.egress_t = {}
         self.avg_ingress = {}
         self.avg_egress = {}
+        self.delays = {}
+        self.delays_t = {}
+        self.delay_sketches = stats.delay_sketches
         self.percentile_delay = {}
+        self.percentile_delays = {}  # flow ID -> {percentile: delay}
         self.loss_rate = {}
 
         total_delays = []
+        total_sketch = LogHistogram()
 
         for flow_id in self.flows:
             self.ingress_tput[flow_id] = []
@@ -177,67 +416,77 @@ class TunnelGraph(object):
             self.avg_ingress[flow_id] = 0
             self.avg_egress[flow_id] = 0
 
-            if flow_id in arrivals:
-                # calculate average ingress and egress throughput
-                first_arrival_ts = first_arrival[flow_id]
-                last_arrival_ts = last_arrival[flow_id]
+            arrivals = stats.arrivals.get(flow_id)
+            departures = stats.departures.get(flow_id)
 
-                if last_arrival_ts == first_arrival_ts:
+            if arrivals is not None:
+                # calculate average ingress and egress throughput
+                if arrivals.last_ts == arrivals.first_ts:
                     self.avg_ingress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_arrival_ts - first_arrival_ts)
-                    flow_arrivals = sum(arrivals[flow_id].values())
-                    self.avg_ingress[flow_id] = flow_arrivals / delta
+                    delta = 1000.0 * (arrivals.last_ts - arrivals.first_ts)
+                    self.avg_ingress[flow_id] = arrivals.total / delta
 
-                ingress_bins = arrivals[flow_id].keys()
-                for bin_id in xrange(min(ingress_bins), max(ingress_bins) + 1):
-                    self.ingress_tput[flow_id].append(
-                        arrivals[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.ingress_t[flow_id].append(self.bin_to_s(bin_id))
+                bin_ids, sums = arrivals.series()
+                self.ingress_tput[flow_id] = (sums / us_per_bin).tolist()
+                self.ingress_t[flow_id] = self.bins_to_s(bin_ids).tolist()
 
-            if flow_id in departures:
-                first_departure_ts = first_departure[flow_id]
-                last_departure_ts = last_departure[flow_id]
-
-                if last_departure_ts == first_departure_ts:
+            if departures is not None:
+                if departures.last_ts == departures.first_ts:
                     self.avg_egress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_departure_ts - first_departure_ts)
-                    flow_departures = sum(departures[flow_id].values())
-                    self.avg_egress[flow_id] = flow_departures / delta
-
-                egress_bins = departures[flow_id].keys()
+                    delta = 1000.0 * (
+                        departures.last_ts - departures.first_ts)
+                    self.avg_egress[flow_id] = departures.total / delta
 
-                self.egress_tput[flow_id].append(0.0)
-                self.egress_t[flow_id].append(self.bin_to_s(min(egress_bins)))
+                bin_ids, sums = departures.series()
 
-                for bin_id in xrange(min(egress_bins), max(egress_bins) + 1):
-                    self.egress_tput[flow_id].append(
-                        departures[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.egress_t[flow_id].append(self.bin_to_s(bin_id + 1))
+                self.egress_tput[flow_id] = (
+                    [0.0] + (sums / us_per_bin).tolist())
+                self.egress_t[flow_id] = (
+                    [self.bin_to_s(int(bin_ids[0]))] +
+                    self.bins_to_s(bin_ids + 1).tolist())
 
-            # calculate 95th percentile per-packet one-way delay
+            # calculate 95th (and other) percentile per-packet one-way delay
             self.percentile_delay[flow_id] = None
-            if flow_id in self.delays:
+            self.percentile_delays[flow_id] = {}
+            if flow_id in stats.delay_sketches:
+                sketch = stats.delay_sketches[flow_id]
+                self.percentile_delay[flow_id] = sketch.percentile(95)
+                for q in self.delay_percentiles:
+                    self.percentile_delays[flow_id][q] = sketch.percentile(q)
+                total_sketch.merge(sketch)
+            elif flow_id in stats.delays:
+                self.delays[flow_id] = np.concatenate(stats.delays[flow_id])
+                self.delays_t[flow_id] = np.concatenate(
+                    stats.delays_t[flow_id])
+
                 self.percentile_delay[flow_id] = np.percentile(
                     self.delays[flow_id], 95, interpolation='nearest')
-                total_delays += self.delays[flow_id]
+                self.percentile_delays[flow_id] = self.exact_percentiles(
+                    self.delays[flow_id])
+                total_delays.append(self.delays[flow_id])
 
             # calculate loss rate for each flow
-            if flow_id in arrivals and flow_id in departures:
-                flow_arrivals = sum(arrivals[flow_id].values())
-                flow_departures = sum(departures[flow_id].values())
-
+            if arrivals is not None and departures is not None:
                 self.loss_rate[flow_id] = None
-                if flow_arrivals > 0:
+                if arrivals.total > 0:
                     self.loss_rate[flow_id] = (
-                        1 - 1.0 * flow_departures / flow_arrivals)
+                        1 - 1.0 * departures.total / arrivals.total)
+
+        total_arrivals = sum([stats.arrivals[flow_id].total
+                              for flow_id in stats.arrivals])
+        total_departures = sum([stats.departures[flow_id].total
+                                for flow_id in stats.departures])
 
         self.total_loss_rate = None
         if total_arrivals > 0:
             self.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
 
         # calculate total average throughput and 95th percentile delay
+        total_first_departure = stats.total_first_departure
+        total_last_departure = stats.total_last_departure
+
         self.total_avg_egress = None
         if total_last_departure == total_first_departure:
             self.total_duration = 0
@@ -248,16 +497,40 @@ class TunnelGraph(object):
                 1000.0 * self.total_duration)
 
         self.total_percentile_delay = None
+        self.total_percentile_delays = {}
         if total_delays:
+            total_delays = np.concatenate(total_delays)
             self.total_percentile_delay = np.percentile(
                 total_delays, 95, interpolation='nearest')
+            self.total_percentile_delays = self.exact_percentiles(
+                total_delays)
+        elif total_sketch.count > 0:
+            self.total_percentile_delay = total_sketch.percentile(95)
+            for q in self.delay_percentiles:
+                self.total_percentile_delays[q] = total_sketch.percentile(q)
+
+    def exact_percentiles(self, delays):
+        # {percentile: delay} for self.delay_percentiles
+        if not self.delay_percentiles:
+            return {}
+
+        values = np.percentile(delays, self.delay_percentiles,
+                               interpolation='nearest')
+        return dict(zip(self.delay_percentiles, values.tolist()))
 
     def flip(self, items, ncol):
         return list(itertools.chain(*[items[i::ncol] for i in range(ncol)]))
 
+    # use the object-oriented API of matplotlib rather than pyplot so that
+    # graphs can be plotted concurrently without any global state
+    def new_figure(self):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot(111)
+
     def plot_throughput_graph(self):
         empty_graph = True
-        fig, ax = plt.subplots()
+        fig, ax = self.new_figure()
 
         if self.link_capacity:
             empty_graph = False
@@ -310,7 +583,7 @@ class TunnelGraph(object):
 
     def plot_delay_graph(self):
         empty_graph = True
-        fig, ax = plt.subplots()
+        fig, ax = self.new_figure()
 
         max_delay = 0
         colors = ['b', 'g', 'r', 'y', 'c', 'm']
@@ -319,7 +592,7 @@ class TunnelGraph(object):
             color = colors[color_i]
             if flow_id in self.delays and flow_id in self.delays_t:
                 empty_graph = False
-                max_delay = max(max_delay, max(self.delays_t[flow_id]))
+                max_delay = max(max_delay, np.max(self.delays_t[flow_id]))
 
                 ax.scatter(self.delays_t[flow_id], self.delays[flow_id], s=1,
                            color=color, marker='.',
@@ -370,6 +643,7 @@ class TunnelGraph(object):
         if self.total_percentile_delay is not None:
             ret += ('95th percentile per-packet one-way delay: %.3f ms\n' %
                     self.total_percentile_delay)
+        ret += self.percentiles_string(self.total_percentile_delays)
 
         if self.total_loss_rate is not None:
             ret += 'Loss rate: %.2f%%\n' % (self.total_loss_rate * 100.0)
@@ -386,6 +660,8 @@ class TunnelGraph(object):
                     self.percentile_delay[flow_id] is not None):
                 ret += ('95th percentile per-packet one-way delay: %.3f ms\n' %
                         self.percentile_delay[flow_id])
+            ret += self.percentiles_string(
+                self.percentile_delays.get(flow_id, {}))
 
             if (flow_id in self.loss_rate and
                     self.loss_rate[flow_id] is not None):
@@ -393,17 +669,31 @@ class TunnelGraph(object):
 
         return ret
 
-    def run(self):
-        self.parse_tunnel_log()
+    def percentiles_string(self, percentile_delays):
+        ret = ''
+        for q in sorted(percentile_delays):
+            ret += ('%s percentile per-packet one-way delay: %.3f ms\n' %
+                    (percentile_name(q), percentile_delays[q]))
+        return ret
 
+    def plot_graphs(self):
         if self.throughput_graph:
             self.plot_throughput_graph()
 
         if self.delay_graph:
             self.plot_delay_graph()
 
-        plt.close('all')
+    def run(self):
+        self.parse_tunnel_log()
+        self.plot_graphs()
+
+        if self.mark_graphs and (self.throughput_graph or self.delay_graph):
+            parse_cache.save(self.tunnel_log, 'graphs', self.graphs_params(),
+                             True)
 
+        return self.get_tunnel_results()
+
+    def get_tunnel_results(self):
         tunnel_results = {}
         tunnel_results['throughput'] = self.total_avg_egress
         tunnel_results['delay'] = self.total_percentile_delay
@@ -416,6 +706,9 @@ class TunnelGraph(object):
         flow_data['all']['tput'] = self.total_avg_egress
         flow_data['all']['delay'] = self.total_percentile_delay
         flow_data['all']['loss'] = self.total_loss_rate
+        if self.delay_percentiles:
+            flow_data['all']['delay_percentiles'] = self.percentiles_data(
+                self.total_percentile_delays)
 
         for flow_id in self.flows:
             if flow_id != 0:
@@ -423,11 +716,23 @@ class TunnelGraph(object):
                 flow_data[flow_id]['tput'] = self.avg_egress[flow_id]
                 flow_data[flow_id]['delay'] = self.percentile_delay[flow_id]
                 flow_data[flow_id]['loss'] = self.loss_rate[flow_id]
+                if self.delay_percentiles:
+                    flow_data[flow_id]['delay_percentiles'] = (
+                        self.percentiles_data(
+                            self.percentile_delays[flow_id]))
 
         tunnel_results['flow_data'] = flow_data
 
         return tunnel_results
 
+    def percentiles_data(self, percentile_delays):
+        # {'%g' % percentile: delay} for every configured percentile, with
+        # None for those of flows without any delays
+        data = {}
+        for q in self.delay_percentiles:
+            data['%g' % q] = percentile_delays.get(q)
+        return data
+
 
 def main():
     args = arg_parser.parse_tunnel_graph()
@@ -436,7 +741,11 @@ def main():
         tunnel_log=args.tunnel_log,
         throughput_graph=args.throughput_graph,
         delay_graph=args.delay_graph,
-        ms_per_bin=args.ms_per_bin)
+        ms_per_bin=args.ms_per_bin,
+        delay_sketch=args.delay_sketch,
+        delay_percentiles=args.delay_percentiles,
+        cache=not args.no_cache,
+        jobs=args.jobs)
     tunnel_results = tunnel_graph.run()
 
     sys.stderr.write(tunnel_results['stats'])
@@ -4,7 +4,7 @@ import yaml
 import argparse
 
 import context
-from helpers import utils
+from helpers import utils, journal, sweep, clock_offset
 
 
 def verify_schemes(schemes):
@@ -75,9 +75,14 @@ def parse_setup():
     return args
 
 
-def parse_test_shared(local, remote, config_args):
+def parse_test_shared(local, remote, test_config):
+    # a config file may describe the flows to test, and may set the schemes
+    flows_in_config = test_config is not None and 'flows' in test_config
+    schemes_in_config = test_config is not None and (
+        'schemes' in test_config or test_config.get('all'))
+
     for mode in [local, remote]:
-        if config_args.config_file is None:
+        if not flows_in_config:
             mode.add_argument(
                 '-f', '--flows', type=int, default=1,
                 help='number of flows (default 1)')
@@ -88,8 +93,9 @@ def parse_test_shared(local, remote, config_args):
             '--interval', type=int, default=0,
             help='interval in seconds between two flows (default 0)')
 
-        if config_args.config_file is None:
-            group = mode.add_mutually_exclusive_group(required=True)
+        if not flows_in_config:
+            group = mode.add_mutually_exclusive_group(
+                required=not schemes_in_config)
             group.add_argument('--all', action='store_true',
                            help='test all schemes specified in src/config.yml')
             group.add_argument('--schemes', metavar='"SCHEME1 SCHEME2..."',
@@ -109,6 +115,26 @@ def parse_test_shared(local, remote, config_args):
         mode.add_argument(
             '--pkill-cleanup', action='store_true', help='clean up using pkill'
             ' (send SIGKILL when necessary) if there were errors during tests')
+        mode.add_argument(
+            '--fused-merge', action='store_true',
+            help='merge tunnel logs in memory after each run and save the '
+            'datalink results to CC_perf_runID.json (as recorded in '
+            'pantheon_perf.json) and the stats log right away')
+        mode.add_argument(
+            '--no-merged-logs', action='store_true',
+            help='do not save merged datalink and acklink logs, but plot the '
+            'datalink graphs right after each run instead (requires '
+            '--fused-merge)')
+        mode.add_argument(
+            '--pipeline', action='store_true',
+            help='merge the logs of each run, and save the datalink '
+            'statistics and graphs for analyze.py, in low-priority background '
+            'processes while the next runs execute')
+        mode.add_argument(
+            '--resume', action='store_true',
+            help='skip the runs completed with the same configuration '
+            'according to the journal in the data directory (%s), and redo '
+            'failed or incomplete ones' % journal.JOURNAL_NAME)
 
 
 def parse_test_local(local):
@@ -133,6 +159,13 @@ def parse_test_local(local):
         help='extra arguments to pass to mm-link when running locally. Note '
         'that uplink (downlink) always represents the link from sender to '
         'receiver (from receiver to sender)')
+    local.add_argument(
+        '--parallel', metavar='N', type=int, default=1,
+        help='run N tests at once, each pinned to its own CPUs (default 1)')
+    local.add_argument(
+        '--cpus-per-test', metavar='CPUS', type=int, default=3,
+        help='CPUs dedicated to each test run in parallel, e.g., for the '
+        'sender, receiver and mm-link (default 3)')
 
 
 def parse_test_remote(remote):
@@ -154,9 +187,21 @@ def parse_test_remote(remote):
     remote.add_argument(
         '--remote-if', metavar='INTERFACE',
         help='remote interface to run pantheon tunnel on')
+    remote.add_argument(
+        '--background-download', action='store_true',
+        help='download the tunnel logs of each run from the remote side in '
+        'the background during the next runs, at the cost of sharing their '
+        'network (requires --pipeline)')
     remote.add_argument(
         '--ntp-addr', metavar='HOST',
         help='address of an NTP server to query clock offset')
+    remote.add_argument(
+        '--ntp-max-age', metavar='SECONDS', type=float,
+        default=clock_offset.DEFAULT_MAX_AGE,
+        help='query the NTP server again when the clock offsets are older '
+        'than SECONDS, and extrapolate them with the clock drift in between '
+        '(default %d; 0 to query before every run)'
+        % clock_offset.DEFAULT_MAX_AGE)
     remote.add_argument(
         '--local-desc', metavar='DESC',
         help='extra description of the local side')
@@ -174,6 +219,36 @@ def verify_test_args(args):
             sys.exit('Cannot apply --prepend-mm-cmds, --append-mm-cmds or '
                      '--extra-mm-link-args without pantheon tunnels')
 
+    if args.no_merged_logs and not args.fused_merge:
+        sys.exit('--no-merged-logs requires --fused-merge')
+    if args.pipeline and args.fused_merge:
+        sys.exit('cannot apply both --pipeline and --fused-merge')
+    if getattr(args, 'background_download', False) and not args.pipeline:
+        sys.exit('--background-download requires --pipeline')
+
+    if getattr(args, 'sweep', None) is not None:
+        if args.mode != 'local':
+            sys.exit('a sweep of emulation settings requires local mode')
+        sweep.expand(args.sweep)  # exits if the sweep is malformed
+
+    parallel = getattr(args, 'parallel', 1)
+    cpus_per_test = getattr(args, 'cpus_per_test', 1)
+    if parallel < 1 or cpus_per_test < 1:
+        sys.exit('--parallel and --cpus-per-test must be positive')
+    if parallel > 1:
+        # refuse to oversubscribe CPUs so that contention between the tests
+        # run in parallel does not skew their results
+        cpus = len(utils.allowed_cpus())
+        if parallel * cpus_per_test > cpus:
+            sys.exit('cannot run %d tests in parallel with %d CPUs each on %d '
+                     'CPUs' % (parallel, cpus_per_test, cpus))
+
+        # nor let --pipeline post-process on the CPUs of the tests
+        if args.pipeline and parallel * cpus_per_test == cpus:
+            sys.exit('cannot run %d tests in parallel with %d CPUs each on %d '
+                     'CPUs and leave a CPU to --pipeline'
+                     % (parallel, cpus_per_test, cpus))
+
     if args.runtime > 60 or args.runtime <= 0:
         sys.exit('runtime cannot be non-positive or greater than 60 s')
     if args.flows < 0:
@@ -186,14 +261,24 @@ def verify_test_args(args):
                      'fit in runtime')
 
 def parse_test_config(test_config, local, remote):
+    defaults = {}
+    defaults.update(**test_config)
+
+    # without a description of flows, a config file only sets options, e.g.,
+    # the schemes and a sweep of emulation settings
+    if 'flows' not in test_config:
+        if isinstance(test_config.get('schemes'), list):
+            defaults['schemes'] = ' '.join(test_config['schemes'])
+        defaults['test_config'] = None
+
+        local.set_defaults(**defaults)
+        remote.set_defaults(**defaults)
+        return
+
     # Check config file has atleast a test-name and a description of flows
     if 'test-name' not in test_config:
         sys.exit('Config file must have a test-name argument')
-    if 'flows' not in test_config:
-        sys.exit('Config file must specify flows')
 
-    defaults = {}
-    defaults.update(**test_config)
     defaults['schemes'] = None
     defaults['all'] = False
     defaults['flows'] = len(test_config['flows'])
@@ -230,15 +315,17 @@ def parse_test():
         'remote_path', metavar='HOST:PANTHEON-DIR',
         help='HOST ([user@]IP) and PANTHEON-DIR (remote pantheon directory)')
 
-    parse_test_shared(local, remote, config_args)
-    parse_test_local(local)
-    parse_test_remote(remote)
-
-    # Make settings in config file the defaults
     test_config = None
     if config_args.config_file is not None:
         with open(config_args.config_file) as f:
             test_config = yaml.safe_load(f)
+
+    parse_test_shared(local, remote, test_config)
+    parse_test_local(local)
+    parse_test_remote(remote)
+
+    # Make settings in config file the defaults
+    if test_config is not None:
         parse_test_config(test_config, local, remote)
 
     args = parser.parse_args(remaining_argv)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import zlib
+import tarfile
+import argparse
+from subprocess import Popen, PIPE
+
+import context
+from helpers.compression import MAGIC_BYTES
+
+
+# Logs on the remote side are downloaded in a single compressed tar stream:
+# this script runs on the remote side (through ssh) to write the stream to
+# its stdout, and download() unpacks it on the local side as it arrives.
+
+
+def compressobj(compression):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compressobj()
+
+    return zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def decompressobj(compression):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def local_compression():
+    # compress with zstd if it can be decompressed on this side
+    try:
+        import zstandard
+    except ImportError:
+        return 'gzip'
+
+    return 'zstd'
+
+
+class CompressedWriter(object):
+    # write-only file object that compresses into another file object
+    def __init__(self, out, compression):
+        self.out = out
+        self.compressor = compressobj(compression)
+
+    def write(self, data):
+        self.out.write(self.compressor.compress(data))
+
+    def close(self):
+        self.out.write(self.compressor.flush())
+        self.out.flush()
+
+
+class DecompressedReader(object):
+    # read-only file object that decompresses what read_data(size) returns,
+    # returning whatever has arrived rather than waiting for more
+    def __init__(self, read_data):
+        self.read_data = read_data
+        self.buf = ''
+        self.decompressor = None
+
+    def read(self, size):
+        while len(self.buf) < size:
+            data = self.read_data(1 << 16)
+            if not data:
+                break
+
+            if self.decompressor is None:
+                compression = 'zstd' if data.startswith(
+                    MAGIC_BYTES['zstd']) else 'gzip'
+                self.decompressor = decompressobj(compression)
+
+            self.buf += self.decompressor.decompress(data)
+
+        ret = self.buf[:size]
+        self.buf = self.buf[size:]
+        return ret
+
+
+def pack(log_paths, compression, out=sys.stdout):
+    # write log_paths to out in a compressed tar stream in order
+    writer = CompressedWriter(out, compression)
+    tar = tarfile.open(fileobj=writer, mode='w|')
+
+    for log_path in log_paths:
+        if not path.isfile(log_path):
+            sys.stderr.write('log_transfer: %s does not exist\n' % log_path)
+            continue
+        tar.add(log_path, arcname=path.basename(log_path))
+
+    tar.close()
+    writer.close()
+
+
+def download(ssh_cmd, remote_log_transfer, logs, compression=None):
+    # download logs, pairs of remote and local paths, over ssh_cmd by
+    # running remote_log_transfer on the remote side; yield the local paths
+    # one by one as soon as they are written
+    if compression is None:
+        compression = local_compression()
+
+    cmd = ssh_cmd + ['python', remote_log_transfer,
+                     '--compression', compression]
+    cmd += [remote for remote, _ in logs]
+
+    sys.stderr.write('$ %s\n' % ' '.join(cmd))
+    proc = Popen(cmd, stdout=PIPE)
+    fd = proc.stdout.fileno()
+
+    try:
+        for local_path in unpack(lambda size: os.read(fd, size), logs):
+            yield local_path
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            sys.stderr.write('Failed to download logs: "%s" exited with %d\n'
+                             % (' '.join(cmd), proc.returncode))
+
+
+def unpack(read_data, logs):
+    # unpack the compressed tar stream that read_data(size) returns into the
+    # local paths of logs, pairs of remote and local paths; yield the local
+    # paths one by one as soon as they are written
+    local_paths = dict((path.basename(remote), local)
+                       for remote, local in logs)
+
+    try:
+        tar = tarfile.open(fileobj=DecompressedReader(read_data), mode='r|')
+        for member in tar:
+            local_path = local_paths.get(member.name)
+            if local_path is None or not member.isfile():
+                continue
+
+            src = tar.extractfile(member)
+            with open(local_path, 'wb') as dst:
+                while True:
+                    data = src.read(1 << 20)
+                    if not data:
+                        break
+                    dst.write(data)
+
+            yield local_path
+    except Exception as exception:  # e.g., tar, zlib or zstd errors
+        # stop at a broken stream, as merge_logs() may consume this in a
+        # thread of its pool
+        sys.stderr.write('Failed to download logs: %s\n' % exception)
+
+
+def download_all(ssh_cmd, remote_log_transfer, logs):
+    # download logs as above, and raise IOError unless all of them arrived
+    downloaded = list(download(ssh_cmd, remote_log_transfer, logs))
+    if len(downloaded) != len(logs):
+        raise IOError('downloaded %d of %d logs' % (len(downloaded),
+                                                    len(logs)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='write logs to stdout in a compressed tar stream')
+    parser.add_argument('--compression', choices=['zstd', 'gzip'],
+                        default='gzip')
+    parser.add_argument('logs', nargs='+', help='logs to write')
+    args = parser.parse_args()
+
+    pack(args.logs, args.compression)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,29 @@
 
 import sys
 import argparse
-import heapq
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from collections import deque, OrderedDict
+import numpy as np
+
+import context
+from helpers import tunnel_log
+from helpers.compression import open_file, compression_by_extension
+
+
+# packets sent more than this many milliseconds ago are forgotten, so single
+# mode keeps at most the packets sent in that time in memory; packets that
+# leave the tunnel later are counted as lost, with a warning (or fail the
+# merge if strict)
+MAX_DELAY = 60000
+
+# single mode prunes its record of sent packets when it grows beyond this
+SENT_PRUNE_LEN = 1 << 16
+
+
+class MergeError(Exception):
+    pass
 
 
 def parse_arguments():
@@ -22,13 +44,27 @@ def parse_arguments():
         required=True, help='egress log of a tunnel')
     single_parser.add_argument(
         '-o', action='store', metavar='OUTPUT-LOG', dest='output_log',
-        required=True, help='tunnel log after merging')
+        required=True, help='tunnel log after merging (compressed with '
+        'gzip, zstd or lz4 if ending in .gz, .zst or .lz4)')
     single_parser.add_argument(
         '-i-clock-offset', metavar='MS', type=float,
         help='clock offset on the end where ingress log is saved')
     single_parser.add_argument(
         '-e-clock-offset', metavar='MS', type=float,
         help='clock offset on the end where egress log is saved')
+    single_parser.add_argument(
+        '--max-delay', metavar='MS', type=float, default=MAX_DELAY,
+        help='forget packets sent more than this many milliseconds ago, '
+        'which bounds the memory used to the packets sent in that time; '
+        'packets that leave the tunnel later are counted as lost, with a '
+        'warning (default %d)' % MAX_DELAY)
+    single_parser.add_argument(
+        '--strict', action='store_true',
+        help='fail the merge on a packet that leaves the tunnel after '
+        '--max-delay or with a uid that never came into it')
+    single_parser.add_argument(
+        '--binary', action='store_true',
+        help='save the output log in the binary columnar format')
 
     # subparser for multiple mode
     multiple_parser = subparsers.add_parser(
@@ -41,7 +77,22 @@ def parse_arguments():
         help='one or more tunnel logs generated by single mode')
     multiple_parser.add_argument(
         '-o', action='store', metavar='OUTPUT-LOG', dest='output_log',
-        required=True, help='output log after merging')
+        required=True, help='output log after merging (compressed with '
+        'gzip, zstd or lz4 if ending in .gz, .zst or .lz4)')
+    multiple_parser.add_argument(
+        '--binary', action='store_true',
+        help='save the output log in the binary columnar format')
+
+    # subparser for convert mode
+    convert_parser = subparsers.add_parser(
+        'convert', help='convert a text tunnel log into the binary columnar '
+        'format')
+    convert_parser.add_argument(
+        '-i', action='store', metavar='INPUT-LOG', dest='input_log',
+        required=True, help='text tunnel log to convert')
+    convert_parser.add_argument(
+        '-o', action='store', metavar='OUTPUT-LOG', dest='output_log',
+        required=True, help='binary tunnel log to save as')
 
     return parser.parse_args()
 
@@ -51,86 +102,180 @@ def parse_line(line):
     return (float(ts), int(uid), int(size))
 
 
-def single_mode(args):
-    recv_log = open(args.ingress_log)
-    send_log = open(args.egress_log)
-    output_log = open(args.output_log, 'w')
+def check_output_log(output_log_path, binary):
+    if binary and compression_by_extension(output_log_path) is not None:
+        raise MergeError('Error: binary tunnel logs cannot be compressed')
+
+
+def merge_single(ingress_log_path, egress_log_path, output_log_path,
+                 i_clock_offset=None, e_clock_offset=None,
+                 max_delay=MAX_DELAY, binary=False, strict=False):
+    # merge the ingress log and egress log of a single tunnel into a tunnel
+    # log; clock offsets and max delay are in milliseconds
+    check_output_log(output_log_path, binary)
+    if max_delay <= 0:
+        raise MergeError('Error: max delay must be positive')
+
+    recv_log = open_file(ingress_log_path)
+    send_log = open_file(egress_log_path)
 
     # retrieve initial timestamp of sender from the first line
     line = send_log.readline()
     if not line:
-        sys.exit('Warning: egress log is empty\n')
+        raise MergeError('Warning: egress log is empty')
 
     send_init_ts = float(line.rsplit(':', 1)[-1])
-    if args.e_clock_offset is not None:
-        send_init_ts += args.e_clock_offset
+    if e_clock_offset is not None:
+        send_init_ts += e_clock_offset
 
     min_init_ts = send_init_ts
 
     # retrieve initial timestamp of receiver from the first line
     line = recv_log.readline()
     if not line:
-        sys.exit('Warning: ingress log is empty\n')
+        raise MergeError('Warning: ingress log is empty')
 
     recv_init_ts = float(line.rsplit(':', 1)[-1])
-    if args.i_clock_offset is not None:
-        recv_init_ts += args.i_clock_offset
+    if i_clock_offset is not None:
+        recv_init_ts += i_clock_offset
 
     if recv_init_ts < min_init_ts:
         min_init_ts = recv_init_ts
 
-    output_log.write('# init timestamp: %.3f\n' % min_init_ts)
+    if binary:
+        output_log = tunnel_log.BinaryLogWriter(output_log_path, min_init_ts)
+    else:
+        output_log = open_file(output_log_path, 'w')
+        output_log.write('# init timestamp: %.3f\n' % min_init_ts)
 
     # timestamp calibration to ensure non-negative timestamps
     send_cal = send_init_ts - min_init_ts
     recv_cal = recv_init_ts - min_init_ts
 
-    # construct a hash table using uid as keys
-    send_pkts = {}
-    for line in send_log:
+    # join the two sorted logs in a single pass: packets read from the egress
+    # log stay in 'in_flight', by uid in the order they were sent, until
+    # matched by uid in the ingress log or sent more than max delay ago;
+    # packets in the egress log that are read ahead to find a match wait in
+    # 'read_ahead' to be merged
+    in_flight = OrderedDict()
+    read_ahead = deque()
+
+    # uids, timestamps and sizes of the packets sent in (at least) the last
+    # max delay, in arrays rather than objects, to pair a packet that leaves
+    # twice again as the table of all sent packets used to; uids increase in
+    # the order that mm-tunnel sends packets
+    sent = (array('l'), array('d'), array('l'))
+    sent_prune_len = SENT_PRUNE_LEN
+
+    def find_sent(uid):
+        i = bisect_left(sent[0], uid)
+        if i < len(sent[0]) and sent[0][i] == uid:
+            return (sent[1][i], sent[2][i])
+        return None
+
+    # packets that left after max delay or were never sent
+    unpaired = 0
+
+    # a lower bound of the timestamp of the oldest packet in flight, to look
+    # it up only when it may have been sent more than max delay ago
+    oldest_ts = float('-inf')
+
+    def read_send_pkt():
+        line = send_log.readline()
+        if not line:
+            return None
+
         (send_ts, send_uid, send_size) = parse_line(line)
-        send_pkts[send_uid] = (send_ts + send_cal, send_size)
+        send_pkt = (send_ts + send_cal, send_uid, send_size)
+        in_flight[send_uid] = (send_pkt[0], send_size)
+        sent[0].append(send_uid)
+        sent[1].append(send_pkt[0])
+        sent[2].append(send_size)
+        return send_pkt
 
-    send_log.seek(0)
-    send_log.readline()
+    def next_send_pkt():
+        if read_ahead:
+            return read_ahead.popleft()
+        return read_send_pkt()
 
-    # merge two sorted logs into one
-    send_l = send_log.readline()
-    if send_l:
-        (send_ts, send_uid, send_size) = parse_line(send_l)
+    send_pkt = next_send_pkt()
 
     recv_l = recv_log.readline()
     if recv_l:
         (recv_ts, recv_uid, recv_size) = parse_line(recv_l)
 
-    while send_l or recv_l:
-        if send_l:
-            send_ts_cal = send_ts + send_cal
+    # merge two sorted logs into one
+    while send_pkt or recv_l:
         if recv_l:
             recv_ts_cal = recv_ts + recv_cal
 
-        if (send_l and recv_l and send_ts_cal <= recv_ts_cal) or not recv_l:
-            output_log.write('%.3f + %s\n' % (send_ts_cal, send_size))
-            send_l = send_log.readline()
-            if send_l:
-                (send_ts, send_uid, send_size) = parse_line(send_l)
-        elif (send_l and recv_l and send_ts_cal > recv_ts_cal) or not send_l:
-            if recv_uid in send_pkts:
-                (paired_send_ts, paired_send_size) = send_pkts[recv_uid]
+        if (send_pkt and recv_l and send_pkt[0] <= recv_ts_cal) or not recv_l:
+            (send_ts_cal, send_uid, send_size) = send_pkt
+            if binary:
+                output_log.write(send_ts_cal, tunnel_log.ARRIVAL, send_size,
+                                 uid=send_uid)
+            else:
+                output_log.write('%.3f + %s\n' % (send_ts_cal, send_size))
+            send_pkt = next_send_pkt()
+        else:
+            # forget the packets sent more than max delay ago
+            if recv_ts_cal - oldest_ts > max_delay:
+                while in_flight:
+                    oldest_ts = next(in_flight.itervalues())[0]
+                    if recv_ts_cal - oldest_ts <= max_delay:
+                        break
+                    in_flight.popitem(last=False)
+
+            if len(sent[1]) > sent_prune_len:
+                pruned = bisect_left(sent[1], recv_ts_cal - max_delay)
+                for column in sent:
+                    del column[:pruned]
+                sent_prune_len = max(2 * len(sent[1]), SENT_PRUNE_LEN)
+
+            # a packet may leave before it arrives due to clock offsets (of
+            # less than max delay)
+            if recv_uid not in in_flight and find_sent(recv_uid) is None:
+                while recv_uid not in in_flight:
+                    read_ahead_pkt = read_send_pkt()
+                    if not read_ahead_pkt:
+                        break
+                    read_ahead.append(read_ahead_pkt)
+                    if read_ahead_pkt[0] - recv_ts_cal > max_delay:
+                        break
+
+            # a packet that leaves twice is no longer in flight the second
+            # time
+            paired_send = in_flight.pop(recv_uid, None)
+            if paired_send is None:
+                paired_send = find_sent(recv_uid)
+
+            if (paired_send is not None and
+                    abs(recv_ts_cal - paired_send[0]) > max_delay):
+                paired_send = None
+
+            if paired_send is None:
+                # nonexistent packet, or delayed for longer than max delay
+                if strict:
+                    raise MergeError('Warning: received a packet with '
+                                     'nonexistent uid %s or delay over %s ms'
+                                     % (recv_uid, max_delay))
+                unpaired += 1
+            else:
+                (paired_send_ts, paired_send_size) = paired_send
                 # inconsistent packet size
                 if paired_send_size != recv_size:
-                    sys.exit(
+                    raise MergeError(
                         'Warning: packet %s came into tunnel with size %s '
-                        'but left with size %s\n' %
+                        'but left with size %s' %
                         (recv_uid, paired_send_size, recv_size))
-            else:
-                # nonexistent packet
-                sys.exit('Warning: received a packet with nonexistent '
-                         'uid %s\n' % recv_uid)
 
-            delay = recv_ts_cal - paired_send_ts
-            output_log.write('%.3f - %s %.3f\n'
-                             % (recv_ts_cal, recv_size, delay))
+                delay = recv_ts_cal - paired_send_ts
+                if binary:
+                    output_log.write(recv_ts_cal, tunnel_log.DEPARTURE,
+                                     recv_size, delay, uid=recv_uid)
+                else:
+                    output_log.write('%.3f - %s %.3f\n'
+                                     % (recv_ts_cal, recv_size, delay))
             recv_l = recv_log.readline()
             if recv_l:
                 (recv_ts, recv_uid, recv_size) = parse_line(recv_l)
@@ -139,137 +284,257 @@ def single_mode(args):
     send_log.close()
     output_log.close()
 
+    warn_unpaired(unpaired, ingress_log_path, max_delay)
 
-def push_to_heap(heap, index, log_file, init_ts_delta):
-    line = None
-
-    while True:
-        line = log_file.readline()
-        if not line:
-            break
-
-        if line.startswith('#'):
-            continue
 
-        # if log_file is mm-link-log
-        if index == -1:
-            # find the next delivery opportunity
-            if '#' in line:
-                break
-        else:
-            break
+def warn_unpaired(unpaired, ingress_log_path, max_delay):
+    if unpaired > 0:
+        sys.stderr.write(
+            'Warning: %d packets in %s left the tunnel with nonexistent uids '
+            'or delays over %s ms, and were counted as lost\n'
+            % (unpaired, ingress_log_path, max_delay))
 
-    if line:
-        line_list = line.strip().split()
-        calibrated_ts = float(line_list[0]) + init_ts_delta
 
-        line_list[0] = '%.3f' % calibrated_ts
-        if line_list[1] == '#':
-            line_list[2] = str(int(line_list[2]) - 4)
-        line = ' '.join(line_list)
-        heapq.heappush(heap, (calibrated_ts, index, line))
+def join_events(ingress_log_path, egress_log_path, i_clock_offset=None,
+                e_clock_offset=None, max_delay=MAX_DELAY, strict=False):
+    # join the ingress log and egress log of a single tunnel as arrays; return
+    # the init timestamp and Events of the tunnel log that merge_single()
+    # would save, with timestamps and delays rounded as in text logs
+    send_init_ts, (send_ts, send_uid, send_size) = (
+        tunnel_log.load_packet_log(egress_log_path))
+    if send_init_ts is None:
+        raise MergeError('Warning: egress log is empty')
+    if e_clock_offset is not None:
+        send_init_ts += e_clock_offset
 
-    return line
+    recv_init_ts, (recv_ts, recv_uid, recv_size) = (
+        tunnel_log.load_packet_log(ingress_log_path))
+    if recv_init_ts is None:
+        raise MergeError('Warning: ingress log is empty')
+    if i_clock_offset is not None:
+        recv_init_ts += i_clock_offset
 
+    # timestamp calibration to ensure non-negative timestamps
+    min_init_ts = min(send_init_ts, recv_init_ts)
+    send_ts = send_ts + (send_init_ts - min_init_ts)
+    recv_ts = recv_ts + (recv_init_ts - min_init_ts)
+
+    # find the packet that came into the tunnel for every packet that left
+    order = np.argsort(send_uid, kind='mergesort')
+    paired = np.searchsorted(send_uid[order], recv_uid)
+    paired = order[np.minimum(paired, max(len(order) - 1, 0))]
+
+    nonexistent = np.ones(len(recv_uid), dtype=bool)
+    if len(order) > 0:
+        nonexistent = send_uid[paired] != recv_uid
+        nonexistent |= np.abs(recv_ts - send_ts[paired]) > max_delay
+    if nonexistent.any():
+        if strict:
+            raise MergeError('Warning: received a packet with nonexistent '
+                             'uid %s or delay over %s ms'
+                             % (recv_uid[nonexistent.argmax()], max_delay))
+
+        # count them as lost as merge_single() does
+        warn_unpaired(int(nonexistent.sum()), ingress_log_path, max_delay)
+        kept = ~nonexistent
+        recv_ts, recv_uid, recv_size, paired = (
+            recv_ts[kept], recv_uid[kept], recv_size[kept], paired[kept])
+
+    inconsistent = send_size[paired] != recv_size
+    if inconsistent.any():
+        i = inconsistent.argmax()
+        raise MergeError(
+            'Warning: packet %s came into tunnel with size %s '
+            'but left with size %s' %
+            (recv_uid[i], send_size[paired[i]], recv_size[i]))
+
+    arrivals = tunnel_log.Events(
+        ts=send_ts,
+        event=np.full(len(send_ts), tunnel_log.ARRIVAL, dtype=np.uint8),
+        size=send_size, delay=np.full(len(send_ts), np.nan),
+        flow=np.zeros(len(send_ts), dtype=np.int64), uid=send_uid)
+    departures = tunnel_log.Events(
+        ts=recv_ts,
+        event=np.full(len(recv_ts), tunnel_log.DEPARTURE, dtype=np.uint8),
+        size=recv_size, delay=np.around(recv_ts - send_ts[paired], 3),
+        flow=np.zeros(len(recv_ts), dtype=np.int64), uid=recv_uid)
+
+    # merge two sorted logs into one; packets come in before others leave
+    # at the same time
+    events = tunnel_log.concatenate_events([arrivals, departures])
+    order = np.argsort(events.ts, kind='mergesort')
+    events = tunnel_log.Events(*[column[order] for column in events])
+    events = events._replace(ts=np.around(events.ts, 3))
+
+    # the init timestamp is rounded as in the header of text logs
+    return float('%.3f' % min_init_ts), events
+
+
+def load_link_events(link_log_path):
+    # return the init timestamp and delivery opportunities of a mm-link log,
+    # with 4 bytes taken off the size of every opportunity as in text logs
+    link_init_ts, link_events = tunnel_log.load_events(link_log_path)
+    if link_init_ts is None:
+        raise MergeError('Warning: link log %s is empty' % link_log_path)
+
+    # only keep delivery opportunities
+    is_opp = link_events.event == tunnel_log.OPPORTUNITY
+    if not is_opp.any():
+        raise MergeError('Warning: no delivery opportunities found')
+
+    link_events = tunnel_log.Events(
+        *[column[is_opp] for column in link_events])
+    return link_init_ts, link_events._replace(size=link_events.size - 4)
+
+
+def merge_events(tunnel_events, link_events=None):
+    # merge a list of (init timestamp, Events) of tunnels, and optionally of
+    # the delivery opportunities in a mm-link log, into the init timestamp and
+    # Events of a single tunnel log with flow IDs
+    events_list = []
+    init_ts_list = []
+
+    if link_events is not None:
+        init_ts_list.append(link_events[0])
+        events_list.append(link_events[1])
+
+    for flow_id, (init_ts, events) in enumerate(tunnel_events, 1):
+        init_ts_list.append(init_ts)
+        events_list.append(events._replace(
+            flow=np.full(len(events.ts), flow_id, dtype=np.int64)))
+
+    # calibrate timestamps against the smallest initial timestamp; they are
+    # left unrounded until written, as when merging text logs line by line
+    min_init_ts = min(init_ts_list)
+    for i in xrange(len(events_list)):
+        events_list[i] = events_list[i]._replace(
+            ts=events_list[i].ts + (init_ts_list[i] - min_init_ts))
+
+    # sort by timestamp; ties are broken by the order of input logs
+    merged = tunnel_log.concatenate_events(events_list)
+    order = np.argsort(merged.ts, kind='mergesort')
+    return min_init_ts, tunnel_log.Events(*[column[order]
+                                            for column in merged])
+
+
+def join_and_merge_events(joins, link_log_path=None):
+    # join the ingress and egress logs of every tunnel, given as keyword
+    # arguments of join_events(), and merge them in memory; return the init
+    # timestamp and Events of the tunnel log that merge_multiple() would save
+    link_events = None
+    if link_log_path:
+        link_events = load_link_events(link_log_path)
+
+    tunnel_events = []
+    for kwargs in joins:
+        init_ts, events = join_events(**kwargs)
+        if len(events.ts) == 0:
+            raise MergeError(
+                'Warning: %s and %s do not contain any arrival or departure '
+                'events' % (kwargs['ingress_log_path'],
+                            kwargs['egress_log_path']))
+
+        tunnel_events.append((init_ts, events))
+
+    min_init_ts, merged = merge_events(tunnel_events, link_events)
+    return min_init_ts, merged._replace(ts=np.around(merged.ts, 3))
+
+
+def merge_multiple(tunnel_log_paths, output_log_path, link_log_path=None,
+                   binary=False):
+    # merge the tunnel logs of one or more tunnels, and optionally the log of
+    # mm-link, into a single tunnel log with flow IDs; input logs can be in
+    # either text or binary format
+    check_output_log(output_log_path, binary)
+
+    link_events = None
+    if link_log_path:
+        link_events = load_link_events(link_log_path)
+
+    tunnel_events = []
+    for tun_log_name in tunnel_log_paths:
+        init_ts, events = tunnel_log.load_events(tun_log_name)
+        if init_ts is None:
+            raise MergeError(
+                'Warning: tunnel log %s is empty' % tun_log_name)
+
+        if not np.in1d(events.event, [tunnel_log.ARRIVAL,
+                                      tunnel_log.DEPARTURE]).any():
+            raise MergeError(
+                'Warning: %s does not contain any arrival or '
+                'departure events' % tun_log_name)
 
-def multiple_mode(args):
-    # open log files
-    link_log = None
-    if args.link_log:
-        link_log = open(args.link_log)
-
-    tun_logs = []
-    for tun_log_name in args.tunnel_logs:
-        tun_logs.append(open(tun_log_name))
-
-    output_log = open(args.output_log, 'w')
-
-    # maintain a min heap to merge sorted logs
-    heap = []
-    if link_log:
-        # find initial timestamp in the mm-link log
-        while True:
-            line = link_log.readline()
-            if not line:
-                sys.exit('Warning: link log %s is empty' % link_log.name)
-
-            if not line.startswith('# init timestamp'):
-                continue
+        tunnel_events.append((init_ts, events))
 
-            link_init_ts = float(line.split(':')[1])
-            min_init_ts = link_init_ts
-            break
+    min_init_ts, merged = merge_events(tunnel_events, link_events)
+    if binary:
+        tunnel_log.write_binary(output_log_path, min_init_ts, merged)
     else:
-        min_init_ts = 1e20
-
-    # find the smallest initial timestamp
-    init_ts_delta = []
-    for tun_log in tun_logs:
-        while True:
-            line = tun_log.readline()
-            if not line:
-                sys.exit('Warning: tunnel log %s is empty' % tun_log.name)
+        tunnel_log.write_text(output_log_path, min_init_ts, merged)
 
-            if not line.startswith('# init timestamp'):
-                continue
 
-            init_ts = float(line.split(':')[1])
-            init_ts_delta.append(init_ts)
-            if init_ts < min_init_ts:
-                min_init_ts = init_ts
-            break
+def convert(input_log_path, output_log_path):
+    # convert a text tunnel log into the binary columnar format
+    check_output_log(output_log_path, True)
 
-    if link_log:
-        link_init_ts_delta = link_init_ts - min_init_ts
+    init_ts, events = tunnel_log.load_events(input_log_path)
+    if init_ts is None:
+        raise MergeError('Warning: %s has no init timestamp' % input_log_path)
 
-    for i in xrange(len(init_ts_delta)):
-        init_ts_delta[i] -= min_init_ts
+    tunnel_log.write_binary(output_log_path, init_ts, events)
 
-    output_log.write('# init timestamp: %.3f\n' % min_init_ts)
 
-    # build the min heap
-    if link_log:
-        line = push_to_heap(heap, -1, link_log, link_init_ts_delta)
-        if not line:
-            sys.exit('Warning: no delivery opportunities found\n')
+def run_merge(merge):
+    # run a merge, i.e., a merge function and its keyword arguments; return
+    # None on success or the error message otherwise
+    merge_func, kwargs = merge
 
-    for i in xrange(len(tun_logs)):
-        line = push_to_heap(heap, i, tun_logs[i], init_ts_delta[i])
-        if not line:
-            sys.exit(
-                'Warning: %s does not contain any arrival or '
-                'departure events\n' % tun_logs[i].name)
+    try:
+        merge_func(**kwargs)
+    except (MergeError, IOError, ValueError) as exception:
+        return str(exception)
 
-    # merge all log files
-    while heap:
-        (ts, index, line) = heapq.heappop(heap)
+    return None
 
-        # append flow ids to arrival and departure events
-        if index != -1:
-            line += ' %s' % (index + 1)
 
-        output_log.write(line + '\n')
+def merge_logs(merges, processes=None):
+    # run independent merges on a pool of (by default, one per CPU)
+    # processes; merges may also be an iterator that yields merges as soon
+    # as their logs are ready, which is consumed while earlier merges run.
+    # Return the error messages of the failed merges.
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if isinstance(merges, list):
+        processes = min(processes, len(merges))
 
-        if index == -1:
-            push_to_heap(heap, index, link_log, link_init_ts_delta)
-        else:
-            push_to_heap(heap, index, tun_logs[index], init_ts_delta[index])
+    if processes <= 1:
+        errors = map(run_merge, merges)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            errors = list(pool.imap(run_merge, merges))
+        finally:
+            pool.close()
+            pool.join()
 
-    # close log files
-    if link_log:
-        link_log.close()
-    for tun_log in tun_logs:
-        tun_log.close()
-    output_log.close()
+    return [error for error in errors if error is not None]
 
 
 def main():
     args = parse_arguments()
 
-    if args.mode == 'single':
-        single_mode(args)
-    else:
-        multiple_mode(args)
+    try:
+        if args.mode == 'single':
+            merge_single(args.ingress_log, args.egress_log, args.output_log,
+                         args.i_clock_offset, args.e_clock_offset,
+                         args.max_delay, args.binary, args.strict)
+        elif args.mode == 'multiple':
+            merge_multiple(args.tunnel_logs, args.output_log, args.link_log,
+                           args.binary)
+        else:
+            convert(args.input_log, args.output_log)
+    except MergeError as exception:
+        sys.exit(str(exception))
 
 
 if __name__ == '__main__':
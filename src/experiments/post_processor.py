@@ -0,0 +1,106 @@
+import os
+from os import path
+import sys
+import time
+import threading
+import multiprocessing
+
+import merge_tunnel_logs
+import context
+from helpers import utils, timeline
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import tunnel_graph
+
+
+# niceness of the worker processes so that they yield to running tests
+POST_PROCESS_NICENESS = 10
+
+
+def init_worker(cpus):
+    os.nice(POST_PROCESS_NICENESS)
+    if cpus:
+        utils.pin_to_cpus(os.getpid(), cpus)
+
+
+def post_process_run(merge_stages, graphs, run_timeline=None,
+                     span_args=None):
+    # merge the tunnel logs of a run stage by stage (the merges in a stage
+    # are independent), and then parse the merged logs and plot their graphs;
+    # parsed results are cached and graphs marked next to the logs for
+    # plot.py to reuse.
+    # Time both in run_timeline with span_args, if any. Return the error
+    # messages.
+    def span(phase):
+        if run_timeline is None:
+            return timeline.NoSpan()
+        return run_timeline.span(phase, **(span_args or {}))
+
+    errors = []
+    with span('post-process merge'):
+        for merges in merge_stages:
+            # worker processes cannot have their own pools
+            errors += merge_tunnel_logs.merge_logs(merges, processes=1)
+
+    with span('post-process analysis'):
+        for log_path, throughput_graph, delay_graph in graphs:
+            try:
+                tunnel_graph.TunnelGraph(
+                    tunnel_log=log_path,
+                    throughput_graph=throughput_graph,
+                    delay_graph=delay_graph,
+                    cache=True,
+                    mark_graphs=True).run()
+            except Exception as exception:
+                errors.append('tunnel_graph %s: %s' % (log_path, exception))
+
+    return errors
+
+
+class PostProcessor(object):
+    # merge and analyze the logs of finished runs in a pool of low-priority
+    # worker processes, pinned to cpus (if any), while the next runs
+    # execute. Runs may be submitted from any process forked after this one
+    # was created, e.g., tests run in parallel; they are sent through a
+    # queue to a thread that hands them to the pool. Post-processing is
+    # timed in run_timeline, if any.
+    def __init__(self, processes, cpus=None, run_timeline=None):
+        self.pool = multiprocessing.Pool(processes, init_worker, (cpus,))
+        self.queue = multiprocessing.Queue()
+        self.results = []
+        self.timeline = run_timeline
+
+        self.dispatcher = threading.Thread(target=self.dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def dispatch(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            name, merge_stages, graphs, span_args = job
+            self.results.append((name, self.pool.apply_async(
+                post_process_run,
+                (merge_stages, graphs, self.timeline, span_args))))
+
+    def submit(self, name, merge_stages, graphs, span_args=None):
+        self.queue.put((name, merge_stages, graphs, span_args))
+
+    def finish(self):
+        # wait for all the submitted runs to be post-processed
+        start_time = time.time()
+
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.pool.close()
+
+        for name, result in self.results:
+            for error in result.get():
+                sys.stderr.write('Error in post-processing %s: %s\n'
+                                 % (name, error))
+        self.pool.join()
+
+        sys.stderr.write('Post-processed %d runs, %.2f seconds after the '
+                         'last run\n'
+                         % (len(self.results), time.time() - start_time))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import json
+import Queue
+import base64
+import threading
+from subprocess import PIPE, CalledProcessError
+
+import context
+from helpers import utils
+from helpers.subprocess_wrappers import Popen, check_output
+import log_transfer
+
+
+# The remote agent is started on the remote side once per campaign of tests
+# and drives it for the local side: requests and replies are JSON objects,
+# one per line, over the stdin and stdout of a single ssh session, and the
+# replies to a request carry its ID. RemoteAgent is the local side.
+
+# seconds to wait for the reply to a request that has a single reply
+REQUEST_TIMEOUT = 60
+
+
+class Agent(object):
+    # serve requests from stdin until it is closed or told to exit, and stop
+    # whatever is still running then
+    def __init__(self):
+        self.write_lock = threading.Lock()
+        self.managers = {}
+        self.forwarders = []
+
+    def send(self, reply):
+        line = json.dumps(reply) + '\n'
+        with self.write_lock:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+    def run(self):
+        sys.stdout.write('remote agent is running\n')
+        sys.stdout.flush()
+
+        try:
+            for line in iter(sys.stdin.readline, ''):
+                request = json.loads(line)
+                if request['cmd'] == 'exit':
+                    break
+                self.serve(request)
+        finally:
+            for manager in self.managers.itervalues():
+                utils.kill_proc_group(manager)
+            for thread in self.forwarders:
+                thread.join()
+
+    def serve(self, request):
+        cmd = request['cmd']
+
+        if cmd in ['git_summary', 'clock_offset', 'logs']:
+            # these take a while, so they do not hold up other requests
+            thread = threading.Thread(target=self.serve_in_thread,
+                                      args=(request,))
+            thread.daemon = True
+            thread.start()
+        elif cmd == 'tunnel_manager':
+            self.start_tunnel_manager(request['id'])
+        elif cmd == 'write':
+            manager = self.managers.get(request['channel'])
+            if manager is None:
+                return
+            try:
+                manager.stdin.write(request['data'])
+                manager.stdin.flush()
+            except IOError:
+                pass  # the end of its output is sent when it exits
+        elif cmd == 'kill':
+            utils.kill_proc_group(self.managers.pop(request['channel'], None))
+        else:
+            self.send({'id': request['id'],
+                       'error': 'unknown request: %s' % cmd})
+
+    def serve_in_thread(self, request):
+        req_id = request['id']
+        cmd = request['cmd']
+
+        try:
+            if cmd == 'git_summary':
+                git_summary_src = path.join(context.src_dir, 'experiments',
+                                            'git_summary.sh')
+                output = check_output(git_summary_src, cwd=context.base_dir)
+                self.send({'id': req_id, 'output': output})
+            elif cmd == 'clock_offset':
+                # the local side parses the output as for ntpdate over ssh
+                try:
+                    output = check_output(utils.ntpdate_cmd(
+                        request['ntp_addr']))
+                    returncode = 0
+                except CalledProcessError as e:
+                    output, returncode = e.output, e.returncode
+                self.send({'id': req_id, 'output': output,
+                           'returncode': returncode})
+            elif cmd == 'logs':
+                log_transfer.pack(request['logs'], request['compression'],
+                                  ChunkWriter(self, req_id))
+                self.send({'id': req_id, 'eof': True})
+        except Exception as e:  # e.g., missing commands or broken pipes
+            self.send({'id': req_id, 'error': str(e), 'eof': True})
+
+    def start_tunnel_manager(self, req_id):
+        tunnel_manager = path.join(context.src_dir, 'experiments',
+                                   'tunnel_manager.py')
+        manager = Popen(['python', tunnel_manager], stdin=PIPE, stdout=PIPE,
+                        preexec_fn=os.setsid)
+        self.managers[req_id] = manager
+
+        def forward_output():
+            for line in iter(manager.stdout.readline, ''):
+                self.send({'id': req_id, 'line': line})
+            self.send({'id': req_id, 'eof': True})
+
+        thread = threading.Thread(target=forward_output)
+        thread.daemon = True
+        thread.start()
+        self.forwarders.append(thread)
+
+
+class ChunkWriter(object):
+    # write-only file object that sends what is written in replies
+    def __init__(self, agent, req_id):
+        self.agent = agent
+        self.req_id = req_id
+
+    def write(self, data):
+        if data:
+            self.agent.send({'id': self.req_id,
+                             'data': base64.b64encode(data)})
+
+    def flush(self):
+        pass
+
+
+class RemoteAgent(object):
+    # the local side: send requests to the remote agent, and read its replies
+    # into a queue for every request in a thread, with None in the queues of
+    # requests still waiting when the remote agent exits
+    def __init__(self, proc):
+        self.proc = proc
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.queues = {}
+        self.exited = False
+
+        self.reader = threading.Thread(target=self.read_replies)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read_replies(self):
+        for line in iter(self.proc.stdout.readline, ''):
+            reply = json.loads(line)
+            with self.lock:
+                queue = self.queues.get(reply['id'])
+            if queue is not None:
+                queue.put(reply)
+
+        with self.lock:
+            self.exited = True
+            for queue in self.queues.itervalues():
+                queue.put(None)
+
+    def send(self, cmd, replies=True, **kwargs):
+        # send a request; return its ID and the queue of its replies
+        with self.lock:
+            if self.exited:
+                raise IOError('remote agent has exited')
+
+            self.last_id += 1
+            req_id = self.last_id
+            queue = None
+            if replies:
+                queue = Queue.Queue()
+                self.queues[req_id] = queue
+
+            request = dict(kwargs, id=req_id, cmd=cmd)
+            self.proc.stdin.write(json.dumps(request) + '\n')
+            self.proc.stdin.flush()
+
+        return req_id, queue
+
+    def done(self, req_id):
+        with self.lock:
+            self.queues.pop(req_id, None)
+
+    def request(self, cmd, **kwargs):
+        # send a request and return its only reply
+        req_id, queue = self.send(cmd, **kwargs)
+        try:
+            reply = queue.get(True, REQUEST_TIMEOUT)
+        except Queue.Empty:
+            raise IOError('remote agent did not reply to %s in %d seconds'
+                          % (cmd, REQUEST_TIMEOUT))
+        finally:
+            self.done(req_id)
+
+        if reply is None:
+            raise IOError('remote agent has exited')
+        if 'error' in reply:
+            raise IOError('remote agent failed to %s: %s'
+                          % (cmd, reply['error']))
+        return reply
+
+    def git_summary(self):
+        return self.request('git_summary')['output'].encode('utf-8')
+
+    def clock_offset(self, ntp_addr):
+        # the output of ntpdate on the remote side, as check_output() would
+        # return it
+        reply = self.request('clock_offset', ntp_addr=ntp_addr)
+        output = reply['output'].encode('utf-8')
+        if reply['returncode'] != 0:
+            raise CalledProcessError(reply['returncode'], 'ntpdate', output)
+        return output
+
+    def tunnel_manager(self):
+        # run a tunnel manager on the remote side
+        req_id, queue = self.send('tunnel_manager')
+        return RemoteProc(self, req_id, ReplyReader(queue, 'line'))
+
+    def download_logs(self, logs, compression=None):
+        # download logs, pairs of remote and local paths, in a compressed
+        # tar stream as log_transfer.download() does; yield the local paths
+        # one by one as soon as they are written
+        if compression is None:
+            compression = log_transfer.local_compression()
+
+        req_id, queue = self.send(
+            'logs', logs=[remote for remote, _ in logs],
+            compression=compression)
+        reader = ReplyReader(queue, 'data')
+
+        def read_data(size):
+            data = reader.next()
+            return '' if data is None else base64.b64decode(data)
+
+        try:
+            for local_path in log_transfer.unpack(read_data, logs):
+                yield local_path
+        finally:
+            self.done(req_id)
+
+    def close(self):
+        # tell the remote agent to exit, which stops what it still runs
+        try:
+            self.send('exit', replies=False)
+        except IOError:
+            pass
+
+        self.proc.stdin.close()
+        self.proc.wait()
+        self.reader.join()
+
+
+class ReplyReader(object):
+    # read the values of key in the replies to a request until its last one
+    def __init__(self, queue, key):
+        self.queue = queue
+        self.key = key
+        self.eof = False
+
+    def next(self):
+        # return the next value, or None after the last reply
+        if self.eof:
+            return None
+
+        reply = self.queue.get()
+        if reply is None or reply.get('eof'):
+            self.eof = True
+            if reply is not None and 'error' in reply:
+                sys.stderr.write('remote agent: %s\n' % reply['error'])
+            return None
+
+        return reply[self.key].encode('utf-8')
+
+
+class RemoteProc(object):
+    # a tunnel manager run by the remote agent, with stdin and stdout to use
+    # as those of the Popen object of a tunnel manager run over ssh
+    def __init__(self, agent, req_id, reader):
+        self.agent = agent
+        self.req_id = req_id
+        self.stdin = ChannelWriter(agent, req_id)
+        self.stdout = ChannelReader(reader)
+
+    def kill(self):
+        try:
+            self.agent.send('kill', replies=False, channel=self.req_id)
+        except IOError:
+            pass
+        self.agent.done(self.req_id)
+
+
+class ChannelWriter(object):
+    # what is written is sent to the stdin of a tunnel manager on flush()
+    def __init__(self, agent, req_id):
+        self.agent = agent
+        self.req_id = req_id
+        self.buf = ''
+
+    def write(self, data):
+        self.buf += data
+
+    def flush(self):
+        if self.buf:
+            self.agent.send('write', replies=False, channel=self.req_id,
+                            data=self.buf)
+            self.buf = ''
+
+
+class ChannelReader(object):
+    # lines of the stdout of a tunnel manager, and '' after it exited
+    def __init__(self, reader):
+        self.reader = reader
+
+    def readline(self):
+        line = self.reader.next()
+        return '' if line is None else line
+
+
+def start(r):
+    # start the remote agent over ssh with r returned by
+    # utils.parse_remote_path(); return None if it failed to start
+    cmd = r['ssh_cmd'] + ['python', r['remote_agent']]
+    proc = Popen(cmd, stdin=PIPE, stdout=PIPE)
+
+    if 'remote agent is running' not in proc.stdout.readline():
+        sys.stderr.write('Warning: failed to start the remote agent; running '
+                         'an ssh command for every remote operation\n')
+        proc.stdin.close()
+        proc.wait()
+        return None
+
+    return RemoteAgent(proc)
+
+
+def main():
+    Agent().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,16 @@ import arg_parser
 import context
 from helpers import utils
 from helpers.subprocess_wrappers import call, check_call, check_output
+from wrappers import registry
 
 
-def install_deps(cc_src):
-    deps = check_output([cc_src, 'deps']).strip()
+def install_deps(cc, cc_src):
+    # look cc up in the wrapper registry, and ask its wrapper otherwise
+    wrapper = registry.lookup(cc)
+    if wrapper is not None:
+        deps = wrapper.deps
+    else:
+        deps = check_output([cc_src, 'deps']).strip()
 
     if deps:
         if call('sudo apt-get -y install ' + deps, shell=True) != 0:
@@ -38,7 +44,7 @@ def setup(args):
 
         # install dependencies
         if args.install_deps:
-            install_deps(cc_src)
+            install_deps(cc, cc_src)
         else:
             # persistent setup across reboots
             if args.setup:
@@ -3,20 +3,39 @@
 import os
 from os import path
 import sys
+import json
 import time
 import uuid
 import random
 import signal
 import traceback
+import multiprocessing
 from subprocess import PIPE
-from collections import namedtuple
+from collections import namedtuple, deque
 
 import arg_parser
+import merge_tunnel_logs
+import post_processor
+import log_transfer
+import remote_agent
 import context
-from helpers import utils, kernel_ctl
+from helpers import utils, kernel_ctl, tunnel_log, journal, sweep
+from helpers import clock_offset, timeline, resource_sampler
+from helpers.compression import find_file
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import tunnel_graph
 from helpers.subprocess_wrappers import Popen, call
 
 
+# seconds for a tunnel client to connect before it is re-run, and the number
+# of times it is run at most
+TUNNEL_TIMEOUT = 20
+MAX_TUNNEL_RUNS = 3
+
+# seconds between checks of whether tests run in parallel have finished
+PARALLEL_POLL_INTERVAL = 0.5
+
+
 Flow = namedtuple('Flow', ['cc', # replace self.cc
                            'cc_src_local', # replace self.cc_src
                            'cc_src_remote', # replace self.r[cc_src]
@@ -25,17 +44,40 @@ Flow = namedtuple('Flow', ['cc', # replace self.cc
 
 
 class Test(object):
-    def __init__(self, args, run_id, cc):
+    def __init__(self, args, run_id, cc, pipeline=None, journal=None,
+                 agent=None, clock_offsets=None, timeline=None, cpus=None):
         self.mode = args.mode
         self.run_id = run_id
         self.cc = cc
         self.data_dir = path.abspath(args.data_dir)
 
+        # CPUs dedicated to this test if tests are run in parallel
+        self.cpus = cpus
+
+        # post-processor to merge and analyze logs in the background with,
+        # and the stages of merges left to it
+        self.pipeline = pipeline
+        self.merge_stages = []
+
+        # campaign journal to record the state of this run in
+        self.journal = journal
+
+        # timeline to record how long the phases of this run take in
+        self.timeline = timeline
+
+        # remote agent to drive the remote side with, or None to run an ssh
+        # command for every remote operation
+        self.agent = agent
+
         # shared arguments between local and remote modes
         self.flows = args.flows
         self.runtime = args.runtime
         self.interval = args.interval
         self.run_times = args.run_times
+        self.fused_merge = args.fused_merge
+        self.background_download = getattr(args, 'background_download', False)
+        self.save_merged_logs = not args.no_merged_logs
+        self.datalink_stats = None  # written to the stats log by fused merges
 
         # used for cleanup
         self.proc_first = None
@@ -72,6 +114,9 @@ class Test(object):
             self.local_ofst = None
             self.remote_ofst = None
 
+            # clock offsets shared by the runs of a campaign, if any
+            self.clock_offsets = clock_offsets
+
             self.r = utils.parse_remote_path(args.remote_path, self.cc)
 
         # arguments when there's a config
@@ -197,8 +242,13 @@ class Test(object):
             self.run_first = None
             self.run_second = None
 
-        # wait for 3 seconds until run_first is ready
-        self.run_first_setup_time = 3
+        # wait for at most a few seconds until run_first is ready
+        if self.test_config is None:
+            self.run_first_setup_time = utils.run_first_setup_time(self.cc)
+        else:
+            self.run_first_setup_time = max(
+                utils.run_first_setup_time(flow.cc)
+                for flow in self.flow_objs.itervalues())
 
         # setup output logs
         self.datalink_name = self.cc + '_datalink_run%d' % self.run_id
@@ -208,6 +258,8 @@ class Test(object):
             self.data_dir, self.datalink_name + '.log')
         self.acklink_log = path.join(
             self.data_dir, self.acklink_name + '.log')
+        self.resources_log = path.join(
+            self.data_dir, '%s_resources_run%d.log' % (self.cc, self.run_id))
 
         if self.flows > 0:
             self.prepare_tunnel_log_paths()
@@ -216,9 +268,14 @@ class Test(object):
             self.setup_mm_cmd()
         else:
             # record local and remote clock offset
-            if self.ntp_addr is not None:
-                self.local_ofst, self.remote_ofst = utils.query_clock_offset(
-                    self.ntp_addr, self.r['ssh_cmd'])
+            with self.span('clock offsets'):
+                if self.clock_offsets is not None:
+                    self.local_ofst, self.remote_ofst = (
+                        self.clock_offsets.get())
+                elif self.ntp_addr is not None:
+                    self.local_ofst, self.remote_ofst = (
+                        utils.query_clock_offset(
+                            self.ntp_addr, self.r['ssh_cmd'], self.agent))
 
     # test congestion control without running pantheon tunnel
     def run_without_tunnel(self):
@@ -229,9 +286,12 @@ class Test(object):
         sys.stderr.write('Running %s %s...\n' % (self.cc, self.run_first))
         self.proc_first = Popen(cmd, preexec_fn=os.setsid)
 
-        # sleep just in case the process isn't quite listening yet
-        # the cleaner approach might be to try to verify the socket is open
-        time.sleep(self.run_first_setup_time)
+        # wait until the process is listening on the port
+        if not utils.wait_for_port(port, [self.proc_first.pid],
+                                   self.run_first_setup_time):
+            sys.stderr.write('Warning: nothing listened on port %s after '
+                             '%.1f seconds\n'
+                             % (port, self.run_first_setup_time))
 
         self.test_start_time = utils.utc_time()
         # run the other side specified by self.run_second
@@ -269,8 +329,8 @@ class Test(object):
             ts_manager_cmd = ['python', self.tunnel_manager]
 
         sys.stderr.write('[tunnel server manager (tsm)] ')
-        self.ts_manager = Popen(ts_manager_cmd, stdin=PIPE, stdout=PIPE,
-                                preexec_fn=os.setsid)
+        self.ts_manager = self.start_tunnel_manager(
+            ts_manager_cmd, self.server_side)
         ts_manager = self.ts_manager
 
         while True:
@@ -293,8 +353,9 @@ class Test(object):
             tc_manager_cmd = self.mm_cmd + ['python', self.tunnel_manager]
 
         sys.stderr.write('[tunnel client manager (tcm)] ')
-        self.tc_manager = Popen(tc_manager_cmd, stdin=PIPE, stdout=PIPE,
-                                preexec_fn=os.setsid)
+        client_side = 'local' if self.server_side == 'remote' else 'remote'
+        self.tc_manager = self.start_tunnel_manager(
+            tc_manager_cmd, client_side)
         tc_manager = self.tc_manager
 
         while True:
@@ -308,7 +369,24 @@ class Test(object):
 
         return ts_manager, tc_manager
 
+    def start_tunnel_manager(self, cmd, side):
+        # run a tunnel manager with cmd, or through the remote agent if it
+        # runs on the remote side and there is one
+        if self.mode == 'remote' and side == 'remote' and self.agent:
+            sys.stderr.write('Running tunnel manager through remote agent\n')
+            return self.agent.tunnel_manager()
+
+        return Popen(cmd, stdin=PIPE, stdout=PIPE, preexec_fn=os.setsid)
+
+    def stop_tunnel_manager(self, manager):
+        if isinstance(manager, remote_agent.RemoteProc):
+            manager.kill()
+        else:
+            utils.kill_proc_group(manager)
+
     def run_tunnel_server(self, tun_id, ts_manager):
+        # ask ts_manager to run the tunnel server and reply the command to
+        # run the tunnel client
         if self.server_side == self.sender_side:
             ts_cmd = 'mm-tunnelserver --ingress-log=%s --egress-log=%s' % (
                 self.acklink_ingress_logs[tun_id],
@@ -328,17 +406,13 @@ class Test(object):
 
         ts_cmd = 'tunnel %s %s\n' % (tun_id, ts_cmd)
         ts_manager.stdin.write(ts_cmd)
-        ts_manager.stdin.flush()
 
         # read the command to run tunnel client
-        readline_cmd = 'tunnel %s readline\n' % tun_id
+        readline_cmd = 'tunnel %s readline %s\n' % (tun_id, TUNNEL_TIMEOUT)
         ts_manager.stdin.write(readline_cmd)
-        ts_manager.stdin.flush()
 
-        cmd_to_run_tc = ts_manager.stdout.readline().split()
-        return cmd_to_run_tc
-
-    def run_tunnel_client(self, tun_id, tc_manager, cmd_to_run_tc):
+    def tunnel_client_cmd(self, tun_id, cmd_to_run_tc):
+        # return the command for tc_manager to run the tunnel client
         if self.mode == 'local':
             cmd_to_run_tc[1] = '$MAHIMAHI_BASE'
         else:
@@ -368,44 +442,91 @@ class Test(object):
                 if self.remote_if is not None:
                     tc_cmd += ' --interface=' + self.remote_if
 
-        tc_cmd = 'tunnel %s %s\n' % (tun_id, tc_cmd)
-        readline_cmd = 'tunnel %s readline\n' % tun_id
-
-        # re-run tunnel client after 20s timeout for at most 3 times
-        max_run = 3
-        curr_run = 0
-        got_connection = ''
-        while 'got connection' not in got_connection:
-            curr_run += 1
-            if curr_run > max_run:
-                sys.stderr.write('Unable to establish tunnel\n')
-                return False
+        return 'tunnel %s %s\n' % (tun_id, tc_cmd)
 
-            tc_manager.stdin.write(tc_cmd)
-            tc_manager.stdin.flush()
-            while True:
-                tc_manager.stdin.write(readline_cmd)
-                tc_manager.stdin.flush()
+    def run_tunnels(self, ts_manager, tc_manager):
+        # run the tunnel servers and then the tunnel clients of all flows at
+        # once; return the commands that ran the tunnel clients, or None
+        start_time = time.time()
+
+        for tun_id in xrange(1, self.flows + 1):
+            self.run_tunnel_server(tun_id, ts_manager)
+        ts_manager.stdin.flush()
+
+        cmds_to_run_tc = {}
+        for tun_id in xrange(1, self.flows + 1):
+            cmd_to_run_tc = ts_manager.stdout.readline().split()
+            if len(cmd_to_run_tc) < 5:
+                sys.stderr.write('Tunnel server %s failed to start\n' % tun_id)
+                return None
+            cmds_to_run_tc[tun_id] = cmd_to_run_tc
 
-                signal.signal(signal.SIGALRM, utils.timeout_handler)
-                signal.alarm(20)
+        tc_cmds = {}
+        for tun_id in xrange(1, self.flows + 1):
+            tc_cmds[tun_id] = self.tunnel_client_cmd(
+                tun_id, cmds_to_run_tc[tun_id])
+
+        # re-run a tunnel client when it is not connected TUNNEL_TIMEOUT
+        # seconds after it ran, for at most MAX_TUNNEL_RUNS times; the tunnel
+        # manager enforces the deadline of each tunnel so all of them are
+        # waited for at the same time
+        runs = dict((tun_id, 0) for tun_id in tc_cmds)
+        deadlines = dict((tun_id, None) for tun_id in tc_cmds)
+        setup_latency = {}
+
+        pending = sorted(tc_cmds)
+        try:
+            while pending:
+                for tun_id in pending:
+                    if deadlines[tun_id] is None:
+                        runs[tun_id] += 1
+                        if runs[tun_id] > MAX_TUNNEL_RUNS:
+                            sys.stderr.write('Unable to establish tunnel %s\n'
+                                             % tun_id)
+                            return None
+
+                        tc_manager.stdin.write(tc_cmds[tun_id])
+                        deadlines[tun_id] = time.time() + TUNNEL_TIMEOUT
+
+                    timeout = max(deadlines[tun_id] - time.time(), 0)
+                    tc_manager.stdin.write('tunnel %s readline %.3f\n'
+                                           % (tun_id, timeout))
+                tc_manager.stdin.flush()
 
-                try:
+                # replies come in the order of the readline commands
+                still_pending = []
+                for tun_id in pending:
                     got_connection = tc_manager.stdout.readline()
-                    sys.stderr.write('Tunnel is connected\n')
-                except utils.TimeoutError:
-                    sys.stderr.write('Tunnel connection timeout\n')
-                    break
-                except IOError:
-                    sys.stderr.write('Tunnel client failed to connect to '
-                                     'tunnel server\n')
-                    return False
-                else:
-                    signal.alarm(0)
-                    if 'got connection' in got_connection:
-                        break
 
-        return True
+                    if 'got connection' in got_connection:
+                        setup_latency[tun_id] = time.time() - start_time
+                        self.record_span('tunnel handshake', start_time,
+                                         time.time(), tun_id=tun_id,
+                                         client_runs=runs[tun_id])
+                        sys.stderr.write('Tunnel %s is connected\n' % tun_id)
+                        continue
+
+                    # an empty line when there was no connection in time
+                    if not got_connection.strip():
+                        sys.stderr.write('Tunnel %s connection timeout\n'
+                                         % tun_id)
+                        deadlines[tun_id] = None
+                    still_pending.append(tun_id)
+
+                pending = still_pending
+        except IOError:
+            sys.stderr.write('Tunnel client failed to connect to '
+                             'tunnel server\n')
+            return None
+
+        sys.stderr.write('Set up %d tunnels in %.2f seconds\n'
+                         % (self.flows, time.time() - start_time))
+        for tun_id in sorted(setup_latency):
+            sys.stderr.write('  tunnel %s connected within %.2f seconds '
+                             '(client run %d times)\n'
+                             % (tun_id, setup_latency[tun_id], runs[tun_id]))
+
+        return cmds_to_run_tc
 
     def run_first_side(self, tun_id, send_manager, recv_manager,
                        send_pri_ip, recv_pri_ip):
@@ -427,8 +548,7 @@ class Test(object):
             second_cmd = 'tunnel %s python %s sender %s %s\n' % (
                 tun_id, second_src, recv_pri_ip, port)
 
-            recv_manager.stdin.write(first_cmd)
-            recv_manager.stdin.flush()
+            first_manager = recv_manager
         elif self.run_first == 'sender':  # self.run_first == 'sender'
             if self.mode == 'remote':
                 if self.sender_side == 'local':
@@ -443,8 +563,7 @@ class Test(object):
             second_cmd = 'tunnel %s python %s receiver %s %s\n' % (
                 tun_id, second_src, send_pri_ip, port)
 
-            send_manager.stdin.write(first_cmd)
-            send_manager.stdin.flush()
+            first_manager = send_manager
 
         # get run_first and run_second from the flow object
         else:
@@ -468,8 +587,7 @@ class Test(object):
                 second_cmd = 'tunnel %s python %s sender %s %s\n' % (
                     tun_id, second_src, recv_pri_ip, port)
 
-                recv_manager.stdin.write(first_cmd)
-                recv_manager.stdin.flush()
+                first_manager = recv_manager
             else:  # flow.run_first == 'sender'
                 if self.mode == 'remote':
                     if self.sender_side == 'local':
@@ -484,14 +602,30 @@ class Test(object):
                 second_cmd = 'tunnel %s python %s receiver %s %s\n' % (
                     tun_id, second_src, send_pri_ip, port)
 
-                send_manager.stdin.write(first_cmd)
-                send_manager.stdin.flush()
+                first_manager = send_manager
 
-        return second_cmd
+        first_manager.stdin.write(first_cmd)
+        first_manager.stdin.flush()
 
-    def run_second_side(self, send_manager, recv_manager, second_cmds):
-        time.sleep(self.run_first_setup_time)
+        return second_cmd, (first_manager, tun_id, port)
+
+    def wait_for_first_sides(self, first_sides):
+        # wait until the side that runs first in every tunnel listens on its
+        # port, for at most run_first_setup_time seconds in total
+        deadline = time.time() + self.run_first_setup_time
 
+        for manager, tun_id, port in first_sides:
+            timeout = max(deadline - time.time(), 0)
+            manager.stdin.write('tunnel %s wait %s %.3f\n'
+                                % (tun_id, port, timeout))
+            manager.stdin.flush()
+
+            if manager.stdout.readline().strip() != 'ready':
+                sys.stderr.write('Warning: nothing listened on port %s in '
+                                 'tunnel %s after %.1f seconds\n'
+                                 % (port, tun_id, self.run_first_setup_time))
+
+    def run_second_side(self, send_manager, recv_manager, second_cmds):
         start_time = time.time()
         self.test_start_time = utils.utc_time()
 
@@ -525,12 +659,19 @@ class Test(object):
         time.sleep(self.runtime - elapsed_time)
         self.test_end_time = utils.utc_time()
 
+        # every flow runs from its start until the end of the run
+        end_time = time.time()
+        for i in xrange(len(second_cmds)):
+            self.record_span('flow', start_time + i * self.interval,
+                             end_time, tun_id=i + 1)
+
         return True
 
     # test congestion control using tunnel client and tunnel server
     def run_with_tunnel(self):
         # run pantheon tunnel server and client managers
-        ts_manager, tc_manager = self.run_tunnel_managers()
+        with self.span('tunnel managers'):
+            ts_manager, tc_manager = self.run_tunnel_managers()
 
         # create alias for ts_manager and tc_manager using sender or receiver
         if self.sender_side == self.server_side:
@@ -540,160 +681,303 @@ class Test(object):
             send_manager = tc_manager
             recv_manager = ts_manager
 
+        # run the tunnel servers and clients of every flow
+        with self.span('tunnels'):
+            cmds_to_run_tc = self.run_tunnels(ts_manager, tc_manager)
+        if cmds_to_run_tc is None:
+            return False
+
         # run every flow
         second_cmds = []
-        for tun_id in xrange(1, self.flows + 1):
-            # run tunnel server for tunnel tun_id
-            cmd_to_run_tc = self.run_tunnel_server(tun_id, ts_manager)
-
-            # run tunnel client for tunnel tun_id
-            if not self.run_tunnel_client(tun_id, tc_manager, cmd_to_run_tc):
-                return False
-
-            tc_pri_ip = cmd_to_run_tc[3]  # tunnel client private IP
-            ts_pri_ip = cmd_to_run_tc[4]  # tunnel server private IP
+        first_sides = []
+        with self.span('first sides'):
+            for tun_id in xrange(1, self.flows + 1):
+                cmd_to_run_tc = cmds_to_run_tc[tun_id]
+                tc_pri_ip = cmd_to_run_tc[3]  # tunnel client private IP
+                ts_pri_ip = cmd_to_run_tc[4]  # tunnel server private IP
+
+                if self.sender_side == self.server_side:
+                    send_pri_ip = ts_pri_ip
+                    recv_pri_ip = tc_pri_ip
+                else:
+                    send_pri_ip = tc_pri_ip
+                    recv_pri_ip = ts_pri_ip
 
-            if self.sender_side == self.server_side:
-                send_pri_ip = ts_pri_ip
-                recv_pri_ip = tc_pri_ip
-            else:
-                send_pri_ip = tc_pri_ip
-                recv_pri_ip = ts_pri_ip
+                # run the side that runs first and get cmd to run the other
+                # side
+                second_cmd, first_side = self.run_first_side(
+                    tun_id, send_manager, recv_manager, send_pri_ip,
+                    recv_pri_ip)
+                second_cmds.append(second_cmd)
+                first_sides.append(first_side)
 
-            # run the side that runs first and get cmd to run the other side
-            second_cmd = self.run_first_side(
-                tun_id, send_manager, recv_manager, send_pri_ip, recv_pri_ip)
-            second_cmds.append(second_cmd)
+            # wait for the sides that run first to listen
+            self.wait_for_first_sides(first_sides)
 
         # run the side that runs second
-        if not self.run_second_side(send_manager, recv_manager, second_cmds):
-            return False
+        with self.span('second sides'):
+            if not self.run_second_side(send_manager, recv_manager,
+                                        second_cmds):
+                return False
 
         # stop all the running flows and quit tunnel managers
+        self.sampler.stop()
         ts_manager.stdin.write('halt\n')
         ts_manager.stdin.flush()
         tc_manager.stdin.write('halt\n')
         tc_manager.stdin.flush()
 
         # process tunnel logs
-        self.process_tunnel_logs()
+        with self.span('process tunnel logs'):
+            self.process_tunnel_logs()
 
         return True
 
-    def download_tunnel_logs(self, tun_id):
+    def remote_tunnel_logs(self):
+        # point the tunnel logs on the remote side to their local copies in
+        # tmp_dir; return pairs of remote and local paths in tunnel order
         assert(self.mode == 'remote')
 
-        # download logs from remote side
-        cmd = 'scp -C %s:' % self.r['host_addr']
-        cmd += '%(remote_log)s %(local_log)s'
-
-        # function to get a corresponding local path from a remote path
-        f = lambda p: path.join(utils.tmp_dir, path.basename(p))
-
         if self.sender_side == 'remote':
-            local_log = f(self.datalink_egress_logs[tun_id])
-            call(cmd % {'remote_log': self.datalink_egress_logs[tun_id],
-                        'local_log': local_log}, shell=True)
-            self.datalink_egress_logs[tun_id] = local_log
-
-            local_log = f(self.acklink_ingress_logs[tun_id])
-            call(cmd % {'remote_log': self.acklink_ingress_logs[tun_id],
-                        'local_log': local_log}, shell=True)
-            self.acklink_ingress_logs[tun_id] = local_log
+            remote_logs = [self.datalink_egress_logs,
+                           self.acklink_ingress_logs]
         else:
-            local_log = f(self.datalink_ingress_logs[tun_id])
-            call(cmd % {'remote_log': self.datalink_ingress_logs[tun_id],
-                        'local_log': local_log}, shell=True)
-            self.datalink_ingress_logs[tun_id] = local_log
+            remote_logs = [self.datalink_ingress_logs,
+                           self.acklink_egress_logs]
 
-            local_log = f(self.acklink_egress_logs[tun_id])
-            call(cmd % {'remote_log': self.acklink_egress_logs[tun_id],
-                        'local_log': local_log}, shell=True)
-            self.acklink_egress_logs[tun_id] = local_log
+        logs = []
+        for tun_id in xrange(1, self.flows + 1):
+            for tunnel_logs in remote_logs:
+                remote_log = tunnel_logs[tun_id]
+                tunnel_logs[tun_id] = path.join(
+                    utils.tmp_dir, path.basename(remote_log))
+                logs.append((remote_log, tunnel_logs[tun_id]))
+
+        return logs
+
+    def download_tunnel_logs(self, logs):
+        # download the logs of all tunnels from the remote side in a single
+        # compressed stream; yield tunnel IDs as soon as their logs arrive
+        tun_ids = {}
+        pending = {}
+        for i, (_, local_log) in enumerate(logs):
+            tun_ids[local_log] = i // 2 + 1
+            pending[i // 2 + 1] = 2
+
+        if self.agent is not None:
+            local_logs = self.agent.download_logs(logs)
+        else:
+            local_logs = log_transfer.download(
+                self.r['ssh_cmd'], self.r['log_transfer'], logs)
 
+        # the download overlaps with merging the tunnels that have arrived
+        start_time = time.time()
+        for local_log in local_logs:
+            tun_id = tun_ids[local_log]
+            pending[tun_id] -= 1
+            if pending[tun_id] == 0:
+                del pending[tun_id]
+                yield tun_id
+        self.record_span('download', start_time, time.time(), logs=len(logs))
+
+        # logs that failed to download are reported when merged
+        for tun_id in sorted(pending):
+            yield tun_id
+
+    def tunnel_log_joins(self, tun_id, offsets):
+        # arguments to join the ingress and egress logs of a tunnel, with
+        # clock offsets (data_i, data_e, ack_i, ack_e) if any
+        datalink_kwargs = {
+            'ingress_log_path': self.datalink_ingress_logs[tun_id],
+            'egress_log_path': self.datalink_egress_logs[tun_id]}
+        acklink_kwargs = {
+            'ingress_log_path': self.acklink_ingress_logs[tun_id],
+            'egress_log_path': self.acklink_egress_logs[tun_id]}
+
+        if offsets is not None:
+            data_i_ofst, data_e_ofst, ack_i_ofst, ack_e_ofst = offsets
+            datalink_kwargs['i_clock_offset'] = float(data_i_ofst)
+            datalink_kwargs['e_clock_offset'] = float(data_e_ofst)
+            acklink_kwargs['i_clock_offset'] = float(ack_i_ofst)
+            acklink_kwargs['e_clock_offset'] = float(ack_e_ofst)
+
+        return datalink_kwargs, acklink_kwargs
 
     def process_tunnel_logs(self):
-        datalink_tun_logs = []
-        acklink_tun_logs = []
-
-        apply_ofst = False
+        offsets = None
         if self.mode == 'remote':
             if self.remote_ofst is not None and self.local_ofst is not None:
-                apply_ofst = True
-
                 if self.sender_side == 'remote':
-                    data_e_ofst = self.remote_ofst
-                    ack_i_ofst = self.remote_ofst
-                    data_i_ofst = self.local_ofst
-                    ack_e_ofst = self.local_ofst
+                    offsets = (self.local_ofst, self.remote_ofst,
+                               self.remote_ofst, self.local_ofst)
                 else:
-                    data_i_ofst = self.remote_ofst
-                    ack_e_ofst = self.remote_ofst
-                    data_e_ofst = self.local_ofst
-                    ack_i_ofst = self.local_ofst
+                    offsets = (self.remote_ofst, self.local_ofst,
+                               self.local_ofst, self.remote_ofst)
 
-        merge_tunnel_logs = path.join(context.src_dir, 'experiments',
-                                      'merge_tunnel_logs.py')
+        # tunnels whose logs are ready to merge, as soon as they have been
+        # downloaded from the remote side
+        ready_tunnels = xrange(1, self.flows + 1)
+        download_stage = []
+        if self.mode == 'remote':
+            remote_logs = self.remote_tunnel_logs()
+            if self.pipeline is not None and self.background_download:
+                # download the logs after the run with the merges
+                download_stage = [(log_transfer.download_all, {
+                    'ssh_cmd': self.r['ssh_cmd'],
+                    'remote_log_transfer': self.r['log_transfer'],
+                    'logs': remote_logs})]
+            else:
+                ready_tunnels = self.download_tunnel_logs(remote_logs)
 
-        for tun_id in xrange(1, self.flows + 1):
-            if self.mode == 'remote':
-                self.download_tunnel_logs(tun_id)
+        datalink_link_log = None
+        acklink_link_log = None
+        if self.mode == 'local':
+            datalink_link_log = self.mm_datalink_log
+            acklink_link_log = self.mm_acklink_log
+
+        if self.fused_merge:
+            datalink_joins = []
+            acklink_joins = []
+            for tun_id in ready_tunnels:
+                datalink_kwargs, acklink_kwargs = self.tunnel_log_joins(
+                    tun_id, offsets)
+                datalink_joins.append(datalink_kwargs)
+                acklink_joins.append(acklink_kwargs)
+
+            with self.span('merge', fused=True):
+                self.merge_and_analyze(datalink_joins, datalink_link_log,
+                                       self.datalink_log, analyze=True)
+                self.merge_and_analyze(acklink_joins, acklink_link_log,
+                                       self.acklink_log, analyze=False)
+            return
 
-            uid = uuid.uuid4()
-            datalink_tun_log = path.join(
-                utils.tmp_dir, '%s_flow%s_uid%s.log.merged'
-                % (self.datalink_name, tun_id, uid))
-            acklink_tun_log = path.join(
+        # merge the ingress and egress logs of every tunnel as soon as they
+        # are ready, and then the merged logs of all tunnels, in worker
+        # processes
+        tun_logs = {}
+        multiple_merges = []
+        for name, link_log, output_log in [
+                (self.datalink_name, datalink_link_log, self.datalink_log),
+                (self.acklink_name, acklink_link_log, self.acklink_log)]:
+            tun_logs[name] = [path.join(
                 utils.tmp_dir, '%s_flow%s_uid%s.log.merged'
-                % (self.acklink_name, tun_id, uid))
-
-            cmd = [merge_tunnel_logs, 'single',
-                   '-i', self.datalink_ingress_logs[tun_id],
-                   '-e', self.datalink_egress_logs[tun_id],
-                   '-o', datalink_tun_log]
-            if apply_ofst:
-                cmd += ['-i-clock-offset', data_i_ofst,
-                        '-e-clock-offset', data_e_ofst]
-            call(cmd)
-
-            cmd = [merge_tunnel_logs, 'single',
-                   '-i', self.acklink_ingress_logs[tun_id],
-                   '-e', self.acklink_egress_logs[tun_id],
-                   '-o', acklink_tun_log]
-            if apply_ofst:
-                cmd += ['-i-clock-offset', ack_i_ofst,
-                        '-e-clock-offset', ack_e_ofst]
-            call(cmd)
-
-            datalink_tun_logs.append(datalink_tun_log)
-            acklink_tun_logs.append(acklink_tun_log)
-
-        cmd = [merge_tunnel_logs, 'multiple', '-o', self.datalink_log]
-        if self.mode == 'local':
-            cmd += ['--link-log', self.mm_datalink_log]
-        cmd += datalink_tun_logs
-        call(cmd)
+                % (name, tun_id, uuid.uuid4()))
+                for tun_id in xrange(1, self.flows + 1)]
+
+            kwargs = {'tunnel_log_paths': tun_logs[name],
+                      'output_log_path': output_log}
+            if link_log:
+                kwargs['link_log_path'] = link_log
+            multiple_merges.append((merge_tunnel_logs.merge_multiple, kwargs))
+
+        def single_merges():
+            for tun_id in ready_tunnels:
+                joins = self.tunnel_log_joins(tun_id, offsets)
+                for name, kwargs in zip(
+                        [self.datalink_name, self.acklink_name], joins):
+                    kwargs = dict(kwargs,
+                                  output_log_path=tun_logs[name][tun_id - 1])
+                    yield (merge_tunnel_logs.merge_single, kwargs)
+
+        if self.pipeline is not None:
+            # merge the logs after the run while the next run executes
+            self.merge_stages = []
+            if download_stage:
+                self.merge_stages.append(download_stage)
+            self.merge_stages += [list(single_merges()), multiple_merges]
+            return
 
-        cmd = [merge_tunnel_logs, 'multiple', '-o', self.acklink_log]
-        if self.mode == 'local':
-            cmd += ['--link-log', self.mm_acklink_log]
-        cmd += acklink_tun_logs
-        call(cmd)
+        processes = len(self.cpus) if self.cpus else None
+        for merges, count in [(single_merges(), 2 * self.flows),
+                              (multiple_merges, len(multiple_merges))]:
+            sys.stderr.write('Merging %d tunnel logs\n' % count)
+            with self.span('merge', logs=count):
+                for error in merge_tunnel_logs.merge_logs(merges, processes):
+                    sys.stderr.write('%s\n' % error)
+
+    def merge_and_analyze(self, joins, link_log, output_log, analyze):
+        # join and merge tunnel logs in memory, save the merged log unless
+        # --no-merged-logs is given, and analyze the merged events right away
+        # without parsing the merged log again; without a merged log to plot
+        # later, plot its graphs now
+        sys.stderr.write('Merging %d tunnel logs into %s in memory\n'
+                         % (len(joins), output_log))
+        try:
+            init_ts, events = merge_tunnel_logs.join_and_merge_events(
+                joins, link_log)
+        except (merge_tunnel_logs.MergeError, IOError, ValueError) as e:
+            sys.stderr.write('%s\n' % e)
+            return
+
+        if self.save_merged_logs:
+            tunnel_log.write_text(output_log, init_ts, events)
+
+        if not analyze:
+            return
+
+        # name graphs as plot.py does
+        graphs = [None, None]
+        if not self.save_merged_logs:
+            graphs = [path.join(self.data_dir, '%s_datalink_%s_run%s.png'
+                                % (self.cc, graph, self.run_id))
+                      for graph in ['throughput', 'delay']]
+
+        graph = tunnel_graph.TunnelGraph(output_log, *graphs)
+        graph.parse_events(events)
+        graph.plot_graphs()
+        tunnel_results = graph.get_tunnel_results()
+        sys.stderr.write(tunnel_results['stats'])
+
+        # plot.py ignores runs that were much shorter than the runtime
+        duration = tunnel_results['duration'] / 1000.0
+        if duration < 0.8 * self.runtime:
+            sys.stderr.write(
+                'Warning: %s had duration %.2f seconds but should have been '
+                'around %s seconds. Not saving its results.\n'
+                % (output_log, duration, self.runtime))
+            return
+
+        # record the run as it is recorded in pantheon_perf.json, and its
+        # statistics in its stats log, for plot.py
+        perf_path = path.join(
+            self.data_dir, '%s_perf_run%s.json' % (self.cc, self.run_id))
+        with open(perf_path, 'w') as perf_file:
+            json.dump({self.cc: {self.run_id: tunnel_results['flow_data']}},
+                      perf_file)
+        self.datalink_stats = tunnel_results['stats']
+
+    def sampled_pids(self):
+        # the local processes that the run has started so far
+        return [proc.pid for proc in [self.ts_manager, self.tc_manager,
+                                      self.proc_first, self.proc_second]
+                if proc is not None and hasattr(proc, 'pid')]
 
     def run_congestion_control(self):
+        # sample the resource usage of the sender, receiver, tunnels and
+        # mm-link while they run
+        self.sampler = resource_sampler.ResourceSampler(
+            self.resources_log, self.sampled_pids,
+            len(self.cpus) if self.cpus else None)
+        self.sampler.start()
+
         if self.flows > 0:
             try:
                 return self.run_with_tunnel()
             finally:
-                utils.kill_proc_group(self.ts_manager)
-                utils.kill_proc_group(self.tc_manager)
+                self.sampler.stop()
+                with self.span('cleanup'):
+                    self.stop_tunnel_manager(self.ts_manager)
+                    self.stop_tunnel_manager(self.tc_manager)
         else:
             # test without pantheon tunnel when self.flows = 0
             try:
-                return self.run_without_tunnel()
+                with self.span('run without tunnel'):
+                    return self.run_without_tunnel()
             finally:
-                utils.kill_proc_group(self.proc_first)
-                utils.kill_proc_group(self.proc_second)
+                self.sampler.stop()
+                with self.span('cleanup'):
+                    utils.kill_proc_group(self.proc_first)
+                    utils.kill_proc_group(self.proc_second)
 
     def record_time_stats(self):
         stats_log = path.join(
@@ -720,33 +1004,101 @@ class Test(object):
                 sys.stderr.write(ofst_info)
                 stats.write(ofst_info)
 
+        # datalink statistics of a fused merge, as plot.py writes them
+        if self.datalink_stats:
+            stats.write('\n# Below is generated by %s at %s\n' %
+                        (path.basename(__file__), utils.utc_time()))
+            stats.write('# Datalink statistics\n')
+            stats.write(self.datalink_stats)
+
         stats.close()
 
+    def record_state(self, state):
+        if self.journal is not None:
+            self.journal.record(self.cc, self.run_id, state)
+
+    def span(self, phase, **args):
+        # time a phase of this run in the timeline, if any
+        if self.timeline is None:
+            return timeline.NoSpan()
+        return self.timeline.span(phase, cc=self.cc, run_id=self.run_id,
+                                  **args)
+
+    def record_span(self, phase, start, end, **args):
+        if self.timeline is not None:
+            self.timeline.record(phase, start, end, cc=self.cc,
+                                 run_id=self.run_id, **args)
+
     # run congestion control test
     def run(self):
+        with self.span('run'):
+            self.run_phases()
+
+    def run_phases(self):
         msg = 'Testing scheme %s for experiment run %d/%d...' % (
             self.cc, self.run_id, self.run_times)
         sys.stderr.write(msg + '\n')
 
+        # a run that neither finishes nor fails, e.g., when test.py is
+        # killed, is left as started in the journal
+        self.record_state(journal.STARTED)
+
         # setup before running tests
-        self.setup()
+        with self.span('setup'):
+            self.setup()
 
         # run receiver and sender
         if not self.run_congestion_control():
             sys.stderr.write('Error in testing scheme %s with run ID %d\n' %
                              (self.cc, self.run_id))
+            self.record_state(journal.FAILED)
             return
 
         # write runtimes and clock offsets to file
         self.record_time_stats()
 
+        # merge and analyze the logs in the background
+        if self.pipeline is not None:
+            datalink_log = self.datalink_log
+            if self.flows == 0:
+                datalink_log = self.mm_datalink_log
+
+            # name graphs as plot.py does
+            tput_graph = path.join(
+                self.data_dir, '%s_datalink_throughput_run%s.png'
+                % (self.cc, self.run_id))
+            delay_graph = path.join(
+                self.data_dir, '%s_datalink_delay_run%s.png'
+                % (self.cc, self.run_id))
+
+            self.pipeline.submit('%s run %d' % (self.cc, self.run_id),
+                                 self.merge_stages,
+                                 [(datalink_log, tput_graph, delay_graph)],
+                                 {'cc': self.cc, 'run_id': self.run_id})
+
+        self.record_state(journal.DONE)
+
         sys.stderr.write('Done testing %s\n' % self.cc)
 
 
-def run_tests(args):
+def run_tests(args, agent=None):
+    # time the phases of the tests in the data directory, sweep cells
+    # included, from scratch
+    utils.make_sure_dir_exists(args.data_dir)
+    test_timeline = timeline.Timeline(args.data_dir)
+    test_timeline.clear()
+
+    try:
+        run_campaigns(args, test_timeline, agent)
+    finally:
+        test_timeline.export()
+
+
+def run_campaigns(args, test_timeline, agent=None):
     # check and get git summary
-    git_summary = utils.get_git_summary(args.mode,
-                                        getattr(args, 'remote_path', None))
+    with test_timeline.span('git summary'):
+        git_summary = utils.get_git_summary(
+            args.mode, getattr(args, 'remote_path', None), agent)
 
     # get cc_schemes
     if args.all:
@@ -766,7 +1118,58 @@ def run_tests(args):
             random.shuffle(args.test_config['flows'])
         cc_schemes = [flow['scheme'] for flow in args.test_config['flows']]
 
-    # save metadata
+    # test every cell of a sweep of emulation settings in a data directory
+    # of its own, sharing the setup above
+    if getattr(args, 'sweep', None) is not None:
+        campaigns = sweep.expand_args(args)
+    else:
+        campaigns = [args]
+
+    # merge and analyze the logs of each run while the next run executes,
+    # away from the CPUs of tests run in parallel
+    parallel = getattr(args, 'parallel', 1)
+    pipeline = None
+    if args.pipeline:
+        cpus = utils.allowed_cpus()
+        if parallel > 1:
+            cpus = cpus[parallel * args.cpus_per_test:]
+        pipeline = post_processor.PostProcessor(max(len(cpus), 1), cpus,
+                                                test_timeline)
+
+    # measure clock offsets once in a while for all the runs
+    clock_offsets = None
+    if args.mode == 'remote' and args.ntp_addr is not None:
+        r = utils.parse_remote_path(args.remote_path)
+        clock_offsets = clock_offset.ClockOffsets(
+            args.ntp_addr, r['ssh_cmd'], agent, args.ntp_max_age)
+
+    tests = []
+    with test_timeline.span('campaign setup'):
+        for campaign_args in campaigns:
+            tests += campaign_tests(campaign_args, cc_schemes, git_summary,
+                                    pipeline, agent, clock_offsets,
+                                    test_timeline)
+
+    try:
+        with test_timeline.span('tests', tests=len(tests)):
+            if parallel > 1:
+                run_in_parallel(tests,
+                                split_cpus(parallel, args.cpus_per_test))
+            else:
+                for test_cls, test_args in tests:
+                    test_cls(*test_args).run()
+    finally:
+        if pipeline is not None:
+            with test_timeline.span('post-processing after the tests'):
+                pipeline.finish()
+
+
+def campaign_tests(args, cc_schemes, git_summary, pipeline, agent=None,
+                   clock_offsets=None, test_timeline=None):
+    # save the metadata of a campaign of tests in its data directory, and
+    # return the tests to run
+    utils.make_sure_dir_exists(args.data_dir)
+
     meta = vars(args).copy()
     meta['cc_schemes'] = sorted(cc_schemes)
     meta['git_summary'] = git_summary
@@ -774,14 +1177,108 @@ def run_tests(args):
     metadata_path = path.join(args.data_dir, 'pantheon_metadata.json')
     utils.save_test_metadata(meta, metadata_path)
 
-    # run tests
+    # journal the runs, and skip those completed with the same configuration
+    # if resuming
+    campaign_journal = journal.Journal(
+        args.data_dir, journal.config_hash(meta))
+    last_states = {}
+    if args.resume:
+        last_states = campaign_journal.last_states()
+
+    if not hasattr(args, 'test_config') or args.test_config is None:
+        runs = [(cc, cc) for cc in cc_schemes]
+    else:
+        runs = [(None, args.test_config['test-name'])]
+
+    tests = []
+    skipped = 0
     for run_id in xrange(args.start_run_id,
                          args.start_run_id + args.run_times):
-        if not hasattr(args, 'test_config') or args.test_config is None:
-            for cc in cc_schemes:
-                Test(args, run_id, cc).run()
-        else:
-            Test(args, run_id, None).run()
+        for cc, name in runs:
+            if args.resume and run_is_complete(
+                    args, name, run_id, last_states.get((name, run_id)),
+                    campaign_journal.config_hash):
+                skipped += 1
+                continue
+
+            tests.append((Test, (args, run_id, cc, pipeline,
+                                 campaign_journal, agent, clock_offsets,
+                                 test_timeline)))
+
+    if args.resume:
+        sys.stderr.write('Resuming in %s: skipped %d completed runs, %d runs '
+                         'to go\n' % (args.data_dir, skipped, len(tests)))
+
+    return tests
+
+
+def run_is_complete(args, cc, run_id, last_state, config_hash):
+    # a run is complete if it is journaled as done with the same
+    # configuration, and its stats log and datalink log (or the results saved
+    # instead by --fused-merge) are still in the data directory
+    if last_state is None or last_state[0] != journal.DONE:
+        return False
+
+    if last_state[1] != config_hash:
+        sys.stderr.write('Redoing %s run %d, which was done with another '
+                         'configuration\n' % (cc, run_id))
+        return False
+
+    log_prefix = cc + '_mm' if args.flows == 0 else cc
+    stats_log = path.join(args.data_dir, '%s_stats_run%s.log' % (cc, run_id))
+    datalink_log = path.join(
+        args.data_dir, '%s_datalink_run%s.log' % (log_prefix, run_id))
+    perf_path = path.join(args.data_dir, '%s_perf_run%s.json' % (cc, run_id))
+
+    return find_file(stats_log) is not None and (
+        find_file(datalink_log) is not None or path.isfile(perf_path))
+
+
+def split_cpus(parallel, cpus_per_test):
+    # split the allowed CPUs into a dedicated set for each test run in
+    # parallel; arg_parser has made sure that they are not oversubscribed
+    cpus = utils.allowed_cpus()
+    return [cpus[i * cpus_per_test:(i + 1) * cpus_per_test]
+            for i in xrange(parallel)]
+
+
+def run_pinned(test_cls, test_args, cpus):
+    # pin this process, and thus the sender, receiver, tunnels and mm-link
+    # that the test starts, to cpus before running the test
+    utils.pin_to_cpus(os.getpid(), cpus)
+    test_cls(*test_args, cpus=cpus).run()
+
+
+def run_in_parallel(tests, cpu_sets):
+    # run each test in its own process as soon as a set of CPUs is free
+    pending = deque(tests)
+    running = {}
+    failed = 0
+
+    while pending or running:
+        while pending and cpu_sets:
+            test_cls, test_args = pending.popleft()
+            cpus = cpu_sets.pop()
+            proc = multiprocessing.Process(
+                target=run_pinned, args=(test_cls, test_args, cpus))
+            proc.start()
+            running[proc] = cpus
+
+        time.sleep(PARALLEL_POLL_INTERVAL)
+
+        for proc in running.keys():
+            if proc.is_alive():
+                continue
+
+            # a test that failed has printed its traceback already
+            proc.join()
+            cpu_sets.append(running.pop(proc))
+            if proc.exitcode != 0:
+                failed += 1
+
+    if failed:
+        sys.exit('%d of %d tests run in parallel failed'
+                 % (failed, len(tests)))
 
 
 def pkill(args):
@@ -804,8 +1301,17 @@ def pkill(args):
 def main():
     args = arg_parser.parse_test()
 
+    # share one SSH connection among all remote operations of the tests, and
+    # drive the remote side through a remote agent started over it once
+    agent = None
+    if args.mode == 'remote':
+        r = utils.parse_remote_path(args.remote_path)
+        host_addr = r['host_addr']
+        utils.start_ssh_master(host_addr)
+        agent = remote_agent.start(r)
+
     try:
-        run_tests(args)
+        run_tests(args, agent)
     except:  # intended to catch all exceptions
         # dump traceback ahead in case pkill kills the program
         sys.stderr.write(traceback.format_exc())
@@ -816,6 +1322,11 @@ def main():
         sys.exit('Error in tests!')
     else:
         sys.stderr.write('All tests done!\n')
+    finally:
+        if agent is not None:
+            agent.close()
+        if args.mode == 'remote':
+            utils.stop_ssh_master(host_addr)
 
 
 if __name__ == '__main__':
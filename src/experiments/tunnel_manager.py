@@ -3,106 +3,244 @@
 import os
 from os import path
 import sys
+import time
 import signal
+import select
+from collections import deque
 from subprocess import Popen, PIPE
 
 import context
 from helpers import utils
 
 
-def main():
-    prompt = ''
-    procs = {}
-
-    # register SIGINT and SIGTERM events to clean up gracefully before quit
-    def stop_signal_handler(signum, frame):
-        for tun_id in procs:
-            utils.kill_proc_group(procs[tun_id])
-
-        sys.exit('tunnel_manager: caught signal %s and cleaned up\n' % signum)
-
-    signal.signal(signal.SIGINT, stop_signal_handler)
-    signal.signal(signal.SIGTERM, stop_signal_handler)
-
-    sys.stdout.write('tunnel manager is running\n')
-    sys.stdout.flush()
-
-    while True:
-        input_cmd = sys.stdin.readline().strip()
-
+class LineReader(object):
+    # lines read from a file descriptor whenever it is readable
+    def __init__(self, fd):
+        self.fd = fd
+        self.partial = ''
+        self.lines = deque()
+        self.eof = False
+
+    def read(self):
+        data = os.read(self.fd, 65536)
+        if not data:
+            self.eof = True
+            if self.partial:
+                self.lines.append(self.partial)
+                self.partial = ''
+            return
+
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        self.lines.extend(line + '\n' for line in lines)
+
+
+class TunnelManager(object):
+    # run tunnel clients and servers, and the commands inside them, as told
+    # by commands on stdin; the stdin and the stdouts of all tunnels are read
+    # concurrently so that no tunnel holds up the others, and replies to
+    # readline and wait commands are written to stdout in the order of the
+    # commands
+    def __init__(self):
+        self.prompt = ''
+        self.procs = {}
+        self.tunnel_stdouts = {}
+        self.stdin = LineReader(sys.stdin.fileno())
+
+        # pending readline and wait commands: (command, tun_id, deadline,
+        # port), with deadline None for no timeout
+        self.requests = deque()
+
+    def cleanup(self):
+        for tun_id in self.procs:
+            utils.kill_proc_group(self.procs[tun_id])
+
+    def run(self):
+        sys.stdout.write('tunnel manager is running\n')
+        sys.stdout.flush()
+
+        while True:
+            readers = [self.stdin] + [
+                reader for reader in self.tunnel_stdouts.itervalues()
+                if not reader.eof]
+            readable, _, _ = select.select(
+                [reader.fd for reader in readers], [], [],
+                self.select_timeout())
+
+            for reader in readers:
+                if reader.fd in readable:
+                    reader.read()
+
+            while self.stdin.lines:
+                if not self.run_command(self.stdin.lines.popleft().strip()):
+                    return
+
+            if self.stdin.eof:
+                self.cleanup()
+                return
+
+            self.reply()
+
+    def select_timeout(self):
+        # wake up for the earliest deadline, or to check ports again
+        if not self.requests:
+            return None
+
+        cmd, _, deadline, _ = self.requests[0]
+        if cmd == 'wait':
+            return utils.PORT_POLL_INTERVAL
+        if deadline is None:
+            return None
+        return max(deadline - time.time(), 0)
+
+    def reply(self):
+        while self.requests:
+            cmd, tun_id, deadline, port = self.requests[0]
+            expired = deadline is not None and time.time() >= deadline
+            if tun_id not in self.procs:
+                expired = True
+
+            if cmd == 'readline':
+                # an empty line means no line before the deadline or EOF
+                reader = self.tunnel_stdouts.get(tun_id)
+                if reader and reader.lines:
+                    sys.stdout.write(reader.lines.popleft())
+                elif expired or reader.eof:
+                    sys.stdout.write('\n')
+                else:
+                    break
+            else:  # cmd == 'wait'
+                if not expired and utils.port_is_bound(
+                        port, [self.procs[tun_id].pid]):
+                    sys.stdout.write('ready\n')
+                elif expired:
+                    sys.stdout.write('timeout\n')
+                else:
+                    break
+
+            sys.stdout.flush()
+            self.requests.popleft()
+
+    def run_command(self, input_cmd):
+        # run a command; return False to quit
         # print all the commands fed into tunnel manager
-        if prompt:
-            sys.stderr.write(prompt + ' ')
+        if self.prompt:
+            sys.stderr.write(self.prompt + ' ')
         sys.stderr.write(input_cmd + '\n')
         cmd = input_cmd.split()
 
+        if not cmd:
+            sys.stderr.write('unknown command: %s\n' % input_cmd)
+            return True
+
         # manage I/O of multiple tunnels
         if cmd[0] == 'tunnel':
-            if len(cmd) < 3:
-                sys.stderr.write('error: usage: tunnel ID CMD...\n')
-                continue
-
-            try:
-                tun_id = int(cmd[1])
-            except ValueError:
-                sys.stderr.write('error: usage: tunnel ID CMD...\n')
-                continue
-
-            cmd_to_run = ' '.join(cmd[2:])
-
-            if cmd[2] == 'mm-tunnelclient' or cmd[2] == 'mm-tunnelserver':
-                # expand env variables (e.g., MAHIMAHI_BASE)
-                cmd_to_run = path.expandvars(cmd_to_run).split()
-
-                # expand home directory
-                for i in xrange(len(cmd_to_run)):
-                    if ('--ingress-log' in cmd_to_run[i] or
-                        '--egress-log' in cmd_to_run[i]):
-                        t = cmd_to_run[i].split('=')
-                        cmd_to_run[i] = t[0] + '=' + path.expanduser(t[1])
-
-                procs[tun_id] = Popen(cmd_to_run, stdin=PIPE,
-                                      stdout=PIPE, preexec_fn=os.setsid)
-            elif cmd[2] == 'python':  # run python scripts inside tunnel
-                if tun_id not in procs:
-                    sys.stderr.write(
-                        'error: run tunnel client or server first\n')
-
-                procs[tun_id].stdin.write(cmd_to_run + '\n')
-                procs[tun_id].stdin.flush()
-            elif cmd[2] == 'readline':  # readline from stdout of tunnel
-                if len(cmd) != 3:
-                    sys.stderr.write('error: usage: tunnel ID readline\n')
-                    continue
-
-                if tun_id not in procs:
-                    sys.stderr.write(
-                        'error: run tunnel client or server first\n')
-
-                sys.stdout.write(procs[tun_id].stdout.readline())
-                sys.stdout.flush()
-            else:
-                sys.stderr.write('unknown command after "tunnel ID": %s\n'
-                                 % cmd_to_run)
-                continue
+            self.run_tunnel_command(input_cmd, cmd)
         elif cmd[0] == 'prompt':  # set prompt in front of commands to print
             if len(cmd) != 2:
                 sys.stderr.write('error: usage: prompt PROMPT\n')
-                continue
+                return True
 
-            prompt = cmd[1].strip()
+            self.prompt = cmd[1].strip()
         elif cmd[0] == 'halt':  # terminate all tunnel processes and quit
             if len(cmd) != 1:
                 sys.stderr.write('error: usage: halt\n')
-                continue
-
-            for tun_id in procs:
-                utils.kill_proc_group(procs[tun_id])
+                return True
 
-            sys.exit(0)
+            self.cleanup()
+            return False
         else:
             sys.stderr.write('unknown command: %s\n' % input_cmd)
-            continue
+
+        return True
+
+    def run_tunnel_command(self, input_cmd, cmd):
+        if len(cmd) < 3:
+            sys.stderr.write('error: usage: tunnel ID CMD...\n')
+            return
+
+        try:
+            tun_id = int(cmd[1])
+        except ValueError:
+            sys.stderr.write('error: usage: tunnel ID CMD...\n')
+            return
+
+        cmd_to_run = ' '.join(cmd[2:])
+
+        if cmd[2] == 'mm-tunnelclient' or cmd[2] == 'mm-tunnelserver':
+            # expand env variables (e.g., MAHIMAHI_BASE)
+            cmd_to_run = path.expandvars(cmd_to_run).split()
+
+            # expand home directory
+            for i in xrange(len(cmd_to_run)):
+                if ('--ingress-log' in cmd_to_run[i] or
+                    '--egress-log' in cmd_to_run[i]):
+                    t = cmd_to_run[i].split('=')
+                    cmd_to_run[i] = t[0] + '=' + path.expanduser(t[1])
+
+            # a tunnel run again, e.g., a tunnel client that did not connect,
+            # replaces the previous one
+            if tun_id in self.procs:
+                utils.kill_proc_group(self.procs[tun_id])
+
+            self.procs[tun_id] = Popen(cmd_to_run, stdin=PIPE,
+                                       stdout=PIPE, preexec_fn=os.setsid)
+            self.tunnel_stdouts[tun_id] = LineReader(
+                self.procs[tun_id].stdout.fileno())
+            return
+
+        if tun_id not in self.procs:
+            sys.stderr.write('error: run tunnel client or server first\n')
+
+        if cmd[2] == 'python':  # run python scripts inside tunnel
+            if tun_id not in self.procs:
+                return
+
+            self.procs[tun_id].stdin.write(cmd_to_run + '\n')
+            self.procs[tun_id].stdin.flush()
+        elif cmd[2] == 'readline':  # readline from stdout of tunnel
+            # reply the next line, or an empty line after TIMEOUT seconds
+            try:
+                deadline = None
+                if len(cmd) == 4:
+                    deadline = time.time() + float(cmd[3])
+                elif len(cmd) != 3:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write(
+                    'error: usage: tunnel ID readline [TIMEOUT]\n')
+                return
+
+            self.requests.append(('readline', tun_id, deadline, None))
+        elif cmd[2] == 'wait':  # wait for a port to be listened on
+            # reply whether a process inside the tunnel listens on PORT
+            # within TIMEOUT seconds
+            try:
+                if len(cmd) != 5:
+                    raise ValueError
+                deadline = time.time() + float(cmd[4])
+            except ValueError:
+                sys.stderr.write('error: usage: tunnel ID wait PORT TIMEOUT\n')
+                return
+
+            self.requests.append(('wait', tun_id, deadline, cmd[3]))
+        else:
+            sys.stderr.write('unknown command after "tunnel ID": %s\n'
+                             % cmd_to_run)
+
+
+def main():
+    manager = TunnelManager()
+
+    # register SIGINT and SIGTERM events to clean up gracefully before quit
+    def stop_signal_handler(signum, frame):
+        manager.cleanup()
+        sys.exit('tunnel_manager: caught signal %s and cleaned up\n' % signum)
+
+    signal.signal(signal.SIGINT, stop_signal_handler)
+    signal.signal(signal.SIGTERM, stop_signal_handler)
+
+    manager.run()
 
 
 if __name__ == '__main__':
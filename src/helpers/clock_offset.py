@@ -0,0 +1,66 @@
+import sys
+import time
+
+from utils import query_clock_offset
+
+
+# Clock offsets of the local and remote sides are measured with NTP for the
+# runs of a campaign only when the last measurement is older than max_age
+# seconds. In between, they are extrapolated from the last measurement with
+# the drift of each clock between the last two measurements. Offsets are
+# strings in ms as query_clock_offset() returns them.
+
+DEFAULT_MAX_AGE = 300
+
+
+class ClockOffsets(object):
+    def __init__(self, ntp_addr, ssh_cmd, agent=None,
+                 max_age=DEFAULT_MAX_AGE):
+        self.ntp_addr = ntp_addr
+        self.ssh_cmd = ssh_cmd
+        self.agent = agent
+        self.max_age = max_age
+
+        # the last two measurements: (time, local offset, remote offset)
+        self.measurements = []
+
+    def get(self):
+        # return the local and remote clock offsets now
+        now = time.time()
+        if (not self.measurements or
+                now - self.measurements[-1][0] >= self.max_age):
+            return self.measure()
+
+        measured_at, local_ofst, remote_ofst = self.measurements[-1]
+        local_drift, remote_drift = self.drift()
+        elapsed = now - measured_at
+
+        sys.stderr.write('Clock offsets measured %.0f seconds ago; '
+                         'extrapolated with drift %.4f ms/s (local), '
+                         '%.4f ms/s (remote)\n'
+                         % (elapsed, local_drift, remote_drift))
+        return (str(local_ofst + local_drift * elapsed),
+                str(remote_ofst + remote_drift * elapsed))
+
+    def measure(self):
+        local_ofst, remote_ofst = query_clock_offset(
+            self.ntp_addr, self.ssh_cmd, self.agent)
+
+        # a failed measurement is retried by the next run
+        if local_ofst is not None and remote_ofst is not None:
+            self.measurements.append(
+                (time.time(), float(local_ofst), float(remote_ofst)))
+            self.measurements = self.measurements[-2:]
+
+        return local_ofst, remote_ofst
+
+    def drift(self):
+        # ms per second that each clock drifts, 0 before a second
+        # measurement
+        if len(self.measurements) < 2:
+            return 0.0, 0.0
+
+        (t1, local1, remote1), (t2, local2, remote2) = self.measurements
+        if t2 <= t1:
+            return 0.0, 0.0
+        return (local2 - local1) / (t2 - t1), (remote2 - remote1) / (t2 - t1)
@@ -0,0 +1,93 @@
+import io
+import gzip
+from os import path
+
+
+# compressed logs are detected by magic bytes when read, and compressed
+# according to their file extensions when written
+MAGIC_BYTES = {'gzip': '\x1f\x8b', 'zstd': '\x28\xb5\x2f\xfd',
+               'lz4': '\x04\x22\x4d\x18'}
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+
+
+class ZstdReader(io.BufferedReader):
+    # buffered zstd stream reader that also closes the compressed file
+    def __init__(self, file_path):
+        import zstandard
+
+        self.compressed = open(file_path, 'rb')
+        super(ZstdReader, self).__init__(
+            zstandard.ZstdDecompressor().stream_reader(self.compressed))
+
+    def close(self):
+        super(ZstdReader, self).close()
+        self.compressed.close()
+
+
+def detect_compression(file_path):
+    with open(file_path, 'rb') as f:
+        magic = f.read(4)
+
+    for compression in MAGIC_BYTES:
+        if magic.startswith(MAGIC_BYTES[compression]):
+            return compression
+
+    return None
+
+
+def compression_by_extension(file_path):
+    for compression in EXTENSIONS:
+        if file_path.endswith(EXTENSIONS[compression]):
+            return compression
+
+    return None
+
+
+def open_file(file_path, mode='r'):
+    # open a plain or compressed file for streaming reads (mode 'r') or
+    # writes (mode 'w'); zstd and lz4 require the zstandard and lz4 packages
+    if mode not in ['r', 'w']:
+        raise ValueError('mode must be "r" or "w"')
+
+    if mode == 'r':
+        compression = detect_compression(file_path)
+    else:
+        compression = compression_by_extension(file_path)
+
+    try:
+        if compression == 'gzip':
+            return gzip.open(file_path, mode + 'b')
+
+        if compression == 'zstd':
+            if mode == 'r':
+                return ZstdReader(file_path)
+
+            import zstandard
+            return zstandard.ZstdCompressor().stream_writer(
+                open(file_path, 'wb'))
+
+        if compression == 'lz4':
+            import lz4.frame
+            return lz4.frame.open(file_path, mode + 'b')
+    except ImportError as exception:
+        raise IOError('cannot open %s compressed file %s: %s'
+                      % (compression, file_path, exception))
+
+    return open(file_path, mode)
+
+
+def is_compressed(file_path):
+    return detect_compression(file_path) is not None
+
+
+def find_file(file_path):
+    # return file_path, or its compressed version if only that exists
+    if path.isfile(file_path):
+        return file_path
+
+    for compression in ['gzip', 'zstd', 'lz4']:
+        compressed_path = file_path + EXTENSIONS[compression]
+        if path.isfile(compressed_path):
+            return compressed_path
+
+    return None
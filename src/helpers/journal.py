@@ -0,0 +1,63 @@
+import json
+import hashlib
+from os import path
+
+from utils import utc_time
+
+
+# The journal of a campaign of tests is a log in the data directory with a
+# JSON line appended whenever a run starts, finishes or fails, recording the
+# scheme, run ID and a hash of the test configuration. A run is completed if
+# its last line with the current configuration hash says so; lines are
+# appended in single writes so that tests run in parallel can share it.
+
+JOURNAL_NAME = 'pantheon_journal.log'
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+# test metadata that changes which runs are done but not their results
+RUN_CONTROL_KEYS = [
+    'run_times', 'start_run_id', 'random_order', 'cc_schemes', 'parallel',
+    'cpus_per_test', 'pipeline', 'resume', 'config_file', 'sweep',
+    'ntp_max_age', 'fused_merge', 'no_merged_logs', 'background_download',
+    'pkill_cleanup']
+
+
+def config_hash(meta):
+    config = dict((key, value) for key, value in meta.iteritems()
+                  if key not in RUN_CONTROL_KEYS)
+    return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()[:12]
+
+
+class Journal(object):
+    def __init__(self, data_dir, config_hash):
+        self.path = path.join(data_dir, JOURNAL_NAME)
+        self.config_hash = config_hash
+
+    def record(self, cc, run_id, state):
+        line = json.dumps({'cc': cc, 'run_id': run_id, 'state': state,
+                           'config_hash': self.config_hash,
+                           'time': utc_time()}, sort_keys=True) + '\n'
+        with open(self.path, 'a') as journal:
+            journal.write(line)
+
+    def last_states(self):
+        # return the last state of every (cc, run_id) in the journal along
+        # with its configuration hash
+        states = {}
+        if not path.isfile(self.path):
+            return states
+
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                    states[(entry['cc'], entry['run_id'])] = (
+                        entry['state'], entry['config_hash'])
+                except (ValueError, KeyError):
+                    # a line cut short by a crash
+                    continue
+
+        return states
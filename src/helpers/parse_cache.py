@@ -0,0 +1,58 @@
+import os
+from os import path
+import sys
+import cPickle as pickle
+
+
+# Results parsed from a log are saved in a sidecar file next to the log,
+# named LOG.KIND.cache, along with a key made of the log's absolute path,
+# size and mtime plus the parser's own parameters (e.g., version and bin
+# size). A cached result is only used when the whole key matches.
+
+
+def cache_path(log_path, kind):
+    return '%s.%s.cache' % (log_path, kind)
+
+
+def cache_key(log_path, params):
+    stat = os.stat(log_path)
+
+    key = {'path': path.abspath(log_path),
+           'size': stat.st_size,
+           'mtime': stat.st_mtime}
+    key.update(params)
+    return key
+
+
+def load(log_path, kind, params):
+    # return the cached result, or None if missing or out of date
+    sidecar = cache_path(log_path, kind)
+    if not path.isfile(sidecar):
+        return None
+
+    try:
+        with open(sidecar, 'rb') as cache:
+            key, result = pickle.load(cache)
+    except Exception as exception:
+        sys.stderr.write('Warning: ignored unreadable cache %s: %s\n'
+                         % (sidecar, exception))
+        return None
+
+    if key != cache_key(log_path, params):
+        return None
+
+    return result
+
+
+def save(log_path, kind, params, result):
+    sidecar = cache_path(log_path, kind)
+    tmp_sidecar = '%s.%d.tmp' % (sidecar, os.getpid())
+
+    try:
+        with open(tmp_sidecar, 'wb') as cache:
+            pickle.dump((cache_key(log_path, params), result), cache,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_sidecar, sidecar)
+    except (IOError, OSError) as exception:
+        sys.stderr.write('Warning: failed to save cache %s: %s\n'
+                         % (sidecar, exception))
@@ -0,0 +1,97 @@
+import math
+import numpy as np
+
+import tunnel_log
+
+
+class LogHistogram(object):
+    # A mergeable quantile sketch that counts values in buckets of
+    # logarithmically increasing width, so memory only grows with the range
+    # of values rather than their number. A percentile returned by
+    # percentile() is within a relative error of `accuracy` of the exact
+    # percentile computed by np.percentile(..., interpolation='nearest');
+    # values whose magnitude is below `min_value` are counted as zero.
+    def __init__(self, accuracy=0.01, min_value=1e-3):
+        self.accuracy = accuracy
+        self.min_value = min_value
+        self.gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        self.count = 0
+        self.zeros = 0
+
+        # bucket i covers (gamma^(i-1), gamma^i] of absolute values
+        empty = np.empty(0, dtype=np.int64)
+        self.positive = (empty, empty)
+        self.negative = (empty, empty)
+
+    def bucket_ids(self, abs_values):
+        return np.ceil(np.log(abs_values) / self.log_gamma).astype(np.int64)
+
+    def merge_buckets(self, buckets, bucket_ids, counts):
+        return tunnel_log.bin_sums(np.concatenate((buckets[0], bucket_ids)),
+                                   np.concatenate((buckets[1], counts)))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+
+        is_zero = np.abs(values) < self.min_value
+        self.zeros += int(is_zero.sum())
+
+        for sign in [1, -1]:
+            abs_values = sign * values[~is_zero & (sign * values > 0)]
+            if len(abs_values) == 0:
+                continue
+
+            bucket_ids = self.bucket_ids(abs_values)
+            counts = np.ones(len(bucket_ids), dtype=np.int64)
+            if sign == 1:
+                self.positive = self.merge_buckets(
+                    self.positive, bucket_ids, counts)
+            else:
+                self.negative = self.merge_buckets(
+                    self.negative, bucket_ids, counts)
+
+    def merge(self, other):
+        if (other.accuracy != self.accuracy or
+                other.min_value != self.min_value):
+            raise ValueError('cannot merge sketches with different settings')
+
+        self.count += other.count
+        self.zeros += other.zeros
+        self.positive = self.merge_buckets(self.positive, *other.positive)
+        self.negative = self.merge_buckets(self.negative, *other.negative)
+
+    def bucket_value(self, bucket_id):
+        # the value within 'accuracy' of every value in the bucket
+        return 2.0 * math.pow(self.gamma, bucket_id) / (self.gamma + 1.0)
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+
+        # rank of the 'nearest' percentile in np.percentile
+        rank = int(np.around(q / 100.0 * (self.count - 1)))
+
+        # walk buckets in increasing order of the values they contain
+        buckets = []
+        neg_ids, neg_counts = self.negative
+        for i in xrange(len(neg_ids) - 1, -1, -1):
+            buckets.append((-self.bucket_value(neg_ids[i]), neg_counts[i]))
+        buckets.append((0.0, self.zeros))
+        pos_ids, pos_counts = self.positive
+        for i in xrange(len(pos_ids)):
+            buckets.append((self.bucket_value(pos_ids[i]), pos_counts[i]))
+
+        seen = 0
+        for value, count in buckets:
+            seen += count
+            if seen > rank:
+                return value
+
+        return buckets[-1][0]
@@ -0,0 +1,285 @@
+import os
+from os import path
+import json
+import time
+import threading
+
+import compression
+from utils import allowed_cpus
+
+
+# A resource sampler reads the CPU time, RSS, context switches and running
+# threads of the processes that a run starts (the descendants of its root
+# processes) from /proc every INTERVAL seconds, sums them up per component
+# and appends a JSON line per sample to a log. Only local processes are
+# sampled; in remote mode, that leaves out those on the remote side.
+#
+# A component is CPU-saturated in a sample when any of its threads used at
+# least SATURATED_CPU percent of a core, or all of it together that much of
+# every CPU the run may use.
+
+INTERVAL = 1.0
+SATURATED_CPU = 90.0
+
+# samples in which a component must be saturated to flag its run
+SATURATED_SAMPLES = 3
+
+COMPONENTS = ['sender', 'receiver', 'tunnel', 'emulator', 'other']
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def component(argv):
+    # the component of a process by its command line, or None to count it
+    # in that of its parent
+    for i, arg in enumerate(argv[:-1]):
+        if arg.endswith('.py') and argv[i + 1] in ['sender', 'receiver']:
+            return argv[i + 1]
+
+    name = path.basename(argv[0]) if argv else ''
+    if name in ['mm-tunnelclient', 'mm-tunnelserver'] or any(
+            arg.endswith('tunnel_manager.py') for arg in argv[:2]):
+        return 'tunnel'
+    if name in ['mm-link', 'mm-delay', 'mm-loss']:
+        return 'emulator'
+
+    return None
+
+
+def read_stat(stat_path):
+    # state, parent PID, CPU ticks, threads and RSS in bytes from a stat file
+    with open(stat_path) as stat_file:
+        stat = stat_file.read()
+
+    # the command name in parentheses may contain spaces
+    fields = stat[stat.rfind(')') + 2:].split()
+    return (fields[0], int(fields[1]), int(fields[11]) + int(fields[12]),
+            int(fields[17]), int(fields[21]) * PAGE_SIZE)
+
+
+def read_ctxt_switches(status_path):
+    voluntary = nonvoluntary = 0
+    with open(status_path) as status:
+        for line in status:
+            if line.startswith('voluntary_ctxt_switches:'):
+                voluntary = int(line.split()[1])
+            elif line.startswith('nonvoluntary_ctxt_switches:'):
+                nonvoluntary = int(line.split()[1])
+
+    return voluntary, nonvoluntary
+
+
+def read_procs_running():
+    # threads running or runnable on the whole host right now
+    with open('/proc/stat') as stat:
+        for line in stat:
+            if line.startswith('procs_running'):
+                return int(line.split()[1])
+
+    return None
+
+
+def read_cpu_pressure():
+    # share of the last 10 seconds in which some runnable threads waited
+    # for a CPU, if the kernel tracks pressure stalls
+    try:
+        with open('/proc/pressure/cpu') as pressure:
+            for line in pressure:
+                if line.startswith('some'):
+                    return float(line.split()[1].split('=')[1])
+    except (IOError, IndexError, ValueError):
+        pass
+
+    return None
+
+
+class ResourceSampler(object):
+    def __init__(self, log_path, root_pids, cpus=None, interval=INTERVAL):
+        # root_pids is called for the PIDs of the root processes at every
+        # sample as they come and go during a run; cpus is the number of
+        # CPUs that the run may use
+        self.log_path = log_path
+        self.root_pids = root_pids
+        self.cpus = cpus or len(allowed_cpus())
+        self.interval = interval
+
+        # CPU ticks and context switches of every thread at the last sample
+        self.last_time = None
+        self.last_ticks = {}
+        self.last_ctxt = {}
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        with open(self.log_path, 'w') as log:
+            log.write(json.dumps({'interval': self.interval,
+                                  'cpus': self.cpus}) + '\n')
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            start_time = time.time()
+            try:
+                sample = self.sample()
+            except (IOError, OSError):
+                sample = None  # e.g., /proc is missing
+
+            if sample is not None:
+                with open(self.log_path, 'a') as log:
+                    log.write(json.dumps(sample, sort_keys=True) + '\n')
+
+            self.stopped.wait(
+                max(self.interval - (time.time() - start_time), 0))
+
+    def processes(self):
+        # component of every descendant of the root processes, and the
+        # threads of every process; processes that exit meanwhile are left
+        # out
+        roots = set(self.root_pids())
+        children = {}
+        procs = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            try:
+                procs[pid] = read_stat('/proc/%d/stat' % pid)
+            except (IOError, IndexError, ValueError):
+                continue
+            children.setdefault(procs[pid][1], []).append(pid)
+
+        components = {}
+        stack = [(pid, 'other') for pid in roots if pid in procs]
+        while stack:
+            pid, parent_component = stack.pop()
+            try:
+                with open('/proc/%d/cmdline' % pid) as cmdline:
+                    argv = cmdline.read().split('\0')[:-1]
+            except IOError:
+                continue
+
+            components[pid] = component(argv) or parent_component
+            stack += [(child, components[pid])
+                      for child in children.get(pid, [])]
+
+        return components, procs
+
+    def sample(self):
+        now = time.time()
+        components, procs = self.processes()
+
+        groups = dict((c, {'cpu': 0.0, 'max_thread_cpu': 0.0, 'rss': 0,
+                           'voluntary_ctxt': 0, 'nonvoluntary_ctxt': 0,
+                           'running': 0, 'processes': 0})
+                      for c in COMPONENTS)
+        ticks = {}
+        ctxt = {}
+        elapsed = now - self.last_time if self.last_time else None
+
+        for pid, comp in components.iteritems():
+            state, _, _, threads, rss = procs[pid]
+            group = groups[comp]
+            group['processes'] += 1
+            group['rss'] += rss
+
+            # threads of a process, and the process itself as its only
+            # thread if it has one
+            tids = [pid]
+            if threads > 1:
+                try:
+                    tids = map(int, os.listdir('/proc/%d/task' % pid))
+                except OSError:
+                    continue
+
+            for tid in tids:
+                task_dir = '/proc/%d/task/%d' % (pid, tid)
+                try:
+                    if tid == pid and threads == 1:
+                        task_state, task_ticks = state, procs[pid][2]
+                    else:
+                        task_state, _, task_ticks, _, _ = read_stat(
+                            path.join(task_dir, 'stat'))
+                    task_ctxt = read_ctxt_switches(
+                        path.join(task_dir, 'status'))
+                except (IOError, OSError, IndexError, ValueError):
+                    continue
+
+                ticks[tid] = task_ticks
+                ctxt[tid] = task_ctxt
+                if task_state == 'R':
+                    group['running'] += 1
+
+                # threads started since the last sample count from 0, and
+                # the ticks of a process that started threads since then
+                # were not those of its main thread
+                if elapsed:
+                    cpu = max(100.0 * (task_ticks - self.last_ticks.get(
+                        tid, 0)) / CLK_TCK / elapsed, 0)
+                    group['cpu'] += cpu
+                    group['max_thread_cpu'] = max(
+                        group['max_thread_cpu'], cpu)
+
+                    last_ctxt = self.last_ctxt.get(tid, (0, 0))
+                    group['voluntary_ctxt'] += max(
+                        task_ctxt[0] - last_ctxt[0], 0)
+                    group['nonvoluntary_ctxt'] += max(
+                        task_ctxt[1] - last_ctxt[1], 0)
+
+        self.last_time = now
+        self.last_ticks = ticks
+        self.last_ctxt = ctxt
+
+        # the first sample only sets the counters to compute the next from
+        if elapsed is None:
+            return None
+
+        for group in groups.itervalues():
+            group['saturated'] = (
+                group['max_thread_cpu'] >= SATURATED_CPU or
+                group['cpu'] >= SATURATED_CPU * self.cpus)
+
+        return {'time': now, 'components': groups,
+                'procs_running': read_procs_running(),
+                'cpu_pressure': read_cpu_pressure()}
+
+
+def load(log_path):
+    # the header and the samples of a (possibly compressed) resource log
+    with compression.open_file(log_path) as log:
+        header = json.loads(log.readline())
+        samples = []
+        for line in log:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                continue  # a line cut short by a crash
+
+    return header, samples
+
+
+def saturated_components(log_path, min_samples=SATURATED_SAMPLES):
+    # components that were CPU-saturated in at least min_samples samples of
+    # a resource log: (component, saturated samples, samples)
+    _, samples = load(log_path)
+
+    saturated = []
+    for comp in COMPONENTS:
+        count = sum(1 for sample in samples
+                    if sample['components'][comp]['saturated'])
+        if count >= min_samples:
+            saturated.append((comp, count, len(samples)))
+
+    return saturated
@@ -0,0 +1,190 @@
+import copy
+import json
+import itertools
+from os import path
+import sys
+
+
+# A sweep in the test config runs the same schemes and runs under every
+# cell of a matrix of emulation settings, e.g.,
+#
+#   sweep:
+#     matrix:           # cartesian product of the listed values
+#       trace: [12mbps.trace, 24mbps.trace]
+#       delay: [10, 50]
+#       loss: [0, 0.01]
+#     cells:            # and/or cells listed one by one
+#       - {trace: 12mbps.trace, delay: 100, queue: droptail, queue_size: 200}
+#
+# Every cell is tested in a subdirectory of the data directory, named after
+# its settings, with its own pantheon_metadata.json for the analysis tools;
+# pantheon_sweep.json in the data directory lists the cells.
+
+SWEEP_NAME = 'pantheon_sweep.json'
+
+# trace sets both uplink_trace and downlink_trace; delay (ms) runs the cell
+# in mm-delay and loss (rate) in mm-loss in both directions; queue and
+# queue_size (packets), plus any queue_args, set the queues of mm-link in both
+# directions
+SWEEP_PARAMS = ['trace', 'uplink_trace', 'downlink_trace', 'delay', 'queue',
+                'queue_size', 'queue_args', 'loss']
+
+
+def expand(sweep):
+    # return the cells of a sweep in order, without duplicates
+    if not isinstance(sweep, dict) or not (
+            set(sweep.keys()) <= set(['matrix', 'cells'])):
+        sys.exit('sweep must have a matrix and/or a list of cells')
+
+    cells = []
+
+    matrix = sweep.get('matrix') or {}
+    params = sorted(matrix.keys())
+    if params:
+        values = [v if isinstance(v, list) else [v]
+                  for v in [matrix[p] for p in params]]
+        for cell_values in itertools.product(*values):
+            cells.append(dict(zip(params, cell_values)))
+
+    cells += sweep.get('cells') or []
+
+    unique_cells = []
+    for cell in cells:
+        if not isinstance(cell, dict):
+            sys.exit('sweep cell %s is not a mapping of settings' % cell)
+        for param in cell:
+            if param not in SWEEP_PARAMS:
+                sys.exit('unknown sweep setting %s (must be one of %s)'
+                         % (param, ', '.join(SWEEP_PARAMS)))
+
+        cell = normalize(cell)
+        if cell not in unique_cells:
+            unique_cells.append(cell)
+
+    return unique_cells
+
+
+def normalize(cell):
+    # drop settings that make no difference so that identical cells compare
+    # equal
+    cell = dict(cell)
+
+    trace = cell.pop('trace', None)
+    if trace is not None:
+        cell.setdefault('uplink_trace', trace)
+        cell.setdefault('downlink_trace', trace)
+
+    for param in ['uplink_trace', 'downlink_trace']:
+        if param in cell:
+            cell[param] = path.abspath(cell[param])
+
+    if cell.get('delay') in [None, 0]:
+        cell.pop('delay', None)
+    if cell.get('loss') in [None, 0]:
+        cell.pop('loss', None)
+
+    if cell.get('queue', 'infinite') == 'infinite':
+        if 'queue_size' in cell or 'queue_args' in cell:
+            cell.setdefault('queue', 'droptail')
+        else:
+            cell.pop('queue', None)
+
+    return cell
+
+
+def cell_name(cell):
+    parts = []
+
+    traces = [cell.get(p) for p in ['uplink_trace', 'downlink_trace']]
+    traces = [path.splitext(path.basename(t))[0] if t else 'default'
+              for t in traces]
+    if traces != ['default', 'default']:
+        parts.append(traces[0] if traces[0] == traces[1] else '-'.join(traces))
+
+    if 'delay' in cell:
+        parts.append('delay%s' % cell['delay'])
+    if 'queue' in cell:
+        parts.append(cell['queue'] + str(cell.get('queue_size', '')))
+    if 'queue_args' in cell:
+        parts.append(cell['queue_args'].replace('=', '').replace(',', '-'))
+    if 'loss' in cell:
+        parts.append('loss%s' % cell['loss'])
+
+    return '_'.join(parts) or 'default'
+
+
+def cell_args(args, cell, name):
+    # return a copy of the test arguments to test a cell with
+    cell_args = copy.copy(args)
+    cell_args.data_dir = path.join(args.data_dir, name)
+    cell_args.sweep_cell = name
+
+    for param in ['uplink_trace', 'downlink_trace']:
+        if param in cell:
+            setattr(cell_args, param, cell[param])
+
+    prepend_mm_cmds = []
+    if args.prepend_mm_cmds:
+        prepend_mm_cmds.append(args.prepend_mm_cmds)
+    if 'delay' in cell:
+        prepend_mm_cmds.append('mm-delay %s' % cell['delay'])
+    if 'loss' in cell:
+        prepend_mm_cmds.append('mm-loss uplink %s mm-loss downlink %s'
+                               % (cell['loss'], cell['loss']))
+    cell_args.prepend_mm_cmds = ' '.join(prepend_mm_cmds) or None
+
+    extra_mm_link_args = []
+    if args.extra_mm_link_args:
+        extra_mm_link_args.append(args.extra_mm_link_args)
+    if 'queue' in cell:
+        queue_args = []
+        if 'queue_size' in cell:
+            queue_args.append('packets=%s' % cell['queue_size'])
+        if 'queue_args' in cell:
+            queue_args.append(cell['queue_args'])
+
+        for link in ['uplink', 'downlink']:
+            extra_mm_link_args.append('--%s-queue=%s' % (link, cell['queue']))
+            if queue_args:
+                extra_mm_link_args.append(
+                    '--%s-queue-args=%s' % (link, ','.join(queue_args)))
+    cell_args.extra_mm_link_args = ' '.join(extra_mm_link_args) or None
+
+    return cell_args
+
+
+def expand_args(args):
+    # return the test arguments of every cell of the sweep in args, and
+    # save the list of cells in the data directory
+    cells = expand(args.sweep)
+
+    names = []
+    sweep_cells = []
+    for cell in cells:
+        name = cell_name(cell)
+        # cells with traces of the same name differ in their paths
+        if name in names:
+            name += '_%d' % (len(names) + 1)
+        names.append(name)
+
+        sweep_cells.append({'name': name, 'data_dir': name,
+                            'settings': cell})
+
+    with open(path.join(args.data_dir, SWEEP_NAME), 'w') as sweep_file:
+        json.dump({'cells': sweep_cells}, sweep_file, sort_keys=True,
+                  indent=4, separators=(',', ': '))
+
+    return [cell_args(args, cell, name) for cell, name in zip(cells, names)]
+
+
+def load_cells(data_dir):
+    # return the data directories of the cells of a sweep tested in
+    # data_dir, or None if data_dir is not a sweep
+    sweep_path = path.join(data_dir, SWEEP_NAME)
+    if not path.isfile(sweep_path):
+        return None
+
+    with open(sweep_path) as sweep_file:
+        cells = json.load(sweep_file)['cells']
+
+    return [path.join(data_dir, cell['data_dir']) for cell in cells]
@@ -0,0 +1,148 @@
+import os
+from os import path
+import sys
+import json
+import time
+import threading
+
+
+# The timeline of a campaign of tests is a log in the data directory with a
+# JSON line appended whenever a timed phase of the tests ends (a span), in a
+# single write so that tests run in parallel and post-processing workers can
+# share it as they share the journal. When the tests are done, it is exported
+# as Chrome trace events, which chrome://tracing and ui.perfetto.dev open, and
+# summed up per phase.
+
+TIMELINE_NAME = 'pantheon_timeline.log'
+TRACE_NAME = 'pantheon_trace.json'
+SUMMARY_NAME = 'pantheon_phases.log'
+
+
+class NoSpan(object):
+    # span() of no timeline
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Span(object):
+    def __init__(self, timeline, phase, args):
+        self.timeline = timeline
+        self.phase = phase
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.timeline.record(self.phase, self.start, time.time(), **self.args)
+        return False
+
+
+class Timeline(object):
+    def __init__(self, data_dir):
+        self.path = path.join(data_dir, TIMELINE_NAME)
+        self.trace_path = path.join(data_dir, TRACE_NAME)
+        self.summary_path = path.join(data_dir, SUMMARY_NAME)
+
+    def clear(self):
+        if path.isfile(self.path):
+            os.remove(self.path)
+
+    def span(self, phase, **args):
+        # time the block of a with statement as phase, with args (e.g., the
+        # scheme and run ID) to tell its spans apart
+        return Span(self, phase, args)
+
+    def record(self, phase, start, end, **args):
+        line = json.dumps({'phase': phase, 'start': start, 'end': end,
+                           'pid': os.getpid(),
+                           'tid': threading.current_thread().name,
+                           'args': args}, sort_keys=True) + '\n'
+        with open(self.path, 'a') as timeline:
+            timeline.write(line)
+
+    def spans(self):
+        spans = []
+        if not path.isfile(self.path):
+            return spans
+
+        with open(self.path) as timeline:
+            for line in timeline:
+                try:
+                    span = json.loads(line)
+                    if span['end'] >= span['start']:
+                        spans.append(span)
+                except (ValueError, KeyError, TypeError):
+                    # a line cut short by a crash
+                    continue
+
+        return spans
+
+    def export(self):
+        # write the Chrome trace and the per-phase summary of the spans so
+        # far, and print the summary
+        spans = self.spans()
+        if not spans:
+            return
+
+        with open(self.trace_path, 'w') as trace:
+            json.dump(chrome_trace(spans), trace)
+
+        summary = summarize(spans)
+        with open(self.summary_path, 'w') as summary_log:
+            summary_log.write(summary)
+        sys.stderr.write(summary)
+        sys.stderr.write('Timeline of the tests saved to %s\n'
+                         % self.trace_path)
+
+
+def chrome_trace(spans):
+    # complete events ('X') in microseconds since the first span started, on
+    # a track for every thread of every process
+    t0 = min(span['start'] for span in spans)
+
+    tids = {}
+    events = []
+    for span in sorted(spans, key=lambda s: s['start']):
+        track = (span['pid'], span['tid'])
+        if track not in tids:
+            tids[track] = len(tids) + 1
+            events.append({'ph': 'M', 'name': 'thread_name',
+                           'pid': span['pid'], 'tid': tids[track],
+                           'args': {'name': span['tid']}})
+
+        events.append({'ph': 'X', 'name': span['phase'], 'cat': 'pantheon',
+                       'ts': int((span['start'] - t0) * 1e6),
+                       'dur': int((span['end'] - span['start']) * 1e6),
+                       'pid': span['pid'], 'tid': tids[track],
+                       'args': span['args']})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def summarize(spans):
+    # wall time spent in every phase, the longest first
+    durations = {}
+    for span in spans:
+        durations.setdefault(span['phase'], []).append(
+            span['end'] - span['start'])
+
+    total = max(s['end'] for s in spans) - min(s['start'] for s in spans)
+
+    lines = ['Wall time per phase over %.2f seconds:\n' % total,
+             '%-28s %6s %10s %9s %9s\n'
+             % ('phase', 'count', 'total (s)', 'mean (s)', 'max (s)')]
+    for phase, durs in sorted(durations.iteritems(),
+                              key=lambda item: -sum(item[1])):
+        lines.append('%-28s %6d %10.3f %9.3f %9.3f\n'
+                     % (phase, len(durs), sum(durs),
+                        sum(durs) / len(durs), max(durs)))
+
+    return ''.join(lines)
@@ -0,0 +1,408 @@
+import os
+import mmap
+import struct
+import itertools
+from array import array
+from collections import namedtuple
+import numpy as np
+
+import compression
+
+
+# event types are stored as the ASCII code of the event character in logs
+OPPORTUNITY = ord('#')
+ARRIVAL = ord('+')
+DEPARTURE = ord('-')
+
+# read text logs in chunks of roughly this many bytes
+CHUNK_SIZE = 1 << 24
+
+# characters treated as whitespace by str.split()
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[ord(c) for c in ' \t\n\r\x0b\x0c']] = True
+
+
+# binary tunnel logs start with a fixed-size header (magic, init timestamp
+# and number of events) followed by one contiguous array per column
+BINARY_MAGIC = 'PANTHEON-TUNLOG\x01'
+BINARY_HEADER = struct.Struct('<16sdQ')
+BINARY_HEADER_SIZE = 64
+BINARY_COLUMNS = [('ts', '<f8'), ('delay', '<f8'), ('uid', '<i8'),
+                  ('size', '<i4'), ('flow', '<i4'), ('event', 'u1')]
+
+# array typecodes used to buffer each column of BinaryLogWriter
+WRITER_TYPECODES = {'ts': 'd', 'delay': 'd', 'uid': 'l', 'size': 'i',
+                    'flow': 'i', 'event': 'B'}
+
+
+# columns of the events in a tunnel log, one NumPy array per column;
+# delay is NaN for events other than departures, flow is 0 if not logged
+# and uid is -1 if unknown (text logs do not record packet uids)
+Events = namedtuple('Events', ['ts', 'event', 'size', 'delay', 'flow', 'uid'])
+
+
+def empty_events():
+    return Events(ts=np.empty(0, dtype=np.float64),
+                  event=np.empty(0, dtype=np.uint8),
+                  size=np.empty(0, dtype=np.int64),
+                  delay=np.empty(0, dtype=np.float64),
+                  flow=np.empty(0, dtype=np.int64),
+                  uid=np.empty(0, dtype=np.int64))
+
+
+def concatenate_events(events_list):
+    if not events_list:
+        return empty_events()
+
+    return Events(*[np.concatenate(column) for column in zip(*events_list)])
+
+
+def parse_text(data):
+    # parse a block of complete lines of a tunnel log (or mm-link log) into
+    # Events; comment lines starting with '#' are skipped
+    if not data:
+        return empty_events()
+
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+    is_ws = WHITESPACE[buf]
+
+    # a token starts at every non-whitespace byte following whitespace
+    tok_start = ~is_ws
+    tok_start[1:] &= is_ws[:-1]
+    tok_pos = np.flatnonzero(tok_start)
+
+    # map every token to the line it belongs to
+    newlines = np.flatnonzero(buf == ord('\n'))
+    tok_line = np.searchsorted(newlines, tok_pos)
+
+    # blank out comment lines
+    line_starts = np.r_[0, newlines + 1]
+    line_ends = np.r_[newlines, len(buf)]
+    is_comment = np.zeros(len(line_starts), dtype=bool)
+    nonempty = line_starts < line_ends
+    is_comment[nonempty] = buf[line_starts[nonempty]] == ord('#')
+    for start, end in zip(line_starts[is_comment], line_ends[is_comment]):
+        buf[start:end] = ord(' ')
+
+    keep = ~is_comment[tok_line]
+    tok_pos = tok_pos[keep]
+    tok_line = tok_line[keep]
+
+    if len(tok_pos) == 0:
+        return empty_events()
+
+    # offset of the first token and number of tokens on every event line
+    ntok = np.bincount(tok_line)
+    ntok = ntok[ntok > 0]
+    offs = np.r_[0, np.cumsum(ntok)[:-1]]
+
+    # the event type is the (single-character) second token of each line;
+    # blank it out as well so that the remaining tokens are all numbers
+    event_pos = tok_pos[offs + 1]
+    event = buf[event_pos]
+    buf[event_pos] = ord(' ')
+
+    values = np.fromstring(buf.tostring(), dtype=np.float64, sep=' ')
+    if len(values) != len(tok_pos) - len(offs):
+        raise ValueError('malformed line in tunnel log')
+
+    # offsets of the numbers on every line without event types
+    offs -= np.arange(len(offs))
+
+    ts = values[offs]
+    size = values[offs + 1].astype(np.int64)
+
+    delay = np.full(len(offs), np.nan)
+    is_dep = event == DEPARTURE
+    delay[is_dep] = values[offs[is_dep] + 2]
+
+    # flow IDs are appended to arrivals and departures in merged logs
+    flow = np.zeros(len(offs), dtype=np.int64)
+    has_flow = ((event == ARRIVAL) & (ntok == 4)) | (is_dep & (ntok == 5))
+    flow[has_flow] = values[offs[has_flow] + ntok[has_flow] - 2]
+
+    uid = np.full(len(offs), -1, dtype=np.int64)
+
+    return Events(ts=ts, event=event, size=size, delay=delay, flow=flow,
+                  uid=uid)
+
+
+def iter_text_chunks(log, chunk_size=CHUNK_SIZE):
+    # yield blocks of complete lines from an open log file
+    while True:
+        data = log.read(chunk_size)
+        if not data:
+            break
+
+        if not data.endswith('\n'):
+            data += log.readline()
+
+        yield data
+
+
+def parse_packet_text(data):
+    # parse a block of complete 'ts-uid-size' lines of the ingress or egress
+    # log of a tunnel into arrays of timestamps, uids and sizes
+    values = np.fromstring(data.replace('-', ' '), dtype=np.float64, sep=' ')
+    if len(values) % 3 != 0:
+        raise ValueError('malformed line in ingress or egress log')
+
+    values = values.reshape(-1, 3)
+    return (values[:, 0].copy(), values[:, 1].astype(np.int64),
+            values[:, 2].astype(np.int64))
+
+
+def load_packet_log(log_path):
+    # return the init timestamp (or None if empty) of the ingress or egress
+    # log of a tunnel, whose first line ends with it, and arrays of the
+    # timestamps, uids and sizes of all packets
+    with compression.open_file(log_path) as log:
+        line = log.readline()
+        if not line:
+            return None, None
+
+        init_ts = float(line.rsplit(':', 1)[-1])
+
+        columns = [parse_packet_text(data)
+                   for data in iter_text_chunks(log)]
+
+    if not columns:
+        return init_ts, (np.empty(0, dtype=np.float64),
+                         np.empty(0, dtype=np.int64),
+                         np.empty(0, dtype=np.int64))
+
+    return init_ts, tuple(np.concatenate(column) for column in zip(*columns))
+
+
+def format_text(events):
+    # format Events as lines of a text tunnel log
+    lines = []
+    for ts, event, size, delay, flow in itertools.izip(
+            events.ts.tolist(), events.event.tolist(), events.size.tolist(),
+            events.delay.tolist(), events.flow.tolist()):
+        if event == DEPARTURE:
+            line = '%.3f - %d %.3f' % (ts, size, delay)
+        else:
+            line = '%.3f %s %d' % (ts, chr(event), size)
+
+        if flow != 0 and event != OPPORTUNITY:
+            line += ' %d' % flow
+        lines.append(line + '\n')
+
+    return ''.join(lines)
+
+
+def write_text(log_path, init_ts, events, chunk_events=1 << 18):
+    # write a text tunnel log, compressed if log_path ends in .gz, .zst or .lz4
+    with compression.open_file(log_path, 'w') as log:
+        log.write('# init timestamp: %.3f\n' % init_ts)
+
+        for start in xrange(0, len(events.ts), chunk_events):
+            log.write(format_text(
+                Events(*[column[start:start + chunk_events]
+                         for column in events])))
+
+
+def is_binary(log_path):
+    with open(log_path, 'rb') as log:
+        return log.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def read_binary_header(log):
+    magic, init_ts, num_events = BINARY_HEADER.unpack(
+        log.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC:
+        raise ValueError('%s is not a binary tunnel log' % log.name)
+
+    return init_ts, num_events
+
+
+def read_init_timestamp(log_path):
+    # return the init timestamp of a text or binary log, or None if missing
+    if is_binary(log_path):
+        with open(log_path, 'rb') as log:
+            return read_binary_header(log)[0]
+
+    with compression.open_file(log_path) as log:
+        for line in log:
+            if not line.startswith('#'):
+                break
+
+            if 'init timestamp' in line:
+                return float(line.split(':')[1])
+
+    return None
+
+
+def load_binary(log_path):
+    # memory-map the columns of a binary log; return init timestamp and Events
+    with open(log_path, 'rb') as log:
+        init_ts, num_events = read_binary_header(log)
+
+    if num_events == 0:
+        return init_ts, empty_events()
+
+    columns = {}
+    offset = BINARY_HEADER_SIZE
+    for name, dtype in BINARY_COLUMNS:
+        columns[name] = np.memmap(log_path, dtype=dtype, mode='r',
+                                  offset=offset, shape=(num_events,))
+        offset += num_events * np.dtype(dtype).itemsize
+
+    return init_ts, Events(**columns)
+
+
+def write_binary(log_path, init_ts, events):
+    # timestamps and delays are rounded to microseconds as in text logs
+    columns = events._asdict()
+    columns['ts'] = np.around(columns['ts'], 3)
+    columns['delay'] = np.around(columns['delay'], 3)
+
+    with open(log_path, 'wb') as log:
+        header = BINARY_HEADER.pack(BINARY_MAGIC, init_ts, len(events.ts))
+        log.write(header.ljust(BINARY_HEADER_SIZE, '\0'))
+
+        for name, dtype in BINARY_COLUMNS:
+            np.asarray(columns[name]).astype(dtype).tofile(log)
+
+
+class BinaryLogWriter(object):
+    # buffer events appended one at a time and write a binary log on close
+    def __init__(self, log_path, init_ts):
+        self.log_path = log_path
+        self.init_ts = init_ts
+        self.columns = {}
+        for name in WRITER_TYPECODES:
+            self.columns[name] = array(WRITER_TYPECODES[name])
+
+    def write(self, ts, event, size, delay=np.nan, flow=0, uid=-1):
+        self.columns['ts'].append(ts)
+        self.columns['event'].append(event)
+        self.columns['size'].append(size)
+        self.columns['delay'].append(delay)
+        self.columns['flow'].append(flow)
+        self.columns['uid'].append(uid)
+
+    def close(self):
+        columns = {}
+        for name in self.columns:
+            columns[name] = np.frombuffer(
+                self.columns[name], dtype=self.columns[name].typecode)
+
+        write_binary(self.log_path, self.init_ts, Events(**columns))
+
+
+def split_text(mm, parts):
+    # split a memory-mapped text log into byte ranges of similar size that
+    # are aligned to line boundaries
+    bounds = [0]
+    for i in xrange(1, parts):
+        newline = mm.find('\n', max(bounds[-1], len(mm) * i // parts))
+        bounds.append(len(mm) if newline == -1 else newline + 1)
+    bounds.append(len(mm))
+
+    return zip(bounds[:-1], bounds[1:])
+
+
+def iter_text_range(mm, start, end, chunk_size=CHUNK_SIZE):
+    # yield blocks of complete lines of a memory-mapped log in [start, end)
+    while start < end:
+        chunk_end = min(start + chunk_size, end)
+        if chunk_end < end:
+            newline = mm.find('\n', chunk_end - 1, end)
+            chunk_end = end if newline == -1 else newline + 1
+
+        yield mm[start:chunk_end]
+        start = chunk_end
+
+
+def num_parts(log_path, max_parts):
+    # number of parts (at most max_parts) worth parsing a log in parallel,
+    # i.e., with at least CHUNK_SIZE bytes each
+    if compression.is_compressed(log_path):
+        return 1
+
+    parts = os.path.getsize(log_path) // CHUNK_SIZE
+    return int(max(1, min(max_parts, parts)))
+
+
+def iter_events(log_path, chunk_size=CHUNK_SIZE, part=None):
+    # yield Events for consecutive chunks of a text (possibly compressed) or
+    # binary tunnel log in file order; part=(i, n) only yields the i-th of n
+    # parts of an uncompressed log
+    if is_binary(log_path):
+        events = load_binary(log_path)[1]
+
+        start = 0
+        end = len(events.ts)
+        if part is not None:
+            start, end = (end * part[0] // part[1],
+                          end * (part[0] + 1) // part[1])
+
+        # slice the memory-mapped columns into chunks of similar size
+        chunk_events = max(1, chunk_size // 16)
+        for chunk_start in xrange(start, end, chunk_events):
+            chunk_end = min(chunk_start + chunk_events, end)
+            yield Events(*[column[chunk_start:chunk_end]
+                           for column in events])
+        return
+
+    if part is None:
+        with compression.open_file(log_path) as log:
+            for data in iter_text_chunks(log, chunk_size):
+                yield parse_text(data)
+        return
+
+    if compression.is_compressed(log_path):
+        raise ValueError('cannot split compressed log %s' % log_path)
+
+    if os.path.getsize(log_path) == 0:
+        return
+
+    with open(log_path) as log:
+        mm = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start, end = split_text(mm, part[1])[part[0]]
+            for data in iter_text_range(mm, start, end, chunk_size):
+                yield parse_text(data)
+        finally:
+            mm.close()
+
+
+def read_first_timestamp(log_path):
+    # return the timestamp of the first event in a log, or None if no events
+    if is_binary(log_path):
+        events = load_binary(log_path)[1]
+        return float(events.ts[0]) if len(events.ts) else None
+
+    with compression.open_file(log_path) as log:
+        for line in log:
+            if line.startswith('#') or not line.split():
+                continue
+
+            return float(line.split()[0])
+
+    return None
+
+
+def load_events(log_path):
+    # return the init timestamp (or None) and all Events of a tunnel log
+    if is_binary(log_path):
+        return load_binary(log_path)
+
+    return (read_init_timestamp(log_path),
+            concatenate_events(list(iter_events(log_path))))
+
+
+def bin_sums(bin_ids, values):
+    # sum up integer values that share the same bin ID; return the sorted bin
+    # IDs that contain any values and the sums
+    if len(bin_ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    min_bin = bin_ids.min()
+    counts = np.bincount(bin_ids - min_bin)
+    sums = np.bincount(bin_ids - min_bin, weights=values)
+
+    present = np.flatnonzero(counts)
+    return present + min_bin, sums[present].astype(np.int64)
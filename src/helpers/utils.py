@@ -1,16 +1,21 @@
 import os
 from os import path
 import sys
+import time
 import socket
 import signal
 import errno
 import json
 import yaml
+import tempfile
+import threading
 import subprocess
+import multiprocessing
 from datetime import datetime
 
 import context
 from subprocess_wrappers import check_call, check_output, call
+from wrappers import registry
 
 
 def get_open_port():
@@ -34,6 +39,21 @@ def make_sure_dir_exists(d):
 tmp_dir = path.join(context.base_dir, 'tmp')
 make_sure_dir_exists(tmp_dir)
 
+# seconds to wait at most for the side that runs first to listen on its port
+RUN_FIRST_SETUP_TIME = 3
+
+# seconds between checks of whether a port is listened on
+PORT_POLL_INTERVAL = 0.05
+
+# directory of the control sockets of shared SSH connections; socket paths
+# are limited to about 100 characters, so it is kept out of tmp_dir
+SSH_CONTROL_DIR = path.join(tempfile.gettempdir(),
+                            'pantheon_ssh_%d' % os.getuid())
+
+# seconds for a shared SSH connection to stay open after its last use in
+# case it is not closed, e.g., if test.py is killed
+SSH_CONTROL_PERSIST = 600
+
 
 def parse_config():
     with open(path.join(context.src_dir, 'config.yml')) as config:
@@ -101,11 +121,123 @@ def verify_schemes_with_meta(schemes, meta):
     return cc_schemes
 
 
-def who_runs_first(cc):
-    cc_src = path.join(context.src_dir, 'wrappers', cc + '.py')
+def run_first_setup_time(cc):
+    # seconds to wait at most for the side of cc that runs first to listen;
+    # a scheme may set its own setup_time in src/config.yml
+    scheme_config = parse_config()['schemes'].get(cc, {})
+    return float(scheme_config.get('setup_time', RUN_FIRST_SETUP_TIME))
+
+
+def process_tree(pids):
+    # return pids and the pids of all their descendants
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open('/proc/%s/stat' % entry) as stat:
+                # the command name in parentheses may contain spaces
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, IndexError, ValueError):
+            continue
+
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = []
+    pending = list(pids)
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+
+    return tree
+
+
+def bound_ports(pid):
+    # ports of listening TCP sockets and of UDP sockets in the network
+    # namespace of process pid
+    ports = set()
+    for proto in ['tcp', 'tcp6', 'udp', 'udp6']:
+        try:
+            with open('/proc/%s/net/%s' % (pid, proto)) as sockets:
+                sockets.readline()
+                for line in sockets:
+                    fields = line.split()
+                    # TCP sockets in state 0A listen
+                    if proto.startswith('tcp') and fields[3] != '0A':
+                        continue
+                    ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+        except (IOError, IndexError, ValueError):
+            continue
+
+    return ports
+
+
+def port_is_bound(port, pids):
+    # return whether any process in the process trees of pids listens on port
+    namespaces = {}
+    for pid in process_tree(pids):
+        try:
+            namespace = os.readlink('/proc/%s/ns/net' % pid)
+        except OSError:
+            continue
+        namespaces.setdefault(namespace, pid)
+
+    for pid in namespaces.itervalues():
+        if int(port) in bound_ports(pid):
+            return True
+
+    return False
+
+
+def wait_for_port(port, pids, timeout):
+    # wait for at most timeout seconds until any process in the process trees
+    # of pids listens on port; return True if one does
+    deadline = time.time() + timeout
+
+    while not port_is_bound(port, pids):
+        if time.time() >= deadline:
+            return False
+
+        time.sleep(PORT_POLL_INTERVAL)
 
-    cmd = [cc_src, 'run_first']
-    run_first = check_output(cmd).strip()
+    return True
+
+
+def parse_cpu_list(cpu_list):
+    # parse a list of CPUs such as "0-3,8,10-11" into CPU numbers
+    cpus = []
+    for cpu_range in cpu_list.split(','):
+        first, _, last = cpu_range.partition('-')
+        cpus.extend(xrange(int(first), int(last or first) + 1))
+
+    return cpus
+
+
+def allowed_cpus():
+    # CPUs that this process is allowed to run on
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('Cpus_allowed_list:'):
+                return parse_cpu_list(line.split(':', 1)[1].strip())
+
+    return range(multiprocessing.cpu_count())
+
+
+def pin_to_cpus(pid, cpus):
+    # pin process pid, and the processes it starts afterwards, to cpus
+    check_output(['taskset', '-pc', ','.join(map(str, cpus)), str(pid)])
+
+
+def who_runs_first(cc):
+    # look cc up in the wrapper registry, and ask its wrapper otherwise
+    wrapper = registry.lookup(cc)
+    if wrapper is not None:
+        run_first = wrapper.run_first
+    else:
+        cc_src = path.join(context.src_dir, 'wrappers', cc + '.py')
+        run_first = check_output([cc_src, 'run_first']).strip()
 
     if run_first == 'receiver':
         run_second = 'sender'
@@ -124,9 +256,14 @@ def parse_remote_path(remote_path, cc=None):
     ret['src_dir'] = path.join(ret['base_dir'], 'src')
     ret['tmp_dir'] = path.join(ret['base_dir'], 'tmp')
     ret['ip'] = ret['host_addr'].split('@')[-1]
-    ret['ssh_cmd'] = ['ssh', ret['host_addr']]
+    ret['ssh_cmd'] = ['ssh'] + ssh_options() + [ret['host_addr']]
+    ret['scp_cmd'] = ['scp'] + ssh_options()
     ret['tunnel_manager'] = path.join(
         ret['src_dir'], 'experiments', 'tunnel_manager.py')
+    ret['log_transfer'] = path.join(
+        ret['src_dir'], 'experiments', 'log_transfer.py')
+    ret['remote_agent'] = path.join(
+        ret['src_dir'], 'experiments', 'remote_agent.py')
 
     if cc is not None:
         ret['cc_src'] = path.join(ret['src_dir'], 'wrappers', cc + '.py')
@@ -134,60 +271,104 @@ def parse_remote_path(remote_path, cc=None):
     return ret
 
 
-def query_clock_offset(ntp_addr, ssh_cmd):
-    local_clock_offset = None
-    remote_clock_offset = None
+def ssh_options():
+    # ssh and scp share the connection of the SSH master if it is running,
+    # and connect on their own otherwise
+    return ['-o', 'ControlMaster=no',
+            '-o', 'ControlPath=%s' % path.join(SSH_CONTROL_DIR, '%C')]
+
+
+def start_ssh_master(host_addr):
+    # open an SSH connection to host_addr in the background for all remote
+    # operations to share; return whether it was opened
+    make_sure_dir_exists(SSH_CONTROL_DIR)
+    os.chmod(SSH_CONTROL_DIR, 0700)
+
+    cmd = ['ssh', '-M', '-N', '-f',
+           '-o', 'ControlPath=%s' % path.join(SSH_CONTROL_DIR, '%C'),
+           '-o', 'ControlPersist=%d' % SSH_CONTROL_PERSIST, host_addr]
+    if call(cmd) != 0:
+        sys.stderr.write('Warning: failed to open a shared SSH connection to '
+                         '%s; connecting for every remote operation\n'
+                         % host_addr)
+        return False
+
+    return True
+
+
+def stop_ssh_master(host_addr):
+    cmd = ['ssh', '-O', 'exit',
+           '-o', 'ControlPath=%s' % path.join(SSH_CONTROL_DIR, '%C'),
+           host_addr]
+    call(cmd)
+
+
+def ntpdate_cmd(ntp_addr):
+    return ['ntpdate', '-t', '5', '-quv', ntp_addr]
+
+
+def query_clock_offset(ntp_addr, ssh_cmd, agent=None):
+    # query the local and remote sides at the same time, the remote side
+    # through the remote agent if there is one
+    offsets = {}
 
-    ntp_cmds = {}
-    ntpdate_cmd = ['ntpdate', '-t', '5', '-quv', ntp_addr]
+    def query(side):
+        if side == 'remote' and agent is not None:
+            query_ntp = lambda: agent.clock_offset(ntp_addr)
+        else:
+            cmd = ntpdate_cmd(ntp_addr)
+            if side == 'remote':
+                cmd = ssh_cmd + cmd
+            query_ntp = lambda: check_output(cmd)
 
-    ntp_cmds['local'] = ntpdate_cmd
-    ntp_cmds['remote'] = ssh_cmd + ntpdate_cmd
+        offsets[side] = query_one_clock_offset(query_ntp)
 
-    for side in ['local', 'remote']:
-        cmd = ntp_cmds[side]
+    threads = [threading.Thread(target=query, args=(side,))
+               for side in ['local', 'remote']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
-        fail = True
-        for _ in xrange(3):
-            try:
-                offset = check_output(cmd)
-                sys.stderr.write(offset)
+    return offsets.get('local'), offsets.get('remote')
 
-                offset = offset.rsplit(' ', 2)[-2]
-                offset = str(float(offset) * 1000)
-            except subprocess.CalledProcessError:
-                sys.stderr.write('Failed to get clock offset\n')
-            except ValueError:
-                sys.stderr.write('Cannot convert clock offset to float\n')
-            else:
-                if side == 'local':
-                    local_clock_offset = offset
-                else:
-                    remote_clock_offset = offset
 
-                fail = False
-                break
+def query_one_clock_offset(query_ntp):
+    # return the clock offset in ms that query_ntp() returns the ntpdate
+    # output of, or None after 3 failed queries
+    for _ in xrange(3):
+        try:
+            offset = query_ntp()
+            sys.stderr.write(offset)
 
-        if fail:
-            sys.stderr.write('Failed after 3 queries to NTP server\n')
+            offset = offset.rsplit(' ', 2)[-2]
+            return str(float(offset) * 1000)
+        except (subprocess.CalledProcessError, IOError, OSError):
+            sys.stderr.write('Failed to get clock offset\n')
+        except (ValueError, IndexError):
+            sys.stderr.write('Cannot convert clock offset to float\n')
 
-    return local_clock_offset, remote_clock_offset
+    sys.stderr.write('Failed after 3 queries to NTP server\n')
+    return None
 
 
-def get_git_summary(mode='local', remote_path=None):
+def get_git_summary(mode='local', remote_path=None, agent=None):
     git_summary_src = path.join(context.src_dir, 'experiments',
                                 'git_summary.sh')
     local_git_summary = check_output(git_summary_src, cwd=context.base_dir)
 
     if mode == 'remote':
-        r = parse_remote_path(remote_path)
+        if agent is not None:
+            remote_git_summary = agent.git_summary()
+        else:
+            r = parse_remote_path(remote_path)
 
-        git_summary_src = path.join(
-            r['src_dir'], 'experiments', 'git_summary.sh')
-        ssh_cmd = 'cd %s; %s' % (r['base_dir'], git_summary_src)
-        ssh_cmd = ' '.join(r['ssh_cmd']) + ' "%s"' % ssh_cmd
+            git_summary_src = path.join(
+                r['src_dir'], 'experiments', 'git_summary.sh')
+            ssh_cmd = 'cd %s; %s' % (r['base_dir'], git_summary_src)
+            ssh_cmd = ' '.join(r['ssh_cmd']) + ' "%s"' % ssh_cmd
 
-        remote_git_summary = check_output(ssh_cmd, shell=True)
+            remote_git_summary = check_output(ssh_cmd, shell=True)
 
         if local_git_summary != remote_git_summary:
             sys.stderr.write(
@@ -1,4 +1,7 @@
 import argparse
+import sys
+
+import registry
 
 
 def parse_wrapper_args(run_first):
@@ -47,3 +50,17 @@ def receiver_first():
 
 def sender_first():
     return parse_wrapper_args('sender')
+
+
+def parse_registered(cc):
+    # parse the arguments of the wrapper of cc as it runs first according to
+    # registry.py; if asked for its dependencies, print them from there and
+    # exit so that the wrapper runs nothing else
+    wrapper = registry.lookup(cc)
+    args = parse_wrapper_args(wrapper.run_first)
+
+    if args.option == 'deps':
+        print wrapper.deps
+        sys.exit(0)
+
+    return args
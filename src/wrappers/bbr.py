@@ -19,11 +19,7 @@ def setup_bbr():
 
 
 def main():
-    args = arg_parser.receiver_first()
-
-    if args.option == 'deps':
-        print 'iperf'
-        return
+    args = arg_parser.parse_registered('bbr')
 
     if args.option == 'setup_after_reboot':
         setup_bbr()
@@ -6,19 +6,15 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main(delta_conf):
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('copa')
 
     cc_repo = path.join(context.third_party_dir, 'genericCC')
-    recv_src = path.join(cc_repo, 'receiver')
-    send_src = path.join(cc_repo, 'sender')
-
-    if args.option == 'deps':
-        print ('makepp libboost-dev libprotobuf-dev protobuf-c-compiler '
-               'protobuf-compiler libjemalloc-dev libboost-python-dev')
-        return
+    recv_src = registry.binary('copa', 'receiver')
+    send_src = registry.binary('copa', 'sender')
 
     if args.option == 'setup':
         check_call(['makepp'], cwd=cc_repo)
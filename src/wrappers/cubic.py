@@ -6,11 +6,7 @@ import arg_parser
 
 
 def main():
-    args = arg_parser.receiver_first()
-
-    if args.option == 'deps':
-        print 'iperf'
-        return
+    args = arg_parser.parse_registered('cubic')
 
     if args.option == 'receiver':
         cmd = ['iperf', '-Z', 'cubic', '-s', '-p', args.port]
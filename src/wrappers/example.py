@@ -6,26 +6,21 @@ Use Python 2.7 and conform to PEP8.
 Use snake_case as file name and make this file executable.
 '''
 
-from os import path
 from subprocess import check_call
 
 import arg_parser
-import context
+import registry
 
 
 def main():
-    # use 'arg_parser' to ensure a common test interface
-    args = arg_parser.receiver_first()  # or 'arg_parser.sender_first()'
-
-    # paths to the sender and receiver executables, etc.
-    cc_repo = path.join(context.third_party_dir, 'example_cc_repo')
-    send_src = path.join(cc_repo, 'example_sender')
-    recv_src = path.join(cc_repo, 'example_receiver')
-
-    # [optional] dependencies of Debian packages
-    if args.option == 'deps':
-        print 'example_dep_1 example_dep_2'
-        return
+    # use 'arg_parser' to ensure a common test interface; which side runs
+    # first and the dependencies of Debian packages are registered in
+    # 'registry.py'
+    args = arg_parser.parse_registered('example')
+
+    # paths to the sender and receiver executables, etc., as registered
+    send_src = registry.binary('example', 'sender')
+    recv_src = registry.binary('example', 'receiver')
 
     # [optional] persistent setup that only needs to be run once
     if args.option == 'setup':
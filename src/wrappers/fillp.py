@@ -6,17 +6,18 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 from helpers import utils
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('fillp')
 
     cc_repo = path.join(context.third_party_dir, 'fillp')
     send_dir = path.join(cc_repo, 'client')
     recv_dir = path.join(cc_repo, 'server')
-    send_src = path.join(send_dir, 'client')
-    recv_src = path.join(recv_dir, 'server')
+    send_src = registry.binary('fillp', 'sender')
+    recv_src = registry.binary('fillp', 'receiver')
 
     if args.option == 'receiver':
         os.environ['LD_LIBRARY_PATH'] = recv_dir
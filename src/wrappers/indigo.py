@@ -5,14 +5,15 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.sender_first()
+    args = arg_parser.parse_registered('indigo')
 
     cc_repo = path.join(context.third_party_dir, 'indigo')
-    send_src = path.join(cc_repo, 'dagger', 'run_sender.py')
-    recv_src = path.join(cc_repo, 'env', 'run_receiver.py')
+    send_src = registry.binary('indigo', 'sender')
+    recv_src = registry.binary('indigo', 'receiver')
 
     if args.option == 'setup':
         check_call(['sudo pip install tensorflow==1.14.0'], shell=True)
@@ -7,13 +7,14 @@ import time
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('ledbat')
 
     cc_repo = path.join(context.third_party_dir, 'libutp')
-    src = path.join(cc_repo, 'ucat-static')
+    src = registry.binary('ledbat', 'sender')
 
     if args.option == 'setup':
         check_call(['make', '-j'], cwd=cc_repo)
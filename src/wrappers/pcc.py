@@ -6,17 +6,18 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 from helpers import utils
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('pcc')
 
     cc_repo = path.join(context.third_party_dir, 'pcc')
     recv_dir = path.join(cc_repo, 'receiver')
     send_dir = path.join(cc_repo, 'sender')
-    recv_src = path.join(recv_dir, 'app', 'appserver')
-    send_src = path.join(send_dir, 'app', 'appclient')
+    recv_src = registry.binary('pcc', 'receiver')
+    send_src = registry.binary('pcc', 'sender')
 
     if args.option == 'setup':
         # apply patch to reduce MTU size
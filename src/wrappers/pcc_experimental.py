@@ -6,17 +6,17 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('pcc_experimental')
 
     cc_repo = path.join(context.third_party_dir, 'pcc-experimental')
     src_dir = path.join(cc_repo, 'src')
     lib_dir = path.join(src_dir, 'core')
-    app_dir = path.join(src_dir, 'app')
-    send_src = path.join(app_dir, 'pccclient')
-    recv_src = path.join(app_dir, 'pccserver')
+    send_src = registry.binary('pcc_experimental', 'sender')
+    recv_src = registry.binary('pcc_experimental', 'receiver')
 
     if args.option == 'setup':
         check_call(['make'], cwd=src_dir)
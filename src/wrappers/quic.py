@@ -10,6 +10,7 @@ from subprocess import check_call, call
 
 import arg_parser
 import context
+import registry
 from helpers import utils
 
 
@@ -80,20 +81,16 @@ def setup_quic(cc_repo, cert_dir, html_dir):
 
 
 def main():
-    args = arg_parser.sender_first()
+    args = arg_parser.parse_registered('quic')
 
     cc_repo = path.join(context.third_party_dir, 'proto-quic')
-    send_src = path.join(cc_repo, 'src', 'out', 'Default', 'quic_server')
-    recv_src = path.join(cc_repo, 'src', 'out', 'Default', 'quic_client')
+    send_src = registry.binary('quic', 'sender')
+    recv_src = registry.binary('quic', 'receiver')
 
     cert_dir = path.join(context.src_dir, 'wrappers', 'quic-certs')
     html_dir = path.join(cc_repo, 'www.example.org')
     utils.make_sure_dir_exists(html_dir)
 
-    if args.option == 'deps':
-        print 'libnss3-tools libgconf-2-4'
-        return
-
     if args.option == 'setup':
         setup_quic(cc_repo, cert_dir, html_dir)
         return
@@ -0,0 +1,87 @@
+import os
+from os import path
+from collections import namedtuple
+
+
+# Static metadata of the scheme wrappers in this directory. The wrappers read
+# it through arg_parser.parse_registered() and binary(), and the tools that
+# run them look it up in process rather than running "<cc>.py run_first" or
+# "<cc>.py deps" in a new interpreter every time.
+#
+# run_first: the side that runs first, "receiver" or "sender"
+# deps: space-separated Debian packages to install before "<cc>.py setup"
+# binaries: the executables that the sender and receiver run, relative to
+#           third_party
+Wrapper = namedtuple('Wrapper', ['run_first', 'deps', 'binaries'])
+
+THIRD_PARTY_DIR = path.abspath(path.join(
+    path.dirname(__file__), os.pardir, os.pardir, 'third_party'))
+
+GENERIC_CC_DEPS = ('makepp libboost-dev libprotobuf-dev protobuf-c-compiler '
+                   'protobuf-compiler libjemalloc-dev libboost-python-dev')
+
+WRAPPERS = {
+    'bbr': Wrapper('receiver', 'iperf', {}),
+    'copa': Wrapper('receiver', GENERIC_CC_DEPS, {
+        'sender': 'genericCC/sender',
+        'receiver': 'genericCC/receiver'}),
+    'cubic': Wrapper('receiver', 'iperf', {}),
+    'example': Wrapper('receiver', 'example_dep_1 example_dep_2', {
+        'sender': 'example_cc_repo/example_sender',
+        'receiver': 'example_cc_repo/example_receiver'}),
+    'fillp': Wrapper('receiver', '', {
+        'sender': 'fillp/client/client',
+        'receiver': 'fillp/server/server'}),
+    'fillp_sheep': Wrapper('receiver', '', {
+        'sender': 'fillp-sheep/client/client',
+        'receiver': 'fillp-sheep/server/server'}),
+    'indigo': Wrapper('sender', '', {
+        'sender': 'indigo/dagger/run_sender.py',
+        'receiver': 'indigo/env/run_receiver.py'}),
+    'ledbat': Wrapper('receiver', '', {
+        'sender': 'libutp/ucat-static',
+        'receiver': 'libutp/ucat-static'}),
+    'pcc': Wrapper('receiver', '', {
+        'sender': 'pcc/sender/app/appclient',
+        'receiver': 'pcc/receiver/app/appserver'}),
+    'pcc_experimental': Wrapper('receiver', '', {
+        'sender': 'pcc-experimental/src/app/pccclient',
+        'receiver': 'pcc-experimental/src/app/pccserver'}),
+    'quic': Wrapper('sender', 'libnss3-tools libgconf-2-4', {
+        'sender': 'proto-quic/src/out/Default/quic_server',
+        'receiver': 'proto-quic/src/out/Default/quic_client'}),
+    'scream': Wrapper('receiver', '', {
+        'sender': 'scream-reproduce/src/ScreamClient',
+        'receiver': 'scream-reproduce/src/ScreamServer'}),
+    'sprout': Wrapper(
+        'receiver',
+        'libboost-math-dev libssl-dev libprotobuf-dev protobuf-compiler '
+        'libncurses5-dev', {
+            'sender': 'sprout/src/examples/sproutbt2',
+            'receiver': 'sprout/src/examples/sproutbt2'}),
+    'taova': Wrapper('receiver', GENERIC_CC_DEPS, {
+        'sender': 'genericCC/sender',
+        'receiver': 'genericCC/receiver'}),
+    'vegas': Wrapper('receiver', 'iperf', {}),
+    'verus': Wrapper(
+        'sender', 'libtbb-dev libasio-dev libalglib-dev libboost-system-dev', {
+            'sender': 'verus/src/verus_server',
+            'receiver': 'verus/src/verus_client'}),
+    'vivace': Wrapper('receiver', '', {
+        'sender': 'vivace/sender/vivace_sender',
+        'receiver': 'vivace/receiver/vivace_receiver'}),
+    'webrtc': Wrapper(
+        'sender',
+        'chromium-browser xvfb xfonts-100dpi xfonts-75dpi xfonts-cyrillic '
+        'xorg dbus-x11 npm nodejs', {}),
+}
+
+
+def lookup(cc):
+    # return the metadata of the wrapper of cc, or None if not registered
+    return WRAPPERS.get(cc)
+
+
+def binary(cc, side):
+    # return the path of the executable that side of cc runs
+    return path.join(THIRD_PARTY_DIR, WRAPPERS[cc].binaries[side])
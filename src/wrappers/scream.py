@@ -5,14 +5,15 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('scream')
 
     cc_repo = path.join(context.third_party_dir, 'scream-reproduce')
-    recv_src = path.join(cc_repo, 'src', 'ScreamServer')
-    send_src = path.join(cc_repo, 'src', 'ScreamClient')
+    recv_src = registry.binary('scream', 'receiver')
+    send_src = registry.binary('scream', 'sender')
 
     if args.option == 'setup':
         sh_cmd = './autogen.sh && ./configure && make -j'
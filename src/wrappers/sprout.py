@@ -6,20 +6,16 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 from helpers import utils
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('sprout')
 
     cc_repo = path.join(context.third_party_dir, 'sprout')
     model = path.join(cc_repo, 'src', 'examples', 'sprout.model')
-    src = path.join(cc_repo, 'src', 'examples', 'sproutbt2')
-
-    if args.option == 'deps':
-        print ('libboost-math-dev libssl-dev libprotobuf-dev '
-               'protobuf-compiler libncurses5-dev')
-        return
+    src = registry.binary('sprout', 'sender')
 
     if args.option == 'setup':
         # apply patch to reduce MTU size
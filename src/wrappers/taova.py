@@ -5,19 +5,15 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('taova')
 
     cc_repo = path.join(context.third_party_dir, 'genericCC')
-    recv_src = path.join(cc_repo, 'receiver')
-    send_src = path.join(cc_repo, 'sender')
-
-    if args.option == 'deps':
-        print ('makepp libboost-dev libprotobuf-dev protobuf-c-compiler '
-               'protobuf-compiler libjemalloc-dev libboost-python-dev')
-        return
+    recv_src = registry.binary('taova', 'receiver')
+    send_src = registry.binary('taova', 'sender')
 
     if args.option == 'setup':
         check_call(['makepp'], cwd=cc_repo)
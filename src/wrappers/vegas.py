@@ -16,11 +16,7 @@ def setup_vegas():
 
 
 def main():
-    args = arg_parser.receiver_first()
-
-    if args.option == 'deps':
-        print 'iperf'
-        return
+    args = arg_parser.parse_registered('vegas')
 
     if args.option == 'setup_after_reboot':
         setup_vegas()
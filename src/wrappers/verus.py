@@ -5,19 +5,16 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 from helpers import utils
 
 
 def main():
-    args = arg_parser.sender_first()
+    args = arg_parser.parse_registered('verus')
 
     cc_repo = path.join(context.third_party_dir, 'verus')
-    send_src = path.join(cc_repo, 'src', 'verus_server')
-    recv_src = path.join(cc_repo, 'src', 'verus_client')
-
-    if args.option == 'deps':
-        print 'libtbb-dev libasio-dev libalglib-dev libboost-system-dev'
-        return
+    send_src = registry.binary('verus', 'sender')
+    recv_src = registry.binary('verus', 'receiver')
 
     if args.option == 'setup':
         # apply patch to reduce MTU size
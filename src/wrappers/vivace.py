@@ -6,16 +6,17 @@ from subprocess import check_call
 
 import arg_parser
 import context
+import registry
 
 
 def main():
-    args = arg_parser.receiver_first()
+    args = arg_parser.parse_registered('vivace')
 
     cc_repo = path.join(context.third_party_dir, 'vivace')
     recv_dir = path.join(cc_repo, 'receiver')
     send_dir = path.join(cc_repo, 'sender')
-    recv_src = path.join(recv_dir, 'vivace_receiver')
-    send_src = path.join(send_dir, 'vivace_sender')
+    recv_src = registry.binary('vivace', 'receiver')
+    send_src = registry.binary('vivace', 'sender')
 
     if args.option == 'receiver':
         os.environ['LD_LIBRARY_PATH'] = path.join(recv_dir)
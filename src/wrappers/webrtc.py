@@ -35,16 +35,11 @@ def setup_webrtc(cc_repo, video):
 
 
 def main():
-    args = arg_parser.sender_first()
+    args = arg_parser.parse_registered('webrtc')
 
     cc_repo = path.join(context.third_party_dir, 'webrtc')
     video = path.join(cc_repo, 'video.y4m')
 
-    if args.option == 'deps':
-        print ('chromium-browser xvfb xfonts-100dpi xfonts-75dpi '
-               'xfonts-cyrillic xorg dbus-x11 npm nodejs')
-        return
-
     if args.option == 'setup':
         setup_webrtc(cc_repo, video)
         return
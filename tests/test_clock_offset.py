@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import time
+import stat
+
+import context
+from helpers import utils, clock_offset
+import test_ssh_master
+
+
+# a stand-in for ntpdate that takes a second to report an offset drifting by
+# DRIFT ms per second since FAKE_NTP_START, and logs that it ran
+FAKE_NTPDATE = '''#!/usr/bin/env python
+import os
+import sys
+import time
+
+with open(os.environ['FAKE_NTP_LOG'], 'a') as log:
+    log.write('ntpdate\\n')
+if os.environ.get('FAKE_NTP_FAIL'):
+    sys.exit(1)
+
+time.sleep(1)
+offset = (time.time() - float(os.environ['FAKE_NTP_START'])) * %f / 1000
+sys.stdout.write('18 Oct 12:00:00 ntpdate[1]: adjust time server 10.0.0.1 '
+                 'offset %%f sec\\n' %% offset)
+'''
+
+DRIFT = 10
+
+
+def install_fake_ntpdate():
+    bin_dir = path.join(utils.tmp_dir, 'test_clock_offset_bin')
+    utils.make_sure_dir_exists(bin_dir)
+
+    fake_ntpdate = path.join(bin_dir, 'ntpdate')
+    with open(fake_ntpdate, 'w') as f:
+        f.write(FAKE_NTPDATE % DRIFT)
+    os.chmod(fake_ntpdate, os.stat(fake_ntpdate).st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    ntp_log = path.join(utils.tmp_dir, 'test_clock_offset.log')
+    os.environ['FAKE_NTP_LOG'] = ntp_log
+    os.environ['FAKE_NTP_START'] = str(time.time())
+    return ntp_log
+
+
+def ntp_queries(ntp_log):
+    if not path.exists(ntp_log):
+        return 0
+    with open(ntp_log) as log:
+        return len(log.readlines())
+
+
+def expected_offset():
+    return (time.time() - float(os.environ['FAKE_NTP_START'])) * DRIFT
+
+
+def test_concurrent_query(ssh_cmd):
+    # both sides take a second to query
+    start_time = time.time()
+    local_ofst, remote_ofst = utils.query_clock_offset('10.0.0.1', ssh_cmd)
+    elapsed = time.time() - start_time
+
+    if local_ofst is None or remote_ofst is None:
+        sys.exit('failed to query clock offsets')
+    if elapsed > 1.8:
+        sys.exit('queried both sides one after the other in %.2f seconds'
+                 % elapsed)
+
+
+def test_cache(ssh_cmd, ntp_log):
+    offsets = clock_offset.ClockOffsets('10.0.0.1', ssh_cmd, max_age=0.5)
+
+    # measured twice to learn the drift
+    offsets.get()
+    time.sleep(1)
+    offsets.get()
+    queries = ntp_queries(ntp_log)
+
+    # extrapolated in between measurements without querying NTP
+    offsets.max_age = 60
+    time.sleep(1)
+    local_ofst, remote_ofst = offsets.get()
+    if ntp_queries(ntp_log) != queries:
+        sys.exit('queried NTP again within the freshness window')
+
+    expected = expected_offset()
+    for ofst in [local_ofst, remote_ofst]:
+        if abs(float(ofst) - expected) > DRIFT * 0.3:
+            sys.exit('extrapolated clock offset %s ms instead of %.2f ms'
+                     % (ofst, expected))
+
+    # queried again once the measurements are stale
+    offsets.max_age = 0
+    offsets.get()
+    if ntp_queries(ntp_log) != queries + 2:
+        sys.exit('did not query NTP after the freshness window')
+
+
+def test_failure(ssh_cmd, ntp_log):
+    offsets = clock_offset.ClockOffsets('10.0.0.1', ssh_cmd, max_age=60)
+
+    os.environ['FAKE_NTP_FAIL'] = '1'
+    if offsets.get() != (None, None):
+        sys.exit('reported clock offsets although NTP failed')
+    del os.environ['FAKE_NTP_FAIL']
+
+    # failed measurements are not cached
+    queries = ntp_queries(ntp_log)
+    if None in offsets.get() or ntp_queries(ntp_log) != queries + 2:
+        sys.exit('did not query NTP again after it failed')
+
+
+def main():
+    test_ssh_master.install_fake_ssh()
+    ntp_log = install_fake_ntpdate()
+    if path.exists(ntp_log):
+        os.remove(ntp_log)
+
+    ssh_cmd = utils.parse_remote_path('user@host:%s' % context.base_dir)[
+        'ssh_cmd']
+    test_concurrent_query(ssh_cmd)
+    test_cache(ssh_cmd, ntp_log)
+    test_failure(ssh_cmd, ntp_log)
+
+    os.remove(ntp_log)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
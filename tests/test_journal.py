@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import shutil
+import argparse
+import multiprocessing
+
+import context
+from helpers import utils, journal
+sys.path.append(path.join(context.src_dir, 'experiments'))
+
+
+def record_runs(campaign_journal, cc):
+    for run_id in xrange(1, 101):
+        campaign_journal.record(cc, run_id, journal.STARTED)
+        campaign_journal.record(cc, run_id, journal.DONE)
+
+
+def test_config_hash():
+    meta = {'mode': 'local', 'flows': 1, 'runtime': 30, 'run_times': 10,
+            'start_run_id': 1, 'cc_schemes': ['cubic']}
+    more_runs = dict(meta, run_times=20, start_run_id=5,
+                     cc_schemes=['cubic', 'bbr'], resume=True)
+    longer_runs = dict(meta, runtime=60)
+
+    if journal.config_hash(meta) != journal.config_hash(more_runs):
+        sys.exit('configuration hash changed with the runs to do')
+    if journal.config_hash(meta) == journal.config_hash(longer_runs):
+        sys.exit('configuration hash did not change with the runtime')
+
+    # it does not change with how the logs of the runs are handled either
+    for key in ['fused_merge', 'no_merged_logs', 'background_download',
+                'pkill_cleanup']:
+        if journal.config_hash(meta) != journal.config_hash(
+                dict(meta, **{key: True})):
+            sys.exit('configuration hash changed with %s' % key)
+
+
+def test_journal(data_dir):
+    # processes appending to the same journal at once
+    campaign_journal = journal.Journal(data_dir, 'abc')
+    procs = [multiprocessing.Process(target=record_runs,
+                                     args=(campaign_journal, cc))
+             for cc in ['cubic', 'bbr', 'vegas']]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+    # a run that failed, one that is incomplete and a line cut short
+    campaign_journal.record('cubic', 7, journal.STARTED)
+    campaign_journal.record('cubic', 7, journal.FAILED)
+    campaign_journal.record('bbr', 3, journal.STARTED)
+    with open(campaign_journal.path, 'a') as f:
+        f.write('{"cc": "vegas", "run_id"')
+
+    last_states = campaign_journal.last_states()
+    if len(last_states) != 300:
+        sys.exit('journal has %d runs instead of 300' % len(last_states))
+
+    for cc in ['cubic', 'bbr', 'vegas']:
+        for run_id in xrange(1, 101):
+            expected = journal.DONE
+            if (cc, run_id) == ('cubic', 7):
+                expected = journal.FAILED
+            elif (cc, run_id) == ('bbr', 3):
+                expected = journal.STARTED
+
+            if last_states[(cc, run_id)] != (expected, 'abc'):
+                sys.exit('%s run %d was %s instead of %s' % (
+                    cc, run_id, last_states[(cc, run_id)], expected))
+
+    return last_states
+
+
+def test_run_is_complete(data_dir, last_states):
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+    args = argparse.Namespace(data_dir=data_dir, flows=1)
+
+    # complete runs need their stats log and datalink log (or saved results)
+    for name in ['cubic_stats_run1.log', 'cubic_datalink_run1.log.gz',
+                 'cubic_stats_run2.log', 'cubic_perf_run2.json',
+                 'cubic_stats_run3.log', 'cubic_stats_run7.log',
+                 'cubic_datalink_run7.log']:
+        open(path.join(data_dir, name), 'w').close()
+
+    for run_id, config_hash, expected in [
+            (1, 'abc', True), (2, 'abc', True), (3, 'abc', False),
+            (4, 'abc', False), (7, 'abc', False), (1, 'def', False)]:
+        complete = test.run_is_complete(
+            args, 'cubic', run_id, last_states.get(('cubic', run_id)),
+            config_hash)
+        if complete != expected:
+            sys.exit('cubic run %d with configuration %s was%s complete' % (
+                run_id, config_hash, '' if complete else ' not'))
+
+
+def main():
+    data_dir = path.join(utils.tmp_dir, 'test_journal')
+    if path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir)
+
+    test_config_hash()
+    last_states = test_journal(data_dir)
+    test_run_is_complete(data_dir, last_states)
+
+    shutil.rmtree(data_dir)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
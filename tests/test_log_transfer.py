@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import shutil
+
+import context
+from helpers import utils
+sys.path.append(path.join(context.src_dir, 'experiments'))
+import log_transfer
+import merge_tunnel_logs
+import post_processor
+import test_ssh_master
+import test_merge_tunnel_logs
+
+
+def test_download(remote_dir, local_dir):
+    r = utils.parse_remote_path('user@host:%s' % context.base_dir)
+
+    logs = []
+    for i in xrange(6):
+        remote_log = path.join(remote_dir, 'log%d' % i)
+        with open(remote_log, 'w') as f:
+            f.write(os.urandom(1 << 18).encode('hex'))
+        logs.append((remote_log, path.join(local_dir, 'log%d' % i)))
+
+    for compression in ['zstd', 'gzip']:
+        downloaded = list(log_transfer.download(
+            r['ssh_cmd'], r['log_transfer'], logs, compression))
+        if downloaded != [local for _, local in logs]:
+            sys.exit('downloaded %s' % downloaded)
+
+        for remote, local in logs:
+            with open(remote) as remote_log, open(local) as local_log:
+                if remote_log.read() != local_log.read():
+                    sys.exit('%s differed after download' % local)
+            os.remove(local)
+
+    # the other logs are downloaded even if one is missing
+    try:
+        log_transfer.download_all(
+            r['ssh_cmd'], r['log_transfer'],
+            logs + [(path.join(remote_dir, 'missing'),
+                     path.join(local_dir, 'missing'))])
+    except IOError:
+        pass
+    else:
+        sys.exit('missing log was not reported')
+
+    if not all(path.isfile(local) for _, local in logs):
+        sys.exit('failed to download logs along with a missing one')
+
+
+def test_process_tunnel_logs(remote_dir, background):
+    # merge the logs of tunnels whose sender ran on the remote side as
+    # Test.process_tunnel_logs() does, downloading them first (or in the
+    # first stage of post-processing in the background)
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+
+    flows = 3
+    t = object.__new__(test.Test)
+    t.mode = 'remote'
+    t.flows = flows
+    t.sender_side = 'remote'
+    t.agent = None
+    t.timeline = None
+    t.r = utils.parse_remote_path('user@host:%s' % context.base_dir)
+    t.local_ofst = t.remote_ofst = None
+    t.fused_merge = False
+    t.pipeline = object() if background else None
+    t.background_download = background
+    t.cpus = None
+
+    t.datalink_name = 'test_log_transfer_datalink'
+    t.acklink_name = 'test_log_transfer_acklink'
+    t.datalink_log = path.join(utils.tmp_dir, t.datalink_name + '.log')
+    t.acklink_log = path.join(utils.tmp_dir, t.acklink_name + '.log')
+
+    t.datalink_egress_logs = {}
+    t.datalink_ingress_logs = {}
+    t.acklink_egress_logs = {}
+    t.acklink_ingress_logs = {}
+    for tun_id in xrange(1, flows + 1):
+        for link, remote_logs, local_logs in [
+                ('datalink', t.datalink_egress_logs, t.datalink_ingress_logs),
+                ('acklink', t.acklink_ingress_logs, t.acklink_egress_logs)]:
+            remote_logs[tun_id] = path.join(
+                remote_dir, '%s_flow%d.remote' % (link, tun_id))
+            local_logs[tun_id] = path.join(
+                utils.tmp_dir, 'test_log_transfer_%s_flow%d.local'
+                % (link, tun_id))
+
+        test_merge_tunnel_logs.generate_logs(
+            t.datalink_egress_logs[tun_id], t.datalink_ingress_logs[tun_id],
+            0.01 * tun_id)
+        test_merge_tunnel_logs.generate_logs(
+            t.acklink_egress_logs[tun_id], t.acklink_ingress_logs[tun_id], 0)
+
+    # merge the logs where they were generated for reference
+    expected = {}
+    for link, egress_logs, ingress_logs in [
+            ('datalink', t.datalink_egress_logs, t.datalink_ingress_logs),
+            ('acklink', t.acklink_egress_logs, t.acklink_ingress_logs)]:
+        tun_logs = []
+        for tun_id in xrange(1, flows + 1):
+            tun_logs.append(path.join(
+                utils.tmp_dir, 'test_log_transfer_%s%d' % (link, tun_id)))
+            merge_tunnel_logs.merge_single(
+                ingress_logs[tun_id], egress_logs[tun_id], tun_logs[-1])
+
+        expected[link] = path.join(
+            utils.tmp_dir, 'test_log_transfer_%s.expected' % link)
+        merge_tunnel_logs.merge_multiple(tun_logs, expected[link])
+
+    t.process_tunnel_logs()
+    if background:
+        errors = post_processor.post_process_run(t.merge_stages, [])
+        if errors:
+            sys.exit('post-processing failed: %s' % errors)
+
+    for link, output_log in [('datalink', t.datalink_log),
+                             ('acklink', t.acklink_log)]:
+        with open(output_log) as output, open(expected[link]) as ref:
+            if output.read() != ref.read():
+                sys.exit('%s log merged after download differed' % link)
+
+    if not t.datalink_egress_logs[1].startswith(utils.tmp_dir):
+        sys.exit('tunnel logs were not downloaded to %s' % utils.tmp_dir)
+
+
+def main():
+    test_ssh_master.install_fake_ssh()
+
+    remote_dir = path.join(utils.tmp_dir, 'test_log_transfer_remote')
+    local_dir = path.join(utils.tmp_dir, 'test_log_transfer_local')
+    for d in [remote_dir, local_dir]:
+        if path.exists(d):
+            shutil.rmtree(d)
+        os.makedirs(d)
+
+    test_download(remote_dir, local_dir)
+    for background in [False, True]:
+        test_process_tunnel_logs(remote_dir, background)
+
+    for d in [remote_dir, local_dir]:
+        shutil.rmtree(d)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import json
+import heapq
+import random
+import shutil
+
+import context
+from helpers import utils, tunnel_log, compression
+from helpers.subprocess_wrappers import check_call
+sys.path.append(path.join(context.src_dir, 'experiments'))
+import merge_tunnel_logs
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import tunnel_graph
+import plot
+
+
+def generate_logs(egress_log_path, ingress_log_path, loss_rate):
+    # generate the egress log (packets entering the tunnel) and ingress log
+    # (packets leaving it) of a tunnel, with random delays and losses
+    random.seed(loss_rate)
+
+    sent = []
+    ts = 0
+    for uid in xrange(30000):
+        ts += random.choice([0, 1, 2])
+        sent.append((ts, uid, random.randint(40, 1500)))
+
+    received = []
+    for send_ts, uid, size in sent:
+        if random.random() < loss_rate:
+            continue
+        received.append((send_ts + random.randint(0, 300), uid, size))
+    received.sort()
+
+    with open(egress_log_path, 'w') as egress_log:
+        egress_log.write('# egress log: 1500000000000.000\n')
+        for send_ts, uid, size in sent:
+            egress_log.write('%d-%d-%d\n' % (send_ts, uid, size))
+
+    with open(ingress_log_path, 'w') as ingress_log:
+        ingress_log.write('# ingress log: 1500000000012.500\n')
+        for recv_ts, uid, size in received:
+            ingress_log.write('%d-%d-%d\n' % (recv_ts, uid, size))
+
+
+def reference_merge(egress_log_path, ingress_log_path, output_log_path,
+                    e_clock_offset, i_clock_offset, max_delay=None):
+    # join the logs with a table of all sent packets as merge_tunnel_logs.py
+    # did before merging in a single pass; packets delayed for longer than
+    # max delay (if any) are counted as lost
+    def parse_line(line):
+        (ts, uid, size) = line.split('-')
+        return (float(ts), int(uid), int(size))
+
+    with open(egress_log_path) as egress_log:
+        send_init_ts = float(egress_log.readline().rsplit(':', 1)[-1])
+        send_init_ts += e_clock_offset
+        sent = [parse_line(line) for line in egress_log]
+
+    with open(ingress_log_path) as ingress_log:
+        recv_init_ts = float(ingress_log.readline().rsplit(':', 1)[-1])
+        recv_init_ts += i_clock_offset
+        received = [parse_line(line) for line in ingress_log]
+
+    min_init_ts = min(send_init_ts, recv_init_ts)
+    send_cal = send_init_ts - min_init_ts
+    recv_cal = recv_init_ts - min_init_ts
+
+    send_pkts = {}
+    for send_ts, uid, size in sent:
+        send_pkts[uid] = send_ts + send_cal
+
+    with open(output_log_path, 'w') as output_log:
+        output_log.write('# init timestamp: %.3f\n' % min_init_ts)
+
+        i = 0
+        j = 0
+        while i < len(sent) or j < len(received):
+            if (j == len(received) or (i < len(sent) and
+                                       sent[i][0] + send_cal <=
+                                       received[j][0] + recv_cal)):
+                output_log.write('%.3f + %s\n'
+                                 % (sent[i][0] + send_cal, sent[i][2]))
+                i += 1
+            else:
+                recv_ts_cal = received[j][0] + recv_cal
+                delay = recv_ts_cal - send_pkts[received[j][1]]
+                if max_delay is None or delay <= max_delay:
+                    output_log.write('%.3f - %s %.3f\n' % (
+                        recv_ts_cal, received[j][2], delay))
+                j += 1
+
+
+def compare(loss_rate, e_clock_offset, i_clock_offset):
+    egress_log_path = path.join(utils.tmp_dir, 'test_merge_egress.log')
+    ingress_log_path = path.join(utils.tmp_dir, 'test_merge_ingress.log')
+    generate_logs(egress_log_path, ingress_log_path, loss_rate)
+
+    expected_log_path = path.join(utils.tmp_dir, 'test_merge_expected.log')
+    reference_merge(egress_log_path, ingress_log_path, expected_log_path,
+                    e_clock_offset, i_clock_offset)
+
+    output_log_path = path.join(utils.tmp_dir, 'test_merge_output.log')
+    merge_script = path.join(
+        context.src_dir, 'experiments', 'merge_tunnel_logs.py')
+    check_call(['python', merge_script, 'single',
+                '-e', egress_log_path, '-i', ingress_log_path,
+                '-o', output_log_path,
+                '-e-clock-offset', str(e_clock_offset),
+                '-i-clock-offset', str(i_clock_offset),
+                '--max-delay', '1000'])
+
+    # merge again in worker processes through the library interface
+    output_log_paths = [output_log_path]
+    merges = []
+    for i in xrange(2):
+        output_log_paths.append('%s.%d' % (output_log_path, i))
+        merges.append((merge_tunnel_logs.merge_single, {
+            'ingress_log_path': ingress_log_path,
+            'egress_log_path': egress_log_path,
+            'output_log_path': output_log_paths[-1],
+            'e_clock_offset': e_clock_offset,
+            'i_clock_offset': i_clock_offset}))
+
+    if merge_tunnel_logs.merge_logs(merges, processes=2):
+        sys.exit('failed to merge logs in worker processes')
+
+    with open(expected_log_path) as expected_log:
+        expected = expected_log.read()
+
+    for log_path in output_log_paths:
+        with open(log_path) as output_log:
+            if output_log.read() != expected:
+                sys.exit('merged log %s differed with loss rate %s and '
+                         'clock offsets %s and %s' % (
+                             log_path, loss_rate, e_clock_offset,
+                             i_clock_offset))
+
+
+def test_max_delay():
+    # packets delayed for up to 300 ms are counted as lost by a merge that
+    # forgets them after 100 ms, or fail it if strict
+    egress_log_path = path.join(utils.tmp_dir, 'test_merge_egress.log')
+    ingress_log_path = path.join(utils.tmp_dir, 'test_merge_ingress.log')
+    generate_logs(egress_log_path, ingress_log_path, 0.1)
+
+    expected_log_path = path.join(utils.tmp_dir, 'test_merge_expected.log')
+    reference_merge(egress_log_path, ingress_log_path, expected_log_path,
+                    0, 0, max_delay=100)
+
+    output_log_path = path.join(utils.tmp_dir, 'test_merge_output.log')
+    merge_tunnel_logs.merge_single(ingress_log_path, egress_log_path,
+                                   output_log_path, max_delay=100)
+    with open(output_log_path) as output_log:
+        with open(expected_log_path) as expected_log:
+            if output_log.read() != expected_log.read():
+                sys.exit('packets delayed for longer than max delay were '
+                         'not counted as lost')
+
+    init_ts, events = merge_tunnel_logs.join_events(
+        ingress_log_path, egress_log_path, max_delay=100)
+    fused_log_path = path.join(utils.tmp_dir, 'test_merge_fused.log')
+    tunnel_log.write_text(fused_log_path, init_ts, events)
+    with open(fused_log_path) as fused_log:
+        with open(expected_log_path) as expected_log:
+            if fused_log.read() != expected_log.read():
+                sys.exit('packets delayed for longer than max delay were '
+                         'not counted as lost in memory')
+
+    for merge, log_path in [(merge_tunnel_logs.merge_single, output_log_path),
+                            (merge_tunnel_logs.join_events, None)]:
+        try:
+            merge(ingress_log_path, egress_log_path, log_path,
+                  max_delay=100, strict=True)
+        except merge_tunnel_logs.MergeError:
+            pass
+        else:
+            sys.exit('%s merged packets delayed for longer than max delay '
+                     'although strict' % merge.__name__)
+
+
+def test_duplicate_uids():
+    # a packet that leaves the tunnel twice is paired twice, as before
+    egress_log_path = path.join(utils.tmp_dir, 'test_merge_egress.log')
+    ingress_log_path = path.join(utils.tmp_dir, 'test_merge_ingress.log')
+    generate_logs(egress_log_path, ingress_log_path, 0)
+
+    with open(ingress_log_path) as ingress_log:
+        lines = ingress_log.readlines()
+    lines.insert(2000, lines[1000])
+    lines[1000:2001] = sorted(lines[1000:2001],
+                              key=lambda line: int(line.split('-')[0]))
+    with open(ingress_log_path, 'w') as ingress_log:
+        ingress_log.writelines(lines)
+
+    expected_log_path = path.join(utils.tmp_dir, 'test_merge_expected.log')
+    reference_merge(egress_log_path, ingress_log_path, expected_log_path,
+                    0, 0)
+
+    output_log_path = path.join(utils.tmp_dir, 'test_merge_output.log')
+    merge_tunnel_logs.merge_single(ingress_log_path, egress_log_path,
+                                   output_log_path, strict=True)
+    with open(output_log_path) as output_log:
+        with open(expected_log_path) as expected_log:
+            if output_log.read() != expected_log.read():
+                sys.exit('packet that left the tunnel twice was not merged '
+                         'as before')
+
+
+def generate_link_log(link_log_path):
+    # generate the log of mm-link with a delivery opportunity every 1.5 ms
+    with open(link_log_path, 'w') as link_log:
+        link_log.write('# mm-link\n# init timestamp: 1499999999990\n')
+        for i in xrange(40000):
+            link_log.write('%d # 1504\n' % (i * 3 // 2))
+            if i % 3 == 0:
+                link_log.write('%d + 1500\n' % (i * 3 // 2))
+
+
+def compare_fused():
+    # merging in memory must produce the same tunnel log and statistics as
+    # merging through intermediate logs
+    link_log_path = path.join(utils.tmp_dir, 'test_merge_link.log')
+    generate_link_log(link_log_path)
+
+    joins = []
+    tun_log_paths = []
+    for flow_id, (loss_rate, i_clock_offset) in enumerate(
+            [(0, 0), (0.1, -7.25), (0.05, 3.125)], 1):
+        egress_log_path = path.join(
+            utils.tmp_dir, 'test_merge_egress%d.log' % flow_id)
+        ingress_log_path = path.join(
+            utils.tmp_dir, 'test_merge_ingress%d.log' % flow_id)
+        generate_logs(egress_log_path, ingress_log_path, loss_rate)
+
+        joins.append({'ingress_log_path': ingress_log_path,
+                      'egress_log_path': egress_log_path,
+                      'i_clock_offset': i_clock_offset})
+        tun_log_paths.append(
+            path.join(utils.tmp_dir, 'test_merge_flow%d.log' % flow_id))
+        merge_tunnel_logs.merge_single(
+            output_log_path=tun_log_paths[-1], **joins[-1])
+
+    merged_log_path = path.join(utils.tmp_dir, 'test_merge_datalink.log')
+    merge_tunnel_logs.merge_multiple(tun_log_paths, merged_log_path,
+                                     link_log_path)
+
+    init_ts, events = merge_tunnel_logs.join_and_merge_events(
+        joins, link_log_path)
+    fused_log_path = path.join(utils.tmp_dir, 'test_merge_fused.log')
+    tunnel_log.write_text(fused_log_path, init_ts, events)
+
+    with open(merged_log_path) as merged_log:
+        with open(fused_log_path) as fused_log:
+            if merged_log.read() != fused_log.read():
+                sys.exit('tunnel log merged in memory differed')
+
+    expected = tunnel_graph.TunnelGraph(merged_log_path)
+    expected.parse_tunnel_log()
+
+    fused = tunnel_graph.TunnelGraph(fused_log_path)
+    fused.parse_events(events)
+
+    if expected.get_tunnel_results() != fused.get_tunnel_results():
+        sys.exit('statistics of tunnel log merged in memory differed')
+
+    return joins, link_log_path, expected.get_tunnel_results()
+
+
+def test_fused_run(joins, link_log_path, expected):
+    # "test.py --fused-merge --no-merged-logs" plots the graphs of a run
+    # right away, and records it for plot.py as in pantheon_perf.json
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+    data_dir = path.join(utils.tmp_dir, 'test_fused_run')
+    if path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir)
+
+    t = object.__new__(test.Test)
+    t.mode = 'local'
+    t.data_dir = data_dir
+    t.cc = 'cubic'
+    t.run_id = 1
+    t.runtime = 30
+    t.save_merged_logs = False
+    t.datalink_stats = None
+    t.test_start_time = t.test_end_time = None
+
+    datalink_log = path.join(data_dir, 'cubic_datalink_run1.log')
+    t.merge_and_analyze(joins, link_log_path, datalink_log, analyze=True)
+    t.record_time_stats()
+
+    if path.exists(datalink_log):
+        sys.exit('saved the merged log with --no-merged-logs')
+    for graph in ['throughput', 'delay']:
+        if not path.isfile(path.join(
+                data_dir, 'cubic_datalink_%s_run1.png' % graph)):
+            sys.exit('did not plot the %s graph of a fused run' % graph)
+
+    p = object.__new__(plot.Plot)
+    p.data_dir = data_dir
+    p.flows = len(joins)
+    p.runtime = t.runtime
+    p.include_acklink = False
+    results = p.parse_tunnel_log('cubic', 1)
+
+    expected = json.loads(json.dumps(expected))
+    if results is None or results['flow_data'] != expected['flow_data'] or (
+            results['throughput'], results['delay'], results['loss']) != (
+            expected['throughput'], expected['delay'], expected['loss']):
+        sys.exit('plot.py loaded the results of a fused run as %s' % results)
+
+    # plot.py keeps the statistics that test.py wrote to the stats log
+    p.update_stats_log('cubic', 1, results['stats'])
+    with open(path.join(data_dir, 'cubic_stats_run1.log')) as stats_log:
+        if stats_log.read().count(expected['stats']) != 1:
+            sys.exit('lost the datalink statistics of a fused run')
+
+    # test.py saves no results of a run much shorter than the runtime
+    t.run_id = 2
+    t.runtime = 60
+    t.merge_and_analyze(joins, link_log_path, datalink_log, analyze=True)
+    if p.load_saved_results('cubic', 2) is not None:
+        sys.exit('saved the results of a run shorter than the runtime')
+
+    shutil.rmtree(data_dir)
+
+
+def reference_merge_multiple(tun_log_paths, output_log_path, link_log_path):
+    # merge sorted text logs line by line through a min heap
+    def push_line(heap, index, log, init_ts_delta):
+        for line in log:
+            if line.startswith('#') or (index == -1 and '#' not in line):
+                continue
+
+            # calibrate the timestamp and take 4 bytes off the size of a
+            # delivery opportunity
+            line_list = line.split()
+            ts = float(line_list[0]) + init_ts_delta
+            line_list[0] = '%.3f' % ts
+            if line_list[1] == '#':
+                line_list[2] = str(int(line_list[2]) - 4)
+            elif index != -1:
+                line_list.append(str(index + 1))
+
+            heapq.heappush(heap, (ts, index, ' '.join(line_list)))
+            return
+
+    logs = [(i, open(log_path)) for i, log_path in enumerate(tun_log_paths)]
+    if link_log_path:
+        logs.insert(0, (-1, open(link_log_path)))
+
+    init_ts = {}
+    for index, log in logs:
+        line = log.readline()
+        while not line.startswith('# init timestamp'):
+            line = log.readline()
+        init_ts[index] = float(line.split(':')[1])
+    min_init_ts = min(init_ts.values())
+
+    heap = []
+    for index, log in logs:
+        push_line(heap, index, log, init_ts[index] - min_init_ts)
+
+    with open(output_log_path, 'w') as output_log:
+        output_log.write('# init timestamp: %.3f\n' % min_init_ts)
+
+        logs = dict(logs)
+        while heap:
+            ts, index, line = heapq.heappop(heap)
+            output_log.write(line + '\n')
+            push_line(heap, index, logs[index], init_ts[index] - min_init_ts)
+
+    for log in logs.values():
+        log.close()
+
+
+def compare_multiple():
+    # merging logs as arrays must produce the same tunnel log as merging them
+    # line by line, also with unusual whitespace and binary input logs
+    link_log_path = path.join(utils.tmp_dir, 'test_merge_link.log')
+    generate_link_log(link_log_path)
+    with open(link_log_path, 'a') as link_log:
+        link_log.write('# end of log\n60000  # 1504\n60000 # 1504')
+
+    tun_log_paths = []
+    for flow_id, (loss_rate, i_clock_offset) in enumerate(
+            [(0, 0.0625), (0.1, -7.25), (0.05, 3.125)], 1):
+        egress_log_path = path.join(
+            utils.tmp_dir, 'test_merge_egress%d.log' % flow_id)
+        ingress_log_path = path.join(
+            utils.tmp_dir, 'test_merge_ingress%d.log' % flow_id)
+        generate_logs(egress_log_path, ingress_log_path, loss_rate)
+
+        tun_log_paths.append(
+            path.join(utils.tmp_dir, 'test_merge_flow%d.log' % flow_id))
+        merge_tunnel_logs.merge_single(
+            ingress_log_path, egress_log_path, tun_log_paths[-1],
+            i_clock_offset=i_clock_offset)
+
+    with open(tun_log_paths[1], 'a') as tun_log:
+        tun_log.write('# end of log\n1e5 + 1500\n')
+
+    binary_log_path = path.join(utils.tmp_dir, 'test_merge_flow3.bin')
+    merge_tunnel_logs.convert(tun_log_paths[2], binary_log_path)
+
+    for link in [None, link_log_path]:
+        expected_log_path = path.join(
+            utils.tmp_dir, 'test_merge_multiple_expected.log')
+        reference_merge_multiple(tun_log_paths, expected_log_path, link)
+        with open(expected_log_path) as expected_log:
+            expected = expected_log.read()
+
+        output_log_path = path.join(
+            utils.tmp_dir, 'test_merge_multiple.log.gz')
+        for logs in [tun_log_paths, tun_log_paths[:2] + [binary_log_path]]:
+            merge_tunnel_logs.merge_multiple(logs, output_log_path, link)
+
+            with compression.open_file(output_log_path) as output_log:
+                if output_log.read() != expected:
+                    sys.exit('tunnel logs merged as arrays differed')
+
+
+def main():
+    # negative clock offsets make some packets leave before they arrive
+    for loss_rate in [0, 0.1]:
+        for e_clock_offset, i_clock_offset in [(0, 0), (0, -100), (50, 0)]:
+            compare(loss_rate, e_clock_offset, i_clock_offset)
+    test_max_delay()
+    test_duplicate_uids()
+
+    test_fused_run(*compare_fused())
+    compare_multiple()
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+from os import path
+import sys
+import imp
+import time
+from subprocess import Popen, PIPE
+
+import context
+from helpers import utils
+sys.path.append(path.join(context.src_dir, 'experiments'))
+
+
+class FakeTest(object):
+    # a stand-in for Test that records the CPUs it runs on and when
+    def __init__(self, record_path, cpus=None):
+        self.record_path = record_path
+        self.cpus = cpus
+
+    def run(self):
+        start_time = time.time()
+        time.sleep(1)
+        with open(self.record_path, 'w') as record:
+            record.write('%s %s %s %s\n' % (
+                ','.join(map(str, self.cpus)),
+                ','.join(map(str, utils.allowed_cpus())),
+                start_time, time.time()))
+
+        if 'fail' in self.record_path:
+            sys.exit(1)
+
+
+def test_parse_cpu_list():
+    cpus = utils.parse_cpu_list('0-3,8,10-11')
+    if cpus != [0, 1, 2, 3, 8, 10, 11]:
+        sys.exit('parsed CPU list as %s' % cpus)
+
+
+def test_run_in_parallel(test):
+    # run 6 tests on 2 sets of CPUs, and check that every test ran on its
+    # set of CPUs and no more than 2 tests ran at once
+    cpu = utils.allowed_cpus()[0]
+    record_paths = [path.join(utils.tmp_dir, 'test_parallel_%d' % i)
+                    for i in xrange(6)]
+
+    start_time = time.time()
+    test.run_in_parallel([(FakeTest, (p,)) for p in record_paths],
+                         [[cpu], [cpu]])
+    if time.time() - start_time > 6:
+        sys.exit('tests were not run in parallel')
+
+    events = []
+    for record_path in record_paths:
+        with open(record_path) as record:
+            cpus, allowed, start, end = record.read().split()
+
+        if cpus != str(cpu) or allowed != str(cpu):
+            sys.exit('test ran on CPUs %s instead of %s' % (allowed, cpus))
+        events += [(float(start), 1), (float(end), -1)]
+
+    running = 0
+    for _, change in sorted(events):
+        running += change
+        if running > 2:
+            sys.exit('more than 2 tests ran at once')
+
+    # a failed test fails the whole run after the other tests
+    fail_path = path.join(utils.tmp_dir, 'test_parallel_fail')
+    try:
+        test.run_in_parallel([(FakeTest, (fail_path,)),
+                              (FakeTest, (record_paths[0],))], [[cpu]])
+    except SystemExit:
+        pass
+    else:
+        sys.exit('failed test was not reported')
+
+
+def test_oversubscription():
+    test_src = path.join(context.src_dir, 'experiments', 'test.py')
+    cpus = len(utils.allowed_cpus())
+    proc = Popen(['python', test_src, 'local', '--schemes', 'cubic',
+                  '--parallel', '2', '--cpus-per-test', str(cpus)],
+                 stdout=PIPE, stderr=PIPE)
+    _, err = proc.communicate()
+    if proc.returncode == 0 or 'cannot run' not in err:
+        sys.exit('CPUs were oversubscribed: %s' % err)
+
+    # --pipeline needs a CPU of its own besides those of the tests
+    if cpus > 1:
+        proc = Popen(['python', test_src, 'local', '--schemes', 'cubic',
+                      '--parallel', str(cpus), '--cpus-per-test', '1',
+                      '--pipeline'], stdout=PIPE, stderr=PIPE)
+        _, err = proc.communicate()
+        if proc.returncode == 0 or 'leave a CPU to --pipeline' not in err:
+            sys.exit('--pipeline was left without a CPU: %s' % err)
+
+
+def main():
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+
+    test_parse_cpu_list()
+    test_run_in_parallel(test)
+    test_oversubscription()
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
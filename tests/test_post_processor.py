@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import multiprocessing
+
+import context
+from helpers import utils, parse_cache
+sys.path.append(path.join(context.src_dir, 'experiments'))
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import merge_tunnel_logs
+import post_processor
+import test_merge_tunnel_logs
+import tunnel_graph
+
+
+def prepare_run(name):
+    # generate the ingress and egress logs of two tunnels and the mm-link log
+    # of a run; return the stages of merges, the merged log and its graphs
+    link_log_path = path.join(utils.tmp_dir, '%s_link.log' % name)
+    test_merge_tunnel_logs.generate_link_log(link_log_path)
+
+    single_merges = []
+    tun_log_paths = []
+    for flow_id, loss_rate in [(1, 0), (2, 0.1)]:
+        egress_log_path = path.join(
+            utils.tmp_dir, '%s_egress%d.log' % (name, flow_id))
+        ingress_log_path = path.join(
+            utils.tmp_dir, '%s_ingress%d.log' % (name, flow_id))
+        test_merge_tunnel_logs.generate_logs(
+            egress_log_path, ingress_log_path, loss_rate)
+
+        tun_log_paths.append(
+            path.join(utils.tmp_dir, '%s_flow%d.log' % (name, flow_id)))
+        single_merges.append((merge_tunnel_logs.merge_single, {
+            'ingress_log_path': ingress_log_path,
+            'egress_log_path': egress_log_path,
+            'output_log_path': tun_log_paths[-1]}))
+
+    log_path = path.join(utils.tmp_dir, '%s_datalink.log' % name)
+    multiple_merges = [(merge_tunnel_logs.merge_multiple, {
+        'tunnel_log_paths': tun_log_paths,
+        'output_log_path': log_path,
+        'link_log_path': link_log_path})]
+
+    graphs = [path.join(utils.tmp_dir, '%s_%s.png' % (name, graph))
+              for graph in ['throughput', 'delay']]
+    for p in [log_path, parse_cache.cache_path(log_path, 'tunnel_graph'),
+              parse_cache.cache_path(log_path, 'graphs')] + graphs:
+        if path.exists(p):
+            os.remove(p)
+
+    return [single_merges, multiple_merges], log_path, graphs
+
+
+def submit_from_child(pipeline, name, merge_stages, graphs):
+    pipeline.submit(name, merge_stages, graphs)
+
+
+def main():
+    pipeline = post_processor.PostProcessor(2, utils.allowed_cpus()[:1])
+
+    # submit a run from this process, and another one from a child process
+    # as tests run in parallel do
+    runs = []
+    for name in ['test_post_process_a', 'test_post_process_b']:
+        merge_stages, log_path, graphs = prepare_run(name)
+        runs.append((merge_stages, log_path, graphs))
+
+        if name.endswith('a'):
+            pipeline.submit(name, merge_stages, [tuple([log_path] + graphs)])
+        else:
+            proc = multiprocessing.Process(
+                target=submit_from_child,
+                args=(pipeline, name, merge_stages,
+                      [tuple([log_path] + graphs)]))
+            proc.start()
+            proc.join()
+
+    pipeline.finish()
+
+    # every run is merged, and its statistics cached and graphs plotted
+    for merge_stages, log_path, graphs in runs:
+        expected_log_path = log_path + '.expected'
+        kwargs = dict(merge_stages[1][0][1], output_log_path=expected_log_path)
+        merge_tunnel_logs.merge_multiple(**kwargs)
+
+        with open(log_path) as log:
+            with open(expected_log_path) as expected_log:
+                if log.read() != expected_log.read():
+                    sys.exit('%s differed' % log_path)
+
+        cache = parse_cache.cache_path(log_path, 'tunnel_graph')
+        for p in [cache] + graphs:
+            if not path.isfile(p):
+                sys.exit('%s was not saved' % p)
+
+        # plot.py keeps the graphs only if plotted with the same parameters
+        if not tunnel_graph.TunnelGraph(log_path, *graphs).graphs_marked():
+            sys.exit('graphs of %s were not marked' % log_path)
+        if tunnel_graph.TunnelGraph(
+                log_path, *graphs, ms_per_bin=250).graphs_marked():
+            sys.exit('graphs of %s were kept with another bin size'
+                     % log_path)
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import time
+import shutil
+
+import context
+from helpers import utils
+sys.path.append(path.join(context.src_dir, 'experiments'))
+import remote_agent
+import test_ssh_master
+import test_tunnel_manager
+
+
+def test_requests(agent):
+    local_git_summary = utils.get_git_summary()
+    if utils.get_git_summary('remote', 'user@host:%s' % context.base_dir,
+                             agent) != local_git_summary:
+        sys.exit('git summary differed through the remote agent')
+
+    # requests are answered over the open session instead of a new ssh
+    # session each, unlike the fallback
+    start_time = time.time()
+    for _ in xrange(10):
+        agent.git_summary()
+    agent_time = time.time() - start_time
+
+    start_time = time.time()
+    for _ in xrange(10):
+        utils.get_git_summary('remote', 'user@host:%s' % context.base_dir)
+    ssh_time = time.time() - start_time
+    sys.stderr.write('10 git summaries in %.2f seconds through the remote '
+                     'agent, %.2f seconds over ssh\n' % (agent_time, ssh_time))
+
+    # failures on the remote side are replied rather than fatal
+    try:
+        agent.request('no_such_request')
+    except IOError:
+        pass
+    else:
+        sys.exit('unknown request did not fail')
+
+
+def test_tunnel_managers(agent):
+    # two tunnel managers on the remote side at once
+    managers = [agent.tunnel_manager() for _ in xrange(2)]
+    for i, manager in enumerate(managers):
+        if 'tunnel manager is running' not in manager.stdout.readline():
+            sys.exit('remote tunnel manager %d did not run' % i)
+
+        manager.stdin.write('tunnel 1 mm-tunnelserver --ingress-log=%d '
+                            '--egress-log=%d\n' % (i, i))
+        manager.stdin.write('tunnel 1 readline 5\n')
+        manager.stdin.flush()
+
+    for i, manager in enumerate(managers):
+        line = manager.stdout.readline()
+        if not line.startswith('mm-tunnelclient'):
+            sys.exit('remote tunnel manager %d replied "%s"' % (i, line))
+
+    managers[0].stdin.write('halt\n')
+    managers[0].stdin.flush()
+    if managers[0].stdout.readline() != '':
+        sys.exit('remote tunnel manager did not halt')
+
+    managers[1].kill()
+
+
+def test_download_logs(agent, tmp_dir):
+    logs = []
+    for i in xrange(3):
+        remote_log = path.join(tmp_dir, 'log%d.remote' % i)
+        with open(remote_log, 'w') as f:
+            f.write(os.urandom(1 << 16).encode('hex'))
+        logs.append((remote_log, path.join(tmp_dir, 'log%d.local' % i)))
+
+    missing = (path.join(tmp_dir, 'missing'), path.join(tmp_dir, 'missing2'))
+    downloaded = list(agent.download_logs(logs + [missing]))
+    if downloaded != [local for _, local in logs]:
+        sys.exit('downloaded %s through the remote agent' % downloaded)
+
+    for remote, local in logs:
+        with open(remote) as remote_log, open(local) as local_log:
+            if remote_log.read() != local_log.read():
+                sys.exit('%s differed after download' % local)
+
+
+def main():
+    test_ssh_master.install_fake_ssh()
+    test_tunnel_manager.install_fake_tunnel()
+
+    tmp_dir = path.join(utils.tmp_dir, 'test_remote_agent')
+    if path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    r = utils.parse_remote_path('user@host:%s' % context.base_dir)
+    agent = remote_agent.start(r)
+    if agent is None:
+        sys.exit('failed to start the remote agent')
+
+    test_requests(agent)
+    test_tunnel_managers(agent)
+    test_download_logs(agent, tmp_dir)
+
+    agent.close()
+    if agent.proc.returncode != 0:
+        sys.exit('remote agent exited with %d' % agent.proc.returncode)
+
+    # the remote agent fails to start if the remote side is unreachable
+    r['remote_agent'] = path.join(tmp_dir, 'missing.py')
+    if remote_agent.start(r) is not None:
+        sys.exit('started a missing remote agent')
+
+    shutil.rmtree(tmp_dir)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import time
+import shutil
+import argparse
+from subprocess import Popen
+
+import context
+from helpers import utils, resource_sampler
+sys.path.append(path.join(context.src_dir, 'experiments'))
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import plot
+
+
+# a stand-in for a wrapper: the sender spins on a CPU, and the receiver
+# wakes up every 10 ms
+FAKE_WRAPPER = '''import sys
+import time
+
+if sys.argv[1] == 'sender':
+    while True:
+        pass
+else:
+    while True:
+        time.sleep(0.01)
+'''
+
+
+def test_component():
+    for argv, expected in [
+            (['python', '/pantheon/src/wrappers/cubic.py', 'sender', '1'],
+             'sender'),
+            (['python', 'quic.py', 'receiver', '1.2.3.4', '5'], 'receiver'),
+            (['mm-tunnelclient', 'localhost', '1'], 'tunnel'),
+            (['python', '/pantheon/src/experiments/tunnel_manager.py'],
+             'tunnel'),
+            (['/usr/bin/mm-link', 'up.trace', 'down.trace'], 'emulator'),
+            (['mm-delay', '10'], 'emulator'),
+            (['iperf', '-c', '10.0.0.1'], None),
+            ([], None)]:
+        if resource_sampler.component(argv) != expected:
+            sys.exit('%s was counted in %s instead of %s' % (
+                argv, resource_sampler.component(argv), expected))
+
+
+def run_fake_processes(tmp_dir):
+    # a receiver directly under the root process, and a sender in mm-link
+    wrapper = path.join(tmp_dir, 'fake.py')
+    with open(wrapper, 'w') as f:
+        f.write(FAKE_WRAPPER)
+
+    receiver = Popen(['python', wrapper, 'receiver'], preexec_fn=os.setsid)
+
+    # a shell named mm-link stands in for it
+    sender = Popen(['mm-link', '-c', 'python %s sender; true' % wrapper],
+                   executable='/bin/sh', preexec_fn=os.setsid)
+    return [receiver, sender]
+
+
+def test_sampler(tmp_dir):
+    procs = run_fake_processes(tmp_dir)
+
+    log_path = path.join(tmp_dir, 'cubic_resources_run1.log')
+    sampler = resource_sampler.ResourceSampler(
+        log_path, lambda: [proc.pid for proc in procs], cpus=1,
+        interval=0.5)
+    try:
+        sampler.start()
+        time.sleep(3)
+        sampler.stop()
+    finally:
+        for proc in procs:
+            utils.kill_proc_group(proc)
+
+    header, samples = resource_sampler.load(log_path)
+    if header != {'interval': 0.5, 'cpus': 1}:
+        sys.exit('resource log header was %s' % header)
+    if not 4 <= len(samples) <= 6:
+        sys.exit('took %d samples in 3 seconds every 0.5 seconds'
+                 % len(samples))
+
+    for sample in samples[1:]:
+        comps = sample['components']
+        if ((comps['sender']['processes'], comps['receiver']['processes'],
+             comps['emulator']['processes']) != (1, 1, 1)):
+            sys.exit('sampled the processes of the components as %s' % comps)
+        if comps['sender']['rss'] <= 0 or comps['receiver']['rss'] <= 0:
+            sys.exit('sampled no RSS: %s' % comps)
+        if comps['receiver']['voluntary_ctxt'] <= 0:
+            sys.exit('the receiver switched context voluntarily in no sample')
+        if comps['receiver']['saturated']:
+            sys.exit('an idle receiver was CPU-saturated')
+
+    saturated = resource_sampler.saturated_components(log_path)
+    if [s[0] for s in saturated] != ['sender']:
+        sys.exit('flagged %s as CPU-saturated instead of the sender; CPU '
+                 'of the sender: %s' % (saturated, [
+                     s['components']['sender']['cpu'] for s in samples]))
+
+    return log_path
+
+
+class FakeRun(object):
+    # stand-in for a run without tunnels that runs the fake processes
+    def run_without_tunnel(self):
+        self.proc_first, self.proc_second = run_fake_processes(self.data_dir)
+        time.sleep(2)
+        return True
+
+
+def test_run(tmp_dir):
+    # Test samples what it runs in its resource log
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+
+    test_cls = type('FakeRun', (FakeRun, test.Test), {})
+    args = argparse.Namespace(
+        mode='local', data_dir=tmp_dir, flows=0, runtime=2, interval=0,
+        run_times=1, fused_merge=False, no_merged_logs=False,
+        uplink_trace=None, downlink_trace=None, prepend_mm_cmds=None,
+        append_mm_cmds=None, extra_mm_link_args=None)
+    t = test_cls(args, 2, 'cubic')
+    t.resources_log = path.join(tmp_dir, 'cubic_resources_run2.log')
+    if not t.run_congestion_control():
+        sys.exit('fake run failed')
+
+    _, samples = resource_sampler.load(t.resources_log)
+    if not samples or not samples[-1]['components']['sender']['processes']:
+        sys.exit('did not sample the sender of the run')
+
+
+def test_plot(tmp_dir):
+    # plot.py flags the run in its stats log
+    stats_log = path.join(tmp_dir, 'cubic_stats_run1.log')
+    with open(stats_log, 'w') as f:
+        f.write('Start at: 1\nEnd at: 2\n')
+
+    p = object.__new__(plot.Plot)
+    p.data_dir = tmp_dir
+    saturated = p.cpu_saturation('cubic', 1)
+    p.update_stats_log('cubic', 1, 'stats\n', saturated)
+    if p.cpu_saturation('cubic', 2) != []:
+        sys.exit('flagged a run without a resource log')
+
+    with open(stats_log) as f:
+        flags = [line for line in f if 'CPU-saturated' in line]
+    if len(flags) != 1 or 'sender' not in flags[0]:
+        sys.exit('stats log flagged %s' % flags)
+
+
+def main():
+    tmp_dir = path.join(utils.tmp_dir, 'test_resource_sampler')
+    if path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    test_component()
+    test_sampler(tmp_dir)
+    test_run(tmp_dir)
+    test_plot(tmp_dir)
+
+    shutil.rmtree(tmp_dir)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,6 @@
 import os
 from os import path
 import sys
-import time
 import signal
 import argparse
 
@@ -34,7 +33,10 @@ def test_schemes(args):
         first_proc = Popen(cmd, preexec_fn=os.setsid)
 
         # wait for 'run_first' to be ready
-        time.sleep(3)
+        if not utils.wait_for_port(port, [first_proc.pid],
+                                   utils.run_first_setup_time(scheme)):
+            sys.stderr.write('Warning: %s %s is not listening on port %s\n'
+                             % (scheme, run_first, port))
 
         # run second to run
         cmd = [src, run_second, '127.0.0.1', port]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import stat
+
+import context
+from helpers import utils
+sys.path.append(path.join(context.src_dir, 'experiments'))
+
+
+# stand-ins for ssh and scp that log their arguments and run commands (or
+# copy files) locally, as if the remote host were this one
+FAKE_SSH = '''#!/usr/bin/env python
+import os
+import sys
+import shutil
+import subprocess
+
+args = sys.argv[1:]
+with open(os.environ['FAKE_SSH_LOG'], 'a') as log:
+    log.write(' '.join([os.path.basename(sys.argv[0])] + args) + '\\n')
+
+options = []
+while args and args[0].startswith('-'):
+    if args[0] in ['-o', '-O']:
+        options.append(' '.join(args[:2]))
+        args = args[2:]
+    else:
+        options.append(args[0])
+        args = args[1:]
+
+if sys.argv[0].endswith('scp'):
+    shutil.copy(args[0].split(':', 1)[1], args[1])
+elif '-M' not in options and '-O exit' not in options:
+    sys.exit(subprocess.call(' '.join(args[1:]), shell=True))
+'''
+
+
+def install_fake_ssh():
+    bin_dir = path.join(utils.tmp_dir, 'test_ssh_master_bin')
+    utils.make_sure_dir_exists(bin_dir)
+
+    for name in ['ssh', 'scp']:
+        fake_ssh = path.join(bin_dir, name)
+        with open(fake_ssh, 'w') as f:
+            f.write(FAKE_SSH)
+        os.chmod(fake_ssh, os.stat(fake_ssh).st_mode | stat.S_IEXEC)
+
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    ssh_log = path.join(utils.tmp_dir, 'test_ssh_master.log')
+    if path.exists(ssh_log):
+        os.remove(ssh_log)
+    os.environ['FAKE_SSH_LOG'] = ssh_log
+    return ssh_log
+
+
+def download_logs():
+    # download the tunnel logs of a flow as Test.download_tunnel_logs() does
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+
+    t = object.__new__(test.Test)
+    t.mode = 'remote'
+    t.flows = 1
+    t.sender_side = 'remote'
+    t.agent = None
+    t.timeline = None
+    t.r = utils.parse_remote_path('user@host:%s' % context.base_dir)
+
+    remote_dir = path.join(utils.tmp_dir, 'test_ssh_master_remote')
+    utils.make_sure_dir_exists(remote_dir)
+    t.datalink_egress_logs = {1: path.join(remote_dir, 'datalink.egress')}
+    t.acklink_ingress_logs = {1: path.join(remote_dir, 'acklink.ingress')}
+    for log_path in [t.datalink_egress_logs[1], t.acklink_ingress_logs[1]]:
+        with open(log_path, 'w') as log:
+            log.write(log_path)
+
+    if list(t.download_tunnel_logs(t.remote_tunnel_logs())) != [1]:
+        sys.exit('failed to download the tunnel logs of flow 1')
+
+    for remote_log, local_log in [
+            (path.join(remote_dir, 'datalink.egress'),
+             t.datalink_egress_logs[1]),
+            (path.join(remote_dir, 'acklink.ingress'),
+             t.acklink_ingress_logs[1])]:
+        with open(local_log) as log:
+            if log.read() != remote_log:
+                sys.exit('failed to download %s' % remote_log)
+        os.remove(local_log)
+
+
+def main():
+    ssh_log = install_fake_ssh()
+
+    host_addr = 'user@host'
+    utils.start_ssh_master(host_addr)
+    utils.get_git_summary('remote', '%s:%s' % (host_addr, context.base_dir))
+    download_logs()
+    utils.stop_ssh_master(host_addr)
+
+    control_path = 'ControlPath=%s' % path.join(utils.SSH_CONTROL_DIR, '%C')
+    with open(ssh_log) as log:
+        cmds = [line.split() for line in log]
+
+    # the master is opened first and closed last, and every remote operation
+    # in between goes through it
+    if '-M' not in cmds[0] or control_path not in cmds[0]:
+        sys.exit('SSH master was not opened first: %s' % cmds[0])
+    if '-O' not in cmds[-1] or control_path not in cmds[-1]:
+        sys.exit('SSH master was not closed last: %s' % cmds[-1])
+    if len(cmds) != 4:
+        sys.exit('ran %d ssh or scp commands instead of 4' % len(cmds))
+
+    for cmd in cmds[1:-1]:
+        if control_path not in cmd or 'ControlMaster=no' not in cmd:
+            sys.exit('remote operation did not share the SSH master: %s'
+                     % ' '.join(cmd))
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+from os import path
+import sys
+import imp
+import json
+import shutil
+
+import context
+from helpers import utils, sweep
+sys.path.append(path.join(context.src_dir, 'experiments'))
+import arg_parser
+
+CONFIG = '''
+runtime: 10
+schemes: "cubic vegas"
+prepend_mm_cmds: "mm-delay 5"
+sweep:
+  matrix:
+    trace: [%(trace)s]
+    delay: [0, 20]
+    loss: [0, 0.01]
+  cells:
+    # duplicates of cells in the matrix
+    - {uplink_trace: %(trace)s, downlink_trace: %(trace)s, delay: 20}
+    - {trace: %(trace)s, loss: 0.0}
+    - {trace: %(trace)s, queue_size: 100}
+    - {trace: %(trace)s, queue: codel, queue_args: "target=5,interval=100"}
+'''
+
+
+def test_expand():
+    trace = path.join(context.src_dir, 'experiments', '12mbps.trace')
+    cells = sweep.expand({'matrix': {'trace': trace, 'delay': [10, 10]},
+                          'cells': [{'delay': 10, 'trace': trace}]})
+    if cells != [{'uplink_trace': trace, 'downlink_trace': trace,
+                  'delay': 10}]:
+        sys.exit('expanded sweep into %s' % cells)
+
+
+def main():
+    test_expand()
+
+    data_dir = path.join(utils.tmp_dir, 'test_sweep')
+    if path.exists(data_dir):
+        shutil.rmtree(data_dir)
+
+    trace = path.join(context.src_dir, 'experiments', '12mbps.trace')
+    config_path = path.join(utils.tmp_dir, 'test_sweep.yml')
+    with open(config_path, 'w') as config:
+        config.write(CONFIG % {'trace': trace})
+
+    sys.argv = ['test.py', '-c', config_path, 'local', '--run-times', '2',
+                '--data-dir', data_dir]
+    args = arg_parser.parse_test()
+    if args.schemes != 'cubic vegas' or args.runtime != 10:
+        sys.exit('options in config were not applied')
+
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+    cells = sweep.expand_args(args)
+
+    expected = {
+        '12mbps': ('mm-delay 5', None),
+        '12mbps_loss0.01': (
+            'mm-delay 5 mm-loss uplink 0.01 mm-loss downlink 0.01', None),
+        '12mbps_delay20': ('mm-delay 5 mm-delay 20', None),
+        '12mbps_delay20_loss0.01': (
+            'mm-delay 5 mm-delay 20 mm-loss uplink 0.01 mm-loss downlink 0.01',
+            None),
+        '12mbps_droptail100': (
+            'mm-delay 5',
+            '--uplink-queue=droptail --uplink-queue-args=packets=100 '
+            '--downlink-queue=droptail --downlink-queue-args=packets=100'),
+        '12mbps_codel_target5-interval100': (
+            'mm-delay 5',
+            '--uplink-queue=codel --uplink-queue-args=target=5,interval=100 '
+            '--downlink-queue=codel '
+            '--downlink-queue-args=target=5,interval=100')}
+
+    names = [path.basename(cell_args.data_dir) for cell_args in cells]
+    if sorted(names) != sorted(expected.keys()):
+        sys.exit('sweep expanded into cells %s' % names)
+
+    tests = []
+    for cell_args in cells:
+        name = path.basename(cell_args.data_dir)
+        if ((cell_args.prepend_mm_cmds, cell_args.extra_mm_link_args) !=
+                expected[name]):
+            sys.exit('cell %s ran in "%s %s"' % (
+                name, cell_args.prepend_mm_cmds,
+                cell_args.extra_mm_link_args))
+
+        tests += test.campaign_tests(cell_args, ['cubic', 'vegas'], '', None)
+
+        # every cell has metadata for the analysis tools
+        meta = utils.load_test_metadata(
+            path.join(cell_args.data_dir, 'pantheon_metadata.json'))
+        if meta['sweep_cell'] != name or meta['run_times'] != 2:
+            sys.exit('metadata of cell %s is wrong' % name)
+
+    if len(tests) != len(expected) * 2 * 2:
+        sys.exit('%d tests to run instead of %d'
+                 % (len(tests), len(expected) * 4))
+
+    if sweep.load_cells(data_dir) != [cell_args.data_dir
+                                      for cell_args in cells]:
+        sys.exit('cells were not saved in %s' % sweep.SWEEP_NAME)
+
+    with open(path.join(data_dir, sweep.SWEEP_NAME)) as sweep_file:
+        if len(json.load(sweep_file)['cells']) != len(expected):
+            sys.exit('%s differed' % sweep.SWEEP_NAME)
+
+    shutil.rmtree(data_dir)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+
+import context
+from helpers import utils, timeline
+sys.path.append(path.join(context.src_dir, 'experiments'))
+import post_processor
+
+
+def record_spans(run_timeline, cc):
+    for run_id in xrange(1, 51):
+        with run_timeline.span('setup', cc=cc, run_id=run_id):
+            pass
+
+
+def test_spans(data_dir):
+    # processes appending to the same timeline at once
+    run_timeline = timeline.Timeline(data_dir)
+    procs = [multiprocessing.Process(target=record_spans,
+                                     args=(run_timeline, cc))
+             for cc in ['cubic', 'bbr', 'vegas']]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+    # a span that failed is recorded as such
+    try:
+        with run_timeline.span('run', cc='cubic', run_id=1):
+            time.sleep(0.2)
+            raise IOError('failed run')
+    except IOError:
+        pass
+    else:
+        sys.exit('span swallowed the exception in it')
+
+    # a line cut short by a crash
+    with open(run_timeline.path, 'a') as timeline_log:
+        timeline_log.write('{"phase": "run", "start"')
+
+    spans = run_timeline.spans()
+    if len(spans) != 151:
+        sys.exit('%d spans in the timeline instead of 151' % len(spans))
+    if len(set(span['pid'] for span in spans)) != 4:
+        sys.exit('spans were not recorded with their processes')
+
+    run = spans[-1]
+    if run['args'] != {'cc': 'cubic', 'run_id': 1, 'error': 'IOError'}:
+        sys.exit('failed span was recorded with %s' % run['args'])
+    if not 0.2 <= run['end'] - run['start'] < 1:
+        sys.exit('span lasted %.2f seconds instead of 0.2'
+                 % (run['end'] - run['start']))
+
+    return run_timeline
+
+
+def test_export(run_timeline):
+    run_timeline.export()
+
+    with open(run_timeline.trace_path) as trace_file:
+        trace = json.load(trace_file)
+
+    events = trace['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X']
+    threads = [e for e in events if e['ph'] == 'M']
+    if len(spans) != 151 or len(threads) != 4:
+        sys.exit('exported %d spans on %d threads instead of 151 on 4'
+                 % (len(spans), len(threads)))
+    if min(e['ts'] for e in spans) != 0 or min(e['dur'] for e in spans) < 0:
+        sys.exit('exported spans out of the timeline')
+    if max(e['dur'] for e in spans) < 200000:
+        sys.exit('exported durations are not in microseconds')
+
+    with open(run_timeline.summary_path) as summary_file:
+        summary = summary_file.readlines()
+    phases = [line.split()[:2] for line in summary[2:]]
+    if phases != [['run', '1'], ['setup', '150']]:
+        sys.exit('summarized phases as %s' % phases)
+
+
+class FakeTest(object):
+    # stand-in for the phases of Test that need mahimahi, sleeping in the
+    # congestion control phase
+    def setup(self):
+        time.sleep(0.1)
+
+    def run_congestion_control(self):
+        with self.span('tunnels'):
+            time.sleep(0.1)
+        self.record_span('flow', time.time(), time.time() + 0.3, tun_id=1)
+        return True
+
+    def record_time_stats(self):
+        pass
+
+
+def test_run(data_dir):
+    # spans of a run of Test, nested in the span of the run
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+    run_timeline = timeline.Timeline(data_dir)
+    run_timeline.clear()
+
+    test_cls = type('FakeTest', (FakeTest, test.Test), {})
+    args = argparse.Namespace(
+        mode='local', data_dir=data_dir, flows=1, runtime=1, interval=0,
+        run_times=1, fused_merge=False, no_merged_logs=False,
+        uplink_trace=None, downlink_trace=None, prepend_mm_cmds=None,
+        append_mm_cmds=None, extra_mm_link_args=None)
+    test_cls(args, 2, 'cubic', timeline=run_timeline).run()
+
+    spans = dict((span['phase'], span) for span in run_timeline.spans())
+    if sorted(spans) != ['flow', 'run', 'setup', 'tunnels']:
+        sys.exit('run recorded the phases %s' % sorted(spans))
+
+    for phase, span in spans.iteritems():
+        if (span['args']['cc'], span['args']['run_id']) != ('cubic', 2):
+            sys.exit('%s span was recorded with %s' % (phase, span['args']))
+        if phase != 'run' and (span['start'] < spans['run']['start'] or
+                               span['start'] > spans['run']['end']):
+            sys.exit('%s span is outside of the run' % phase)
+
+    # post-processing in worker processes is timed in the same timeline
+    run_timeline.clear()
+    pipeline = post_processor.PostProcessor(1, None, run_timeline)
+    pipeline.submit('cubic run 2', [], [], {'cc': 'cubic', 'run_id': 2})
+    pipeline.finish()
+
+    spans = run_timeline.spans()
+    if sorted(span['phase'] for span in spans) != [
+            'post-process analysis', 'post-process merge']:
+        sys.exit('post-processing recorded %s' % spans)
+    if spans[0]['pid'] == os.getpid() or spans[0]['args']['run_id'] != 2:
+        sys.exit('post-processing was not timed in its worker process')
+
+
+def main():
+    data_dir = path.join(utils.tmp_dir, 'test_timeline')
+    if path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir)
+
+    run_timeline = test_spans(data_dir)
+    test_export(run_timeline)
+    test_run(data_dir)
+
+    shutil.rmtree(data_dir)
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import random
+import numpy as np
+
+import context
+from helpers import utils, tunnel_log, parse_cache, compression
+from helpers.subprocess_wrappers import check_call
+sys.path.append(path.join(context.src_dir, 'analysis'))
+import tunnel_graph
+
+
+def generate_tunnel_log(log_path, flows):
+    # generate a random log in the format of merge_tunnel_logs.py; flows == 0
+    # means a log without flow IDs, e.g., a log of mm-link or a single tunnel
+    random.seed(flows)
+
+    with open(log_path, 'w') as log:
+        log.write('# init timestamp: 1500000000000.000\n')
+        log.write('# base timestamp: 0\n')
+
+        ts = 0.0
+        for _ in xrange(50000):
+            ts += random.choice([0, 0.5, 1.25, 3])
+            flow_str = ''
+            if flows > 0:
+                flow_str = ' %d' % random.randint(1, flows)
+
+            event = random.random()
+            if event < 0.3:
+                log.write('%.3f # %d\n' % (ts, random.choice([1500, 1504])))
+            elif event < 0.65:
+                log.write('%.3f + %d%s\n' % (ts, random.randint(40, 1500),
+                                             flow_str))
+            else:
+                log.write('%.3f - %d %.3f%s\n' % (
+                    ts, random.randint(40, 1500), random.uniform(0, 200),
+                    flow_str))
+
+
+def parse_by_line(graph):
+    # reference implementation of TunnelGraph.parse_tunnel_log() that parses
+    # the log line by line into the attributes of graph
+    tunlog = compression.open_file(graph.tunnel_log)
+
+    graph.flows = {}
+    first_ts = None
+    capacities = {}
+
+    arrivals = {}
+    departures = {}
+    graph.delays_t = {}
+    graph.delays = {}
+
+    first_capacity = None
+    last_capacity = None
+    first_arrival = {}
+    last_arrival = {}
+    first_departure = {}
+    last_departure = {}
+
+    total_first_departure = None
+    total_last_departure = None
+    total_arrivals = 0
+    total_departures = 0
+
+    while True:
+        line = tunlog.readline()
+        if not line:
+            break
+
+        if line.startswith('#'):
+            continue
+
+        items = line.split()
+        ts = float(items[0])
+        event_type = items[1]
+        num_bits = int(items[2]) * 8
+
+        if first_ts is None:
+            first_ts = ts
+
+        bin_id = graph.ms_to_bin(ts, first_ts)
+
+        if event_type == '#':
+            capacities[bin_id] = capacities.get(bin_id, 0) + num_bits
+
+            if first_capacity is None:
+                first_capacity = ts
+
+            if last_capacity is None or ts > last_capacity:
+                last_capacity = ts
+        elif event_type == '+':
+            if len(items) == 4:
+                flow_id = int(items[-1])
+            else:
+                flow_id = 0
+
+            graph.flows[flow_id] = True
+
+            if flow_id not in arrivals:
+                arrivals[flow_id] = {}
+                first_arrival[flow_id] = ts
+
+            if flow_id not in last_arrival:
+                last_arrival[flow_id] = ts
+            else:
+                if ts > last_arrival[flow_id]:
+                    last_arrival[flow_id] = ts
+
+            old_value = arrivals[flow_id].get(bin_id, 0)
+            arrivals[flow_id][bin_id] = old_value + num_bits
+
+            total_arrivals += num_bits
+        elif event_type == '-':
+            if len(items) == 5:
+                flow_id = int(items[-1])
+            else:
+                flow_id = 0
+
+            graph.flows[flow_id] = True
+
+            if flow_id not in departures:
+                departures[flow_id] = {}
+                first_departure[flow_id] = ts
+
+            if flow_id not in last_departure:
+                last_departure[flow_id] = ts
+            else:
+                if ts > last_departure[flow_id]:
+                    last_departure[flow_id] = ts
+
+            old_value = departures[flow_id].get(bin_id, 0)
+            departures[flow_id][bin_id] = old_value + num_bits
+
+            total_departures += num_bits
+
+            # update total variables
+            if total_first_departure is None:
+                total_first_departure = ts
+            if (total_last_departure is None or
+                    ts > total_last_departure):
+                total_last_departure = ts
+
+            # store delays in a list for each flow and sort later
+            delay = float(items[3])
+            if flow_id not in graph.delays:
+                graph.delays[flow_id] = []
+                graph.delays_t[flow_id] = []
+            graph.delays[flow_id].append(delay)
+            graph.delays_t[flow_id].append((ts - first_ts) / 1000.0)
+
+    tunlog.close()
+
+    us_per_bin = 1000.0 * graph.ms_per_bin
+
+    graph.avg_capacity = None
+    graph.link_capacity = []
+    graph.link_capacity_t = []
+    if capacities:
+        # calculate average capacity
+        if last_capacity == first_capacity:
+            graph.avg_capacity = 0
+        else:
+            delta = 1000.0 * (last_capacity - first_capacity)
+            graph.avg_capacity = sum(capacities.values()) / delta
+
+        # transform capacities into a list
+        capacity_bins = capacities.keys()
+        for bin_id in xrange(min(capacity_bins), max(capacity_bins) + 1):
+            graph.link_capacity.append(
+                capacities.get(bin_id, 0) / us_per_bin)
+            graph.link_capacity_t.append(graph.bin_to_s(bin_id))
+
+    # calculate ingress and egress throughput for each flow
+    graph.ingress_tput = {}
+    graph.egress_tput = {}
+    graph.ingress_t = {}
+    graph.egress_t = {}
+    graph.avg_ingress = {}
+    graph.avg_egress = {}
+    graph.percentile_delay = {}
+    graph.percentile_delays = {}
+    graph.loss_rate = {}
+
+    total_delays = []
+
+    for flow_id in graph.flows:
+        graph.ingress_tput[flow_id] = []
+        graph.egress_tput[flow_id] = []
+        graph.ingress_t[flow_id] = []
+        graph.egress_t[flow_id] = []
+        graph.avg_ingress[flow_id] = 0
+        graph.avg_egress[flow_id] = 0
+
+        if flow_id in arrivals:
+            # calculate average ingress and egress throughput
+            first_arrival_ts = first_arrival[flow_id]
+            last_arrival_ts = last_arrival[flow_id]
+
+            if last_arrival_ts == first_arrival_ts:
+                graph.avg_ingress[flow_id] = 0
+            else:
+                delta = 1000.0 * (last_arrival_ts - first_arrival_ts)
+                flow_arrivals = sum(arrivals[flow_id].values())
+                graph.avg_ingress[flow_id] = flow_arrivals / delta
+
+            ingress_bins = arrivals[flow_id].keys()
+            for bin_id in xrange(min(ingress_bins), max(ingress_bins) + 1):
+                graph.ingress_tput[flow_id].append(
+                    arrivals[flow_id].get(bin_id, 0) / us_per_bin)
+                graph.ingress_t[flow_id].append(graph.bin_to_s(bin_id))
+
+        if flow_id in departures:
+            first_departure_ts = first_departure[flow_id]
+            last_departure_ts = last_departure[flow_id]
+
+            if last_departure_ts == first_departure_ts:
+                graph.avg_egress[flow_id] = 0
+            else:
+                delta = 1000.0 * (last_departure_ts - first_departure_ts)
+                flow_departures = sum(departures[flow_id].values())
+                graph.avg_egress[flow_id] = flow_departures / delta
+
+            egress_bins = departures[flow_id].keys()
+
+            graph.egress_tput[flow_id].append(0.0)
+            graph.egress_t[flow_id].append(graph.bin_to_s(min(egress_bins)))
+
+            for bin_id in xrange(min(egress_bins), max(egress_bins) + 1):
+                graph.egress_tput[flow_id].append(
+                    departures[flow_id].get(bin_id, 0) / us_per_bin)
+                graph.egress_t[flow_id].append(graph.bin_to_s(bin_id + 1))
+
+        # calculate 95th percentile per-packet one-way delay
+        graph.percentile_delay[flow_id] = None
+        graph.percentile_delays[flow_id] = {}
+        if flow_id in graph.delays:
+            graph.percentile_delay[flow_id] = np.percentile(
+                graph.delays[flow_id], 95, interpolation='nearest')
+            for q in graph.delay_percentiles:
+                graph.percentile_delays[flow_id][q] = np.percentile(
+                    graph.delays[flow_id], q, interpolation='nearest')
+            total_delays += graph.delays[flow_id]
+
+        # calculate loss rate for each flow
+        if flow_id in arrivals and flow_id in departures:
+            flow_arrivals = sum(arrivals[flow_id].values())
+            flow_departures = sum(departures[flow_id].values())
+
+            graph.loss_rate[flow_id] = None
+            if flow_arrivals > 0:
+                graph.loss_rate[flow_id] = (
+                    1 - 1.0 * flow_departures / flow_arrivals)
+
+    graph.total_loss_rate = None
+    if total_arrivals > 0:
+        graph.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
+
+    # calculate total average throughput and 95th percentile delay
+    graph.total_avg_egress = None
+    if total_last_departure == total_first_departure:
+        graph.total_duration = 0
+        graph.total_avg_egress = 0
+    else:
+        graph.total_duration = total_last_departure - total_first_departure
+        graph.total_avg_egress = total_departures / (
+            1000.0 * graph.total_duration)
+
+    graph.total_percentile_delay = None
+    graph.total_percentile_delays = {}
+    if total_delays:
+        graph.total_percentile_delay = np.percentile(
+            total_delays, 95, interpolation='nearest')
+        for q in graph.delay_percentiles:
+            graph.total_percentile_delays[q] = np.percentile(
+                total_delays, q, interpolation='nearest')
+
+
+def to_list(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+def compare(log_path, ms_per_bin):
+    bulk = tunnel_graph.TunnelGraph(log_path, ms_per_bin=ms_per_bin,
+                                    delay_percentiles=[50, 99.9])
+    bulk.parse_tunnel_log()
+
+    by_line = tunnel_graph.TunnelGraph(log_path, ms_per_bin=ms_per_bin,
+                                       delay_percentiles=[50, 99.9])
+    parse_by_line(by_line)
+
+    if bulk.get_tunnel_results() != by_line.get_tunnel_results():
+        sys.exit('tunnel results of %s differed' % log_path)
+
+    if bulk.flows.keys() != by_line.flows.keys():
+        sys.exit('flows of %s differed' % log_path)
+
+    for attr in ['link_capacity', 'link_capacity_t', 'avg_capacity']:
+        if getattr(bulk, attr) != getattr(by_line, attr):
+            sys.exit('%s of %s differed' % (attr, log_path))
+
+    for attr in ['ingress_tput', 'ingress_t', 'egress_tput', 'egress_t',
+                 'avg_ingress', 'avg_egress', 'delays', 'delays_t',
+                 'percentile_delay', 'percentile_delays', 'loss_rate']:
+        bulk_values = getattr(bulk, attr)
+        by_line_values = getattr(by_line, attr)
+
+        for flow_id in by_line.flows:
+            if (to_list(bulk_values.get(flow_id)) !=
+                    to_list(by_line_values.get(flow_id))):
+                sys.exit('%s of flow %s in %s differed'
+                         % (attr, flow_id, log_path))
+
+
+def compare_binary(log_path):
+    # convert the text log into a binary log and compare the results
+    binary_log_path = log_path + '.bin'
+    merge_tunnel_logs = path.join(
+        context.src_dir, 'experiments', 'merge_tunnel_logs.py')
+    check_call(['python', merge_tunnel_logs, 'convert',
+                '-i', log_path, '-o', binary_log_path])
+
+    if (tunnel_log.read_init_timestamp(binary_log_path) !=
+            tunnel_log.read_init_timestamp(log_path)):
+        sys.exit('init timestamp of %s differed' % binary_log_path)
+
+    text = tunnel_graph.TunnelGraph(log_path)
+    text.parse_tunnel_log()
+
+    binary = tunnel_graph.TunnelGraph(binary_log_path)
+    binary.parse_tunnel_log()
+
+    if text.get_tunnel_results() != binary.get_tunnel_results():
+        sys.exit('tunnel results of %s differed' % binary_log_path)
+
+
+def compare_compressed(log_path):
+    # compress the text log in every supported format and compare the results
+    text = tunnel_graph.TunnelGraph(log_path)
+    text.parse_tunnel_log()
+
+    for extension in ['.gz', '.zst', '.lz4']:
+        compressed_log_path = log_path + extension
+        with open(log_path) as log:
+            with compression.open_file(compressed_log_path, 'w') as output:
+                output.write(log.read())
+
+        if (tunnel_log.read_init_timestamp(compressed_log_path) !=
+                tunnel_log.read_init_timestamp(log_path)):
+            sys.exit('init timestamp of %s differed' % compressed_log_path)
+
+        compressed = tunnel_graph.TunnelGraph(compressed_log_path, jobs=2)
+        compressed.parse_tunnel_log()
+
+        if text.get_tunnel_results() != compressed.get_tunnel_results():
+            sys.exit('tunnel results of %s differed' % compressed_log_path)
+
+
+def compare_delay_sketch(log_path):
+    # delay percentiles estimated by sketches must be within their accuracy
+    percentiles = [50, 99.9]
+    exact = tunnel_graph.TunnelGraph(log_path, delay_percentiles=percentiles)
+    exact.parse_tunnel_log()
+
+    sketch = tunnel_graph.TunnelGraph(log_path, delay_sketch=True,
+                                      delay_percentiles=percentiles)
+    sketch.parse_tunnel_log()
+
+    pairs = [(exact.total_percentile_delay, sketch.total_percentile_delay)]
+    for flow_id in exact.flows:
+        pairs.append((exact.percentile_delay[flow_id],
+                      sketch.percentile_delay[flow_id]))
+
+    for q in percentiles:
+        if exact.total_percentile_delay is not None:
+            pairs.append((exact.total_percentile_delays[q],
+                          sketch.total_percentile_delays[q]))
+
+        for flow_id in exact.flows:
+            if exact.percentile_delay[flow_id] is not None:
+                pairs.append((exact.percentile_delays[flow_id][q],
+                              sketch.percentile_delays[flow_id][q]))
+
+    if exact.flows and '99.9th percentile per-packet one-way delay' not in (
+            sketch.statistics_string()):
+        sys.exit('statistics of %s lack other percentiles' % log_path)
+
+    for exact_delay, sketch_delay in pairs:
+        if abs(sketch_delay - exact_delay) > 0.01 * abs(exact_delay):
+            sys.exit('delay sketch of %s was inaccurate: %s vs %s'
+                     % (log_path, sketch_delay, exact_delay))
+
+    if exact.total_avg_egress != sketch.total_avg_egress:
+        sys.exit('throughput of %s differed with delay sketch' % log_path)
+
+
+def compare_cache(log_path):
+    # the second parse of an unchanged log must be served from the cache
+    results = []
+    for expect_hit in [False, True]:
+        graph = tunnel_graph.TunnelGraph(log_path, cache=True)
+        graph.parse_tunnel_log()
+
+        if graph.cache_hit != expect_hit:
+            sys.exit('unexpected cache hit or miss for %s' % log_path)
+        results.append(graph.get_tunnel_results())
+
+    if results[0] != results[1]:
+        sys.exit('cached tunnel results of %s differed' % log_path)
+
+    # per-packet delays are cached apart, and only loaded for delay graphs
+    cached = parse_cache.load(log_path, 'tunnel_graph', graph.cache_params())
+    if 'delays' in cached or 'delays_t' in cached:
+        sys.exit('cached the per-packet delays of %s with the results'
+                 % log_path)
+    if graph.delays or graph.delays_t:
+        sys.exit('loaded the per-packet delays of %s with no delay graph'
+                 % log_path)
+
+    delay_graph = path.join(utils.tmp_dir, 'test_tunnel_graph_delay.png')
+    parsed = tunnel_graph.TunnelGraph(log_path)
+    parsed.parse_tunnel_log()
+    graph = tunnel_graph.TunnelGraph(log_path, delay_graph=delay_graph,
+                                     cache=True)
+    graph.parse_tunnel_log()
+    if not graph.cache_hit:
+        sys.exit('parsed %s again to plot its delay graph' % log_path)
+
+    for attr in ['delays', 'delays_t']:
+        cached, expected = getattr(graph, attr), getattr(parsed, attr)
+        if sorted(cached) != sorted(expected) or not all(
+                np.allclose(cached[flow_id], expected[flow_id], rtol=1e-6)
+                for flow_id in expected):
+            sys.exit('cached %s of %s differed' % (attr, log_path))
+
+    # a different bin size must not reuse the cache
+    graph = tunnel_graph.TunnelGraph(log_path, ms_per_bin=100, cache=True)
+    graph.parse_tunnel_log()
+    if graph.cache_hit:
+        sys.exit('cache of %s was reused for a different bin size' % log_path)
+
+
+def compare_parallel(log_path):
+    # parse the log in small parts on several processes
+    serial = tunnel_graph.TunnelGraph(log_path)
+    serial.parse_tunnel_log()
+
+    chunk_size = tunnel_log.CHUNK_SIZE
+    tunnel_log.CHUNK_SIZE = path.getsize(log_path) // 3
+    try:
+        for delay_sketch in [False, True]:
+            parallel = tunnel_graph.TunnelGraph(
+                log_path, delay_sketch=delay_sketch, jobs=4)
+            parallel.parse_tunnel_log()
+
+            if delay_sketch:
+                serial = tunnel_graph.TunnelGraph(log_path, delay_sketch=True)
+                serial.parse_tunnel_log()
+
+            if serial.get_tunnel_results() != parallel.get_tunnel_results():
+                sys.exit('tunnel results of %s differed when parsed in '
+                         'parallel' % log_path)
+    finally:
+        tunnel_log.CHUNK_SIZE = chunk_size
+
+
+def main():
+    for flows in [0, 1, 3]:
+        log_path = path.join(utils.tmp_dir, 'test_tunnel_graph_%d.log' % flows)
+        generate_tunnel_log(log_path, flows)
+
+        for ms_per_bin in [500, 30]:
+            compare(log_path, ms_per_bin)
+
+        compare_binary(log_path)
+        compare_compressed(log_path)
+        compare_parallel(log_path)
+        compare_delay_sketch(log_path)
+
+        # start with no cache left from earlier runs
+        for kind in ['tunnel_graph', 'tunnel_graph_delays']:
+            cache_path = parse_cache.cache_path(log_path, kind)
+            if path.isfile(cache_path):
+                os.remove(cache_path)
+        compare_cache(log_path)
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
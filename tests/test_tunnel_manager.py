@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import imp
+import time
+import uuid
+import stat
+from subprocess import Popen, PIPE
+
+import context
+from helpers import utils
+sys.path.append(path.join(context.src_dir, 'experiments'))
+
+
+# a stand-in for mm-tunnelserver that prints the command to run the tunnel
+# client (after a delay if one is given in seconds), runs commands from its
+# stdin and then prints what it ran
+FAKE_TUNNEL = '''#!/usr/bin/env python
+import sys
+import time
+from subprocess import Popen
+
+if not sys.argv[1].startswith('--'):
+    time.sleep(float(sys.argv[1]))
+sys.stdout.write('mm-tunnelclient localhost 1234 100.64.0.2 100.64.0.1\\n')
+sys.stdout.flush()
+
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    Popen(line.split())
+    sys.stdout.write('ran %s' % line)
+    sys.stdout.flush()
+'''
+
+# a stand-in for mm-tunnelclient that connects after a second, except the
+# first time it runs with an ingress log named flaky*
+FAKE_TUNNEL_CLIENT = '''#!/usr/bin/env python
+import os
+import sys
+import time
+
+ingress_log = [arg.split('=', 1)[1] for arg in sys.argv
+               if arg.startswith('--ingress-log=')][0]
+if (os.path.basename(ingress_log).startswith('flaky') and
+        not os.path.exists(ingress_log)):
+    open(ingress_log, 'w').close()
+    time.sleep(60)
+
+time.sleep(1)
+sys.stdout.write('got connection\\n')
+sys.stdout.flush()
+sys.stdin.read()
+'''
+
+# listens on a port after a second
+LISTENER = '''import socket, sys, time
+time.sleep(1)
+s = socket.socket()
+s.bind(('127.0.0.1', int(sys.argv[1])))
+s.listen(1)
+time.sleep(10)
+'''
+
+
+def install_fake_tunnel():
+    bin_dir = path.join(utils.tmp_dir, 'test_tunnel_manager_bin')
+    utils.make_sure_dir_exists(bin_dir)
+
+    for name, script in [('mm-tunnelserver', FAKE_TUNNEL),
+                         ('mm-tunnelclient', FAKE_TUNNEL_CLIENT)]:
+        fake_tunnel = path.join(bin_dir, name)
+        with open(fake_tunnel, 'w') as f:
+            f.write(script)
+        os.chmod(fake_tunnel, os.stat(fake_tunnel).st_mode | stat.S_IEXEC)
+
+    listener = path.join(bin_dir, 'listener.py')
+    with open(listener, 'w') as f:
+        f.write(LISTENER)
+
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    return listener
+
+
+def expect(manager, expected):
+    line = manager.stdout.readline()
+    if line != expected:
+        sys.exit('tunnel manager replied %r instead of %r' % (line, expected))
+
+
+def test_protocol(tunnel_manager, listener):
+    manager = Popen(['python', tunnel_manager], stdin=PIPE, stdout=PIPE)
+    expect(manager, 'tunnel manager is running\n')
+
+    # start many slow tunnels at once and read their first lines
+    start_time = time.time()
+    flows = 20
+    for tun_id in xrange(1, flows + 1):
+        manager.stdin.write('tunnel %d mm-tunnelserver 2\n' % tun_id)
+        manager.stdin.write('tunnel %d readline 10\n' % tun_id)
+    manager.stdin.flush()
+
+    for tun_id in xrange(1, flows + 1):
+        expect(manager,
+               'mm-tunnelclient localhost 1234 100.64.0.2 100.64.0.1\n')
+
+    if time.time() - start_time > 8:
+        sys.exit('tunnels were not set up concurrently')
+
+    # a line that does not come in time is replied as an empty line
+    manager.stdin.write('tunnel %d mm-tunnelserver 60\n' % (flows + 1))
+    manager.stdin.write('tunnel %d readline 0.5\n' % (flows + 1))
+    manager.stdin.flush()
+    expect(manager, '\n')
+
+    # wait for a command inside a tunnel to listen on a port
+    port = utils.get_open_port()
+    manager.stdin.write('tunnel 1 python %s %s\n' % (listener, port))
+    manager.stdin.write('tunnel 1 readline 5\n')
+    manager.stdin.write('tunnel 1 wait %s 5\n' % port)
+    manager.stdin.write('tunnel 2 wait %s 0.5\n' % utils.get_open_port())
+    manager.stdin.write('tunnel 1 readline 0.5\n')
+    manager.stdin.write('tunnel %d readline\n' % (flows + 2))
+    manager.stdin.flush()
+    expect(manager, 'ran python %s %s\n' % (listener, port))
+    expect(manager, 'ready\n')
+    expect(manager, 'timeout\n')
+    expect(manager, '\n')
+    expect(manager, '\n')
+
+    manager.stdin.write('halt\n')
+    manager.stdin.flush()
+    manager.wait()
+
+
+def test_run_tunnels(tunnel_manager):
+    # bring up tunnels through Test.run_tunnels(), re-running the clients
+    # of two flaky tunnels that do not connect at first
+    test = imp.load_source(
+        'pantheon_test', path.join(context.src_dir, 'experiments', 'test.py'))
+    test.TUNNEL_TIMEOUT = 2
+
+    flows = 10
+    t = object.__new__(test.Test)
+    t.mode = 'local'
+    t.flows = flows
+    t.sender_side = t.server_side = 'local'
+    t.timeline = None
+    t.datalink_ingress_logs = {}
+    t.datalink_egress_logs = {}
+    t.acklink_ingress_logs = {}
+    t.acklink_egress_logs = {}
+    for tun_id in xrange(1, flows + 1):
+        prefix = 'flaky' if tun_id in [3, 7] else 'tunnel'
+        t.datalink_ingress_logs[tun_id] = path.join(
+            utils.tmp_dir, '%s_%d_%s.log' % (prefix, tun_id, uuid.uuid4()))
+        for logs in [t.datalink_egress_logs, t.acklink_ingress_logs,
+                     t.acklink_egress_logs]:
+            logs[tun_id] = path.join(utils.tmp_dir, 'unused.log')
+
+    managers = []
+    for _ in xrange(2):
+        managers.append(Popen(['python', tunnel_manager],
+                              stdin=PIPE, stdout=PIPE))
+        expect(managers[-1], 'tunnel manager is running\n')
+
+    start_time = time.time()
+    cmds_to_run_tc = t.run_tunnels(*managers)
+    if cmds_to_run_tc is None or sorted(cmds_to_run_tc) != range(1, flows + 1):
+        sys.exit('failed to run tunnels')
+
+    # flaky tunnels are re-run once after TUNNEL_TIMEOUT seconds
+    if time.time() - start_time > 2 * test.TUNNEL_TIMEOUT + 2:
+        sys.exit('tunnels were not set up concurrently')
+
+    for manager in managers:
+        manager.stdin.write('halt\n')
+        manager.stdin.flush()
+        manager.wait()
+
+    for tun_id in xrange(1, flows + 1):
+        if path.exists(t.datalink_ingress_logs[tun_id]):
+            os.remove(t.datalink_ingress_logs[tun_id])
+
+
+def main():
+    listener = install_fake_tunnel()
+    tunnel_manager = path.join(
+        context.src_dir, 'experiments', 'tunnel_manager.py')
+
+    test_protocol(tunnel_manager, listener)
+    test_run_tunnels(tunnel_manager)
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import time
+
+import context
+from helpers import utils
+from helpers.subprocess_wrappers import check_output
+from wrappers import registry
+
+
+def wrapper_names():
+    wrappers_dir = path.join(context.src_dir, 'wrappers')
+    return sorted(
+        name[:-len('.py')] for name in os.listdir(wrappers_dir)
+        if name.endswith('.py') and name not in [
+            '__init__.py', 'arg_parser.py', 'context.py', 'registry.py'])
+
+
+def main():
+    names = wrapper_names()
+
+    # every wrapper is registered and reports what is registered
+    start_time = time.time()
+    for cc in names:
+        wrapper = registry.lookup(cc)
+        if wrapper is None:
+            sys.exit('wrapper %s is not registered' % cc)
+
+        src = path.join(context.src_dir, 'wrappers', cc + '.py')
+        run_first = check_output([src, 'run_first']).strip()
+        deps = check_output([src, 'deps']).strip()
+        if (run_first, deps) != (wrapper.run_first, wrapper.deps):
+            sys.exit('wrapper %s runs %s first and depends on "%s", but is '
+                     'registered otherwise' % (cc, run_first, deps))
+    wrapper_time = time.time() - start_time
+
+    if sorted(registry.WRAPPERS) != names:
+        sys.exit('registered wrappers that do not exist: %s'
+                 % (set(registry.WRAPPERS) - set(names)))
+
+    # registered executables are in submodules (example_cc_repo aside)
+    with open(path.join(context.base_dir, '.gitmodules')) as f:
+        submodules = [line.split('=')[1].strip() for line in f
+                      if line.strip().startswith('path')]
+    for cc, wrapper in registry.WRAPPERS.iteritems():
+        for side, src in wrapper.binaries.iteritems():
+            repo = path.join('third_party', src.split('/')[0])
+            if cc != 'example' and repo not in submodules:
+                sys.exit('%s of %s is registered outside the submodules: %s'
+                         % (side, cc, src))
+
+    for cc in utils.parse_config()['schemes']:
+        if registry.lookup(cc) is None:
+            sys.exit('scheme %s in src/config.yml is not registered' % cc)
+
+    start_time = time.time()
+    for cc in names:
+        utils.who_runs_first(cc)
+    registry_time = time.time() - start_time
+    sys.stderr.write('looked up %d wrappers in %.4f seconds in the registry, '
+                     '%.2f seconds by running them\n'
+                     % (len(names), registry_time, wrapper_time))
+
+    sys.stderr.write('Passed all tests!\n')
+
+
+if __name__ == '__main__':
+    main()